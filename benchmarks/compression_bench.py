@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of the response compression
+
+Run with:
+  python -m benchmarks.compression_bench [customers] [megabits per second]
+
+Compresses the body of a GET /customers list of that many Customers with
+each encoding and level, and prints the size, the CPU time per response
+and the time to send it over a link of that speed, with the time to
+compress added, next to sending it as it is.
+"""
+import sys
+import json
+import timeit
+from service import compression
+from service.compression import Compressor
+from .endpoint_bench import customer
+
+LEVELS = [('gzip', 1), ('gzip', 6), ('gzip', 9), ('br', 1), ('br', 4), ('br', 9)]
+
+
+def body(customers):
+    """ Returns the JSON of a list of customers, like GET /customers """
+    docs = [dict(customer(number), _id='{:032x}'.format(number)) for number in range(customers)]
+    return json.dumps(docs)
+
+
+def compress(data, encoding, level):
+    """ Returns data compressed in one piece """
+    compressor = Compressor(level=level, brotli_quality=level)
+    stream = compressor.stream(encoding)
+    return stream.process(data) + stream.finish()
+
+
+def run(customers=1000, megabits=10.0, repeat=5):
+    """ Times each encoding and level, returns a list of results """
+    data = body(customers)
+    bytes_per_second = megabits * 1000000 / 8
+    results = [{'encoding': 'identity', 'level': None, 'bytes': len(data), 'ratio': 1.0,
+                'cpu_ms': 0.0, 'transfer_ms': len(data) / bytes_per_second * 1000}]
+    for encoding, level in LEVELS:
+        if encoding == 'br' and compression.brotli is None:
+            continue
+        compressed = compress(data, encoding, level)
+        number = max(1, 20 // (level or 1))
+        seconds = min(timeit.repeat(lambda: compress(data, encoding, level),
+                                    number=number, repeat=repeat)) / number
+        results.append({'encoding': encoding, 'level': level, 'bytes': len(compressed),
+                        'ratio': float(len(data)) / len(compressed), 'cpu_ms': seconds * 1000,
+                        'transfer_ms': (seconds + len(compressed) / bytes_per_second) * 1000})
+    return results
+
+
+if __name__ == '__main__':
+    CUSTOMERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    MEGABITS = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    for result in run(CUSTOMERS, MEGABITS):
+        print('{encoding:<8} {level!s:>4} {bytes:>10,} bytes {ratio:>5.1f}x  '
+              'cpu {cpu_ms:>7.2f} ms  sent in {transfer_ms:>8.1f} ms'.format(**result))
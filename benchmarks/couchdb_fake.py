@@ -0,0 +1,727 @@
+"""
+In-process CouchDB stand-in
+
+FakeCouchDB - a local HTTP server with the part of the CouchDB API that
+              the Cloudant backend uses, kept in memory, so tests and
+              benchmarks can run the real client code without a database
+
+    couch = FakeCouchDB(latency=0.01).start()
+    os.environ['BINDING_CLOUDANT'] = json.dumps(couch.credentials())
+    couch.inject(429)       # the next request is rate limited
+    ...
+    couch.stop()
+
+It serves _session (any credentials are accepted), database create,
+exists, info and delete, document CRUD, _all_docs, _find, _index,
+_bulk_docs and _changes, with the status codes and error bodies of
+CouchDB 2. Selectors support the common Mango operators; indexes are
+kept as design documents but every query scans the database.
+
+Every answer can be delayed, and requests can fail with 429 or 5xx
+statuses, queued one by one or at a random rate, so the resilience and
+the concurrency of the service can be measured without a network.
+
+Run it on the port of CouchDB to run the tests against it:
+  python -m benchmarks.couchdb_fake --port 5984 [--latency 0.005]
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import bisect
+import socket
+import threading
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl
+    from urllib import unquote
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, unquote
+
+
+class CouchError(Exception):
+    """ An error answered with its status and a CouchDB error body """
+
+    def __init__(self, status, error, reason):
+        super(CouchError, self).__init__(reason)
+        self.status = status
+        self.body = {'error': error, 'reason': reason}
+
+
+# the CouchDB error of each status a fault can answer with
+FAULT_ERRORS = {
+    429: 'too_many_requests',
+    500: 'internal_server_error',
+    502: 'bad_gateway',
+    503: 'service_unavailable',
+    504: 'gateway_timeout',
+}
+
+
+def not_found(reason='missing'):
+    """ Returns the error of a missing database or document """
+    return CouchError(404, 'not_found', reason)
+
+
+def conflict():
+    """ Returns the error of a write to a stale revision """
+    return CouchError(409, 'conflict', 'Document update conflict.')
+
+
+def next_rev(rev):
+    """ Returns a new revision that follows rev """
+    generation = int(rev.split('-', 1)[0]) if rev else 0
+    return '{}-{}'.format(generation + 1, uuid.uuid4().hex)
+
+######################################################################
+#  M A N G O   S E L E C T O R S
+######################################################################
+
+
+def lookup(doc, field):
+    """ Returns (present, value) of a field, which may be a dotted path """
+    value = doc
+    for name in field.split('.'):
+        if not isinstance(value, dict) or name not in value:
+            return False, None
+        value = value[name]
+    return True, value
+
+
+def compare(test, present, value, argument):
+    """ Applies an ordering test, False for missing or unordered values """
+    try:
+        return present and test(value, argument)
+    except TypeError:
+        return False
+
+
+CONDITIONS = {
+    '$eq': lambda present, value, arg: present and value == arg,
+    '$ne': lambda present, value, arg: not present or value != arg,
+    '$gt': lambda present, value, arg: compare(lambda a, b: a > b, present, value, arg),
+    '$gte': lambda present, value, arg: compare(lambda a, b: a >= b, present, value, arg),
+    '$lt': lambda present, value, arg: compare(lambda a, b: a < b, present, value, arg),
+    '$lte': lambda present, value, arg: compare(lambda a, b: a <= b, present, value, arg),
+    '$in': lambda present, value, arg: present and value in arg,
+    '$nin': lambda present, value, arg: present and value not in arg,
+    '$exists': lambda present, value, arg: present == arg,
+    '$regex': lambda present, value, arg: compare(
+        lambda a, b: re.search(b, a) is not None, present, value, arg),
+    '$not': lambda present, value, arg: not condition(arg, present, value),
+}
+
+
+def condition(argument, present, value):
+    """ Checks a field against the argument of a selector """
+    if isinstance(argument, dict) and argument and all(key.startswith('$') for key in argument):
+        for operator, operand in argument.items():
+            if operator not in CONDITIONS:
+                raise CouchError(400, 'invalid_operator',
+                                 'Invalid operator: {}'.format(operator))
+            if not CONDITIONS[operator](present, value, operand):
+                return False
+        return True
+    return present and value == argument
+
+
+def matches(selector, doc):
+    """ Checks a document against a Mango selector """
+    for key, argument in selector.items():
+        if key == '$and':
+            if not all(matches(part, doc) for part in argument):
+                return False
+        elif key == '$or':
+            if not any(matches(part, doc) for part in argument):
+                return False
+        elif key == '$nor':
+            if any(matches(part, doc) for part in argument):
+                return False
+        elif key == '$not':
+            if matches(argument, doc):
+                return False
+        else:
+            present, value = lookup(doc, key)
+            if not condition(argument, present, value):
+                return False
+    return True
+
+
+def project(doc, fields):
+    """ Returns the given top-level fields of a document """
+    if not fields:
+        return doc
+    return dict((field, doc[field]) for field in fields if field in doc)
+
+######################################################################
+#  D A T A B A S E
+######################################################################
+
+
+class Database(object):
+    """ The documents and the change history of one database """
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = {}
+        self.ids = []           # the ids of the live documents, in order
+        self.tombstones = {}    # the last revision of deleted documents
+        self.changes = []       # (seq, id, rev, deleted), one per write
+
+    @property
+    def seq(self):
+        """ The number of the last change """
+        return len(self.changes)
+
+    def info(self):
+        """ Returns the database information """
+        return {'db_name': self.name, 'doc_count': len(self.docs),
+                'doc_del_count': len(self.tombstones),
+                'update_seq': '{}-fake'.format(self.seq), 'instance_start_time': '0'}
+
+    def get(self, doc_id):
+        """ Returns a live document """
+        if doc_id in self.docs:
+            return self.docs[doc_id]
+        raise not_found('deleted' if doc_id in self.tombstones else 'missing')
+
+    def save(self, doc, rev=None):
+        """ Writes a document, or deletes it if it has _deleted """
+        doc = dict(doc)
+        doc_id = doc.get('_id') or uuid.uuid4().hex
+        rev = doc.get('_rev', rev)
+        current = self.docs.get(doc_id)
+        if current is not None:
+            if rev != current['_rev']:
+                raise conflict()
+        elif doc.get('_deleted'):
+            raise not_found('deleted' if doc_id in self.tombstones else 'missing')
+        elif rev is not None and rev != self.tombstones.get(doc_id):
+            raise conflict()
+        new_rev = next_rev(rev or self.tombstones.get(doc_id))
+        if doc.get('_deleted'):
+            del self.docs[doc_id]
+            del self.ids[bisect.bisect_left(self.ids, doc_id)]
+            self.tombstones[doc_id] = new_rev
+        else:
+            doc['_id'], doc['_rev'] = doc_id, new_rev
+            if current is None:
+                bisect.insort(self.ids, doc_id)
+                self.tombstones.pop(doc_id, None)
+            self.docs[doc_id] = doc
+        self.changes.append((self.seq + 1, doc_id, new_rev, bool(doc.get('_deleted'))))
+        return {'ok': True, 'id': doc_id, 'rev': new_rev}
+
+    def all_docs(self, params, keys=None):
+        """ Returns the _all_docs rows for the query parameters """
+        include_docs = params.get('include_docs') is True
+        if keys is not None:
+            rows = [self._row(key, include_docs) for key in keys]
+        else:
+            ids = self.ids
+            if params.get('descending') is True:
+                ids = ids[::-1]
+            start = params.get('startkey', params.get('start_key'))
+            end = params.get('endkey', params.get('end_key'))
+            inclusive = params.get('inclusive_end', True) is not False
+            if params.get('descending') is True:
+                selected = [doc_id for doc_id in ids
+                            if (start is None or doc_id <= start) and
+                            (end is None or doc_id > end or inclusive and doc_id == end)]
+            else:
+                begin = 0 if start is None else bisect.bisect_left(ids, start)
+                finish = len(ids) if end is None else \
+                    (bisect.bisect_right if inclusive else bisect.bisect_left)(ids, end)
+                selected = ids[begin:finish]
+            skip = int(params.get('skip', 0))
+            limit = params.get('limit')
+            selected = selected[skip:] if limit is None else selected[skip:skip + int(limit)]
+            rows = [self._row(doc_id, include_docs) for doc_id in selected]
+        return {'total_rows': len(self.docs), 'offset': 0, 'rows': rows}
+
+    def _row(self, doc_id, include_docs):
+        """ Returns the _all_docs row of an id """
+        if doc_id in self.docs:
+            row = {'id': doc_id, 'key': doc_id, 'value': {'rev': self.docs[doc_id]['_rev']}}
+            if include_docs:
+                row['doc'] = self.docs[doc_id]
+            return row
+        if doc_id in self.tombstones:
+            row = {'id': doc_id, 'key': doc_id,
+                   'value': {'rev': self.tombstones[doc_id], 'deleted': True}}
+            if include_docs:
+                row['doc'] = None
+            return row
+        return {'key': doc_id, 'error': 'not_found'}
+
+    def find(self, query):
+        """ Returns the result of a _find query """
+        selector = query.get('selector')
+        if not isinstance(selector, dict):
+            raise CouchError(400, 'bad_request', 'selector must be a JSON object')
+        skip = int(query.get('skip', 0))
+        if query.get('bookmark') and query['bookmark'] != 'nil':
+            try:
+                skip = json.loads(base64.b64decode(query['bookmark']).decode('utf-8'))['skip']
+            except (TypeError, ValueError, KeyError):
+                raise CouchError(400, 'invalid_bookmark',
+                                 'Invalid bookmark value: {}'.format(query['bookmark']))
+        limit = int(query.get('limit', 25))
+        docs = [self.docs[doc_id] for doc_id in self.ids
+                if not doc_id.startswith('_design/') and matches(selector, self.docs[doc_id])]
+        for sort in reversed(query.get('sort') or []):
+            field, direction = list(sort.items())[0] if isinstance(sort, dict) else (sort, 'asc')
+            docs = [doc for doc in docs if lookup(doc, field)[0]]
+            docs.sort(key=lambda doc, field=field: lookup(doc, field)[1],
+                      reverse=direction == 'desc')
+        page = docs[skip:skip + limit]
+        bookmark = base64.b64encode(json.dumps({'skip': skip + len(page)}).encode('utf-8'))
+        return {'docs': [project(doc, query.get('fields')) for doc in page],
+                'bookmark': bookmark.decode('ascii')}
+
+    def indexes(self):
+        """ Returns the _index listing of the query indexes """
+        indexes = [{'ddoc': None, 'name': '_all_docs', 'type': 'special',
+                    'def': {'fields': [{'_id': 'asc'}]}}]
+        for doc_id in self.ids:
+            if not doc_id.startswith('_design/'):
+                continue
+            if self.docs[doc_id].get('language') != 'query':
+                continue
+            for name, view in sorted(self.docs[doc_id].get('views', {}).items()):
+                fields = [{field: direction}
+                          for field, direction in view['map']['fields'].items()]
+                indexes.append({'ddoc': doc_id, 'name': name, 'type': 'json',
+                                'def': {'fields': fields}})
+        return {'total_rows': len(indexes), 'indexes': indexes}
+
+    def create_index(self, request):
+        """ Stores a query index as a design document """
+        fields = request.get('index', {}).get('fields')
+        if not fields:
+            raise CouchError(400, 'missing_required_key', 'Missing required key: fields')
+        fields = [field if isinstance(field, dict) else {field: 'asc'} for field in fields]
+        ddoc = request.get('ddoc') or uuid.uuid4().hex
+        ddoc_id = ddoc if ddoc.startswith('_design/') else '_design/' + ddoc
+        name = request.get('name') or uuid.uuid4().hex
+        design = dict(self.docs.get(ddoc_id, {'_id': ddoc_id, 'language': 'query', 'views': {}}))
+        if name in design.get('views', {}):
+            return {'result': 'exists', 'id': ddoc_id, 'name': name}
+        design['views'] = dict(design.get('views', {}), **{name: {
+            'map': {'fields': dict(list(field.items())[0] for field in fields)},
+            'reduce': '_count',
+            'options': {'def': {'fields': fields}}}})
+        self.save(design)
+        return {'result': 'created', 'id': ddoc_id, 'name': name}
+
+    def changes_since(self, since, include_docs=False):
+        """ Returns the change rows after a seq, each document once """
+        latest = {}
+        for seq, doc_id, rev, deleted in self.changes[since:]:
+            latest[doc_id] = (seq, rev, deleted)
+        return [self._change(seq, doc_id, rev, deleted, include_docs)
+                for doc_id, (seq, rev, deleted) in sorted(latest.items(), key=lambda i: i[1][0])]
+
+    def _change(self, seq, doc_id, rev, deleted, include_docs=False):
+        """ Returns a _changes row """
+        change = {'seq': '{}-fake'.format(seq), 'id': doc_id, 'changes': [{'rev': rev}]}
+        if deleted:
+            change['deleted'] = True
+        if include_docs:
+            change['doc'] = self.docs[doc_id] if not deleted else \
+                {'_id': doc_id, '_rev': rev, '_deleted': True}
+        return change
+
+######################################################################
+#  S E R V E R
+######################################################################
+
+
+def seq_number(since, database):
+    """ Returns the change number of a since parameter """
+    if since in (None, '', 0, '0'):
+        return 0
+    if since == 'now':
+        return database.seq
+    try:
+        return int(str(since).split('-', 1)[0])
+    except ValueError:
+        raise CouchError(400, 'bad_request', 'Malformed sequence supplied in \'since\' parameter.')
+
+
+def query_params(query):
+    """ Decodes the JSON values of the query string """
+    params = {}
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+class FakeCouchDB(object):
+    """ An in-memory CouchDB served over HTTP on a local port """
+
+    def __init__(self, host='127.0.0.1', port=0, username='admin', password='pass',
+                 latency=0, fault_rate=0, fault_statuses=(429, 500, 503),
+                 sample=random.random):
+        """ Initialize the server
+
+        Args:
+            host (string): the address to listen on
+            port (int): the port to listen on, 0 picks a free one
+            username (string): the user in the credentials
+            password (string): the password in the credentials
+            latency (float): seconds every answer is delayed by
+            fault_rate (float): fraction of the requests that fail
+            fault_statuses (tuple): the statuses the random faults pick from
+            sample (callable): returns a random number in [0, 1)
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.fault_rate = fault_rate
+        self.fault_statuses = fault_statuses
+        self._sample = sample
+        self.faults = []
+        self.requests = 0
+        self.databases = {}
+        self.condition = threading.Condition()
+        self.stopping = False
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """ The URL of the server """
+        return 'http://{}:{}/'.format(self.host, self.port)
+
+    def credentials(self):
+        """ Returns the credentials of the server for BINDING_CLOUDANT """
+        return {'username': self.username, 'password': self.password,
+                'host': self.host, 'port': self.port, 'url': self.url}
+
+    def start(self):
+        """ Starts serving in a background thread and returns self """
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.couch = self
+        self.port = self._server.server_address[1]
+        self.stopping = False
+        self._thread = threading.Thread(target=self._server.serve_forever, name='couchdb-fake')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Ends the open _changes feeds and stops serving """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def inject(self, status, count=1, applied=False):
+        """ Makes the next requests fail
+
+        Args:
+            status (int): the status they answer with, like 429 or 503
+            count (int): the number of requests that fail
+            applied (bool): True when the request is carried out before
+                the failure is answered, like a write whose answer is lost
+        """
+        with self.condition:
+            self.faults.extend([(status, applied)] * count)
+
+    def fault(self, parts):
+        """ Counts a request and returns its (status, applied) fault, or None
+
+        Logins never fail, so a client can always connect.
+        """
+        if parts and parts[0] == '_session':
+            return None
+        with self.condition:
+            self.requests += 1
+            if self.faults:
+                return self.faults.pop(0)
+        if self.fault_rate and self._sample() < self.fault_rate:
+            return random.choice(self.fault_statuses), False
+        return None
+
+    def database(self, name):
+        """ Returns an existing database """
+        if name not in self.databases:
+            raise not_found('Database does not exist.')
+        return self.databases[name]
+
+    def seed(self, dbname, docs):
+        """ Writes documents straight into a database, creating it if needed """
+        with self.condition:
+            database = self.databases.setdefault(dbname, Database(dbname))
+            results = [database.save(doc) for doc in docs]
+            self.condition.notify_all()
+        return results
+
+######################################################################
+#  R O U T E S
+######################################################################
+
+    def handle(self, method, parts, params, body):
+        """ Returns (status, result) for a request
+
+        The result is a JSON value, or a generator of the lines of a
+        continuous _changes feed.
+        """
+        if not parts:
+            return 200, {'couchdb': 'Welcome', 'version': '2.3.1', 'vendor': {'name': 'fake'}}
+        if parts[0] == '_session':
+            return 200, {'ok': True, 'name': self.username, 'roles': ['_admin'],
+                         'userCtx': {'name': self.username, 'roles': ['_admin']}}
+        if parts[0] == '_all_dbs':
+            return 200, sorted(self.databases)
+        if parts[0].startswith('_'):
+            raise CouchError(400, 'illegal_database_name', 'Name: {}'.format(parts[0]))
+        if len(parts) == 1:
+            return self.handle_database(method, parts[0], body)
+        if parts[1] == '_changes':
+            return self.changes(parts[0], params)
+        with self.condition:
+            status, result = self.handle_documents(method, parts, params, body)
+            if method != 'GET':
+                self.condition.notify_all()
+        return status, result
+
+    def handle_database(self, method, name, body):
+        """ Creates, checks, describes, writes to or deletes a database """
+        with self.condition:
+            if method == 'PUT':
+                if name in self.databases:
+                    raise CouchError(412, 'file_exists', 'The database could not be '
+                                     'created, the file already exists.')
+                self.databases[name] = Database(name)
+                return 201, {'ok': True}
+            if method == 'DELETE':
+                self.database(name)
+                del self.databases[name]
+                self.condition.notify_all()
+                return 200, {'ok': True}
+            if method == 'POST':
+                result = self.database(name).save(body)
+                self.condition.notify_all()
+                return 201, result
+            return 200, self.database(name).info()
+
+    def handle_documents(self, method, parts, params, body):
+        """ Serves the endpoints and the documents of a database """
+        database = self.database(parts[0])
+        endpoint = parts[1]
+        if endpoint == '_all_docs':
+            keys = body.get('keys') if method == 'POST' else params.get('keys')
+            return 200, database.all_docs(params, keys)
+        if endpoint == '_find' and method == 'POST':
+            return 200, database.find(body)
+        if endpoint == '_index':
+            if method == 'POST':
+                return 200, database.create_index(body)
+            return 200, database.indexes()
+        if endpoint == '_bulk_docs' and method == 'POST':
+            results = []
+            for doc in body.get('docs', []):
+                try:
+                    results.append(database.save(doc))
+                except CouchError as error:
+                    results.append(dict(error.body, id=doc.get('_id')))
+            return 201, results
+        if endpoint.startswith('_') and endpoint != '_design':
+            raise CouchError(400, 'bad_request', 'Unsupported endpoint {}'.format(endpoint))
+        doc_id = '/'.join(parts[1:3]) if endpoint == '_design' else endpoint
+        if method == 'GET':
+            return 200, database.get(doc_id)
+        if method == 'PUT':
+            return 201, database.save(dict(body, _id=doc_id), params.get('rev'))
+        if method == 'DELETE':
+            if doc_id not in database.docs:
+                database.get(doc_id)
+            return 200, database.save({'_id': doc_id, '_deleted': True}, params.get('rev'))
+        raise CouchError(405, 'method_not_allowed', 'Only GET,PUT,DELETE allowed')
+
+    def changes(self, dbname, params):
+        """ Serves the _changes feed of a database """
+        with self.condition:
+            since = seq_number(params.get('since'), self.database(dbname))
+        feed = params.get('feed', 'normal')
+        if feed == 'continuous':
+            return 200, self._continuous(dbname, since, params)
+        with self.condition:
+            database = self.database(dbname)
+            if feed == 'longpoll' and database.seq <= since:
+                self.condition.wait(float(params.get('timeout', 60000)) / 1000)
+                database = self.database(dbname)
+            results = database.changes_since(since, params.get('include_docs') is True)
+            return 200, {'results': results, 'last_seq': '{}-fake'.format(database.seq),
+                         'pending': 0}
+
+    def _continuous(self, dbname, since, params):
+        """ Generator of the lines of a continuous feed, empty ones are heartbeats """
+        heartbeat = params.get('heartbeat')
+        wait = float(heartbeat) / 1000 if heartbeat not in (None, True) else 60
+        timeout = params.get('timeout')
+        while True:
+            with self.condition:
+                if self.stopping or dbname not in self.databases:
+                    break
+                database = self.databases[dbname]
+                if database.seq <= since:
+                    self.condition.wait(wait)
+                    if self.stopping or dbname not in self.databases:
+                        break
+                    database = self.databases[dbname]
+                changes = database.changes_since(since, params.get('include_docs') is True)
+                since = database.seq
+            if changes:
+                for change in changes:
+                    yield json.dumps(change)
+            elif timeout is not None:
+                break
+            elif heartbeat is not None:
+                yield ''
+        yield json.dumps({'last_seq': '{}-fake'.format(since)})
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """ Serves each connection in its own thread """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # a client that hung up, like a stopped _changes follower, is not an error
+        if not issubclass(sys.exc_info()[0], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ Passes requests to the FakeCouchDB of the server """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_HEAD(self):
+        self.dispatch('HEAD')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        """ Decodes the request, answers it, and streams a feed """
+        # not urlsplit, which reads a path starting with // as a host
+        path, _, query = self.path.partition('?')
+        parts = [unquote(part) for part in path.split('/') if part]
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        couch = self.server.couch
+        if couch.latency:
+            time.sleep(couch.latency)
+        fault = couch.fault(parts)
+        try:
+            body = self.decode(raw)
+            if fault is None or fault[1]:
+                status, result = couch.handle('GET' if method == 'HEAD' else method,
+                                              parts, query_params(query), body)
+        except CouchError as error:
+            status, result = error.status, error.body
+        if fault is not None:
+            status = fault[0]
+            result = {'error': FAULT_ERRORS.get(status, 'unknown_error'),
+                      'reason': 'Injected fault'}
+        if hasattr(result, 'next') or hasattr(result, '__next__'):
+            self.stream(result)
+        else:
+            self.reply(status, result, method == 'HEAD')
+
+    def decode(self, raw):
+        """ Returns the JSON or form body of a request """
+        if not raw:
+            return {}
+        if 'json' not in (self.headers.get('Content-Type') or 'application/json'):
+            return dict(parse_qsl(raw.decode('utf-8')))
+        try:
+            return json.loads(raw.decode('utf-8'))
+        except ValueError:
+            raise CouchError(400, 'bad_request', 'invalid UTF-8 JSON')
+
+    def reply(self, status, result, head=False):
+        """ Sends a JSON response """
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path.startswith('/_session'):
+            self.send_header('Set-Cookie', 'AuthSession=fake; Version=1; Path=/; HttpOnly')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def stream(self, lines):
+        """ Sends the lines of a feed, one chunk each, until it ends or the client leaves """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for line in lines:
+                chunk = line.encode('utf-8') + b'\n'
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (IOError, OSError):
+            pass    # the client closed the feed
+        finally:
+            lines.close()
+
+
+def main(argv):
+    """ Serves a FakeCouchDB until interrupted """
+    parser = argparse.ArgumentParser(description='In-memory CouchDB stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5984)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds every answer is delayed by')
+    parser.add_argument('--fault-rate', type=float, default=0,
+                        help='fraction of the requests that fail')
+    parser.add_argument('--fault-status', type=int, action='append',
+                        help='a status the failures answer with, 429, 500 and 503 by default')
+    args = parser.parse_args(argv)
+    couch = FakeCouchDB(args.host, args.port, latency=args.latency, fault_rate=args.fault_rate,
+                        fault_statuses=tuple(args.fault_status or (429, 500, 503))).start()
+    print('Serving a fake CouchDB at {}'.format(couch.url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        couch.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
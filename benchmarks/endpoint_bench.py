@@ -0,0 +1,207 @@
+"""
+Load benchmark of every Customer endpoint
+
+Run with:
+  python -m benchmarks.endpoint_bench [--sizes 100,1000] [--requests 500]
+                                      [--concurrency 20] [--output results.json]
+
+Starts a FakeCouchDB in this process and, for each dataset size, seeds
+it with that many Customers, starts the service under gunicorn.conf.py
+against it and drives each route from many client threads at once.
+Prints the throughput and the p50, p95 and p99 latency of each endpoint
+and size, and writes them as JSON, with the commit and the settings of
+the run, so the results of two releases can be compared.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import requests
+from .couchdb_fake import FakeCouchDB
+from .serving_bench import start, percentile, PORT
+
+DBNAME = 'customers'
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def customer(number):
+    """ Returns the data of the numbered Customer """
+    return {'first_name': 'First{}'.format(number), 'last_name': 'Last{}'.format(number % 50),
+            'address': '{} Main Street'.format(number), 'email': 'c{}@example.com'.format(number),
+            'username': 'user{}'.format(number), 'password': 'password',
+            'phone_number': '555{:07d}'.format(number), 'active': True, 'id': number}
+
+
+def endpoints(base, seeded, created):
+    """ Returns (name, request) of each endpoint, in the order they run
+
+    Each request takes a session and the number of the call. The POSTs
+    add their new ids to created, which the DELETEs then remove.
+    """
+    def any_id():
+        return random.choice(seeded)
+
+    def post(session, number):
+        resp = session.post(base + '/customers', headers=JSON_HEADERS,
+                            data=json.dumps(customer(len(seeded) + number)))
+        if resp.status_code == 201:
+            created.append(resp.json()['_id'])
+        return resp
+
+    return [
+        ('GET /customers', lambda session, number: session.get(base + '/customers')),
+        ('GET /customers?limit=100',
+         lambda session, number: session.get(base + '/customers?limit=100')),
+        ('GET /customers?last_name=',
+         lambda session, number: session.get(
+             base + '/customers?last_name=Last{}'.format(number % 50))),
+        ('POST /customers', post),
+        ('GET /customers/<id>',
+         lambda session, number: session.get('{}/customers/{}'.format(base, any_id()))),
+        ('PUT /customers/<id>',
+         lambda session, number: session.put(
+             '{}/customers/{}'.format(base, any_id()), headers=JSON_HEADERS,
+             data=json.dumps(customer(number)))),
+        ('PUT /customers/<id>/disable',
+         lambda session, number: session.put(
+             '{}/customers/{}/disable'.format(base, any_id()), headers=JSON_HEADERS)),
+        ('DELETE /customers/<id>',
+         lambda session, number: session.delete(
+             '{}/customers/{}'.format(base, created.pop()))),
+    ]
+
+
+def drive(call, total, concurrency):
+    """ Makes total calls from concurrency threads
+
+    Returns the latency of each call and the number of failed calls.
+    """
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    numbers = iter(range(total))
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                number = next(numbers, None)
+            if number is None:
+                return
+            started = time.time()
+            try:
+                failed = call(session, number).status_code >= 400
+            except (requests.RequestException, IndexError):
+                failed = True
+            elapsed = time.time() - started
+            with lock:
+                latencies.append(elapsed)
+                failures[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures[0]
+
+
+def measure(name, call, size, total, concurrency):
+    """ Drives one endpoint and returns its result """
+    started = time.time()
+    latencies, failures = drive(call, total, concurrency)
+    seconds = time.time() - started
+    latencies.sort()
+    return {
+        'endpoint': name,
+        'dataset_size': size,
+        'requests': total,
+        'errors': failures,
+        'requests_per_second': total / seconds,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def run_size(couch, size, total, concurrency, worker_class):
+    """ Seeds the database with size Customers and benchmarks each endpoint """
+    couch.databases.pop(DBNAME, None)
+    seeded = [result['id'] for result in
+              couch.seed(DBNAME, [customer(number) for number in range(size)])]
+    created = []
+    base = 'http://127.0.0.1:{}'.format(PORT)
+    server = start(worker_class, STORAGE_BACKEND='cloudant',
+                   BINDING_CLOUDANT=json.dumps(couch.credentials()))
+    try:
+        # the first request opens the database, keep it out of the results
+        drive(lambda session, number: session.get(
+            '{}/customers/{}'.format(base, seeded[number % size])), concurrency, concurrency)
+        return [measure(name, call, size, total, concurrency)
+                for name, call in endpoints(base, seeded, created)]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def commit():
+    """ Returns the git commit of the tree being benchmarked, or None """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=(100, 1000), total=500, concurrency=20, worker_class='gevent'):
+    """ Benchmarks every endpoint at each dataset size and returns the report """
+    env = os.environ.pop('VCAP_SERVICES', None)    # it would win over the fake
+    couch = FakeCouchDB().start()
+    try:
+        results = []
+        for size in sizes:
+            results.extend(run_size(couch, size, total, concurrency, worker_class))
+    finally:
+        couch.stop()
+        if env is not None:
+            os.environ['VCAP_SERVICES'] = env
+    return {
+        'commit': commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'worker_class': worker_class,
+        'concurrency': concurrency,
+        'results': results,
+    }
+
+
+def main(argv):
+    """ Runs the benchmark from the command line """
+    parser = argparse.ArgumentParser(description='Load benchmark of every Customer endpoint')
+    parser.add_argument('--sizes', default='100,1000',
+                        help='comma separated numbers of seeded Customers')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests made to each endpoint')
+    parser.add_argument('--concurrency', type=int, default=20,
+                        help='clients making requests at once')
+    parser.add_argument('--worker-class', default=os.environ.get('WORKER_CLASS', 'gevent'))
+    parser.add_argument('--output', help='file the JSON report is written to')
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    report = run(sizes, args.requests, args.concurrency, args.worker_class)
+    for result in report['results']:
+        print('{endpoint:<28} {dataset_size:>7} docs {requests_per_second:>8,.0f} req/s  '
+              'p50 {p50_ms:>7.1f}  p95 {p95_ms:>7.1f}  p99 {p99_ms:>7.1f} ms  '
+              '{errors} errors'.format(**result))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
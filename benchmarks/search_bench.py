@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of the typeahead search index
+
+Run with:
+  python -m benchmarks.search_bench [customers] [queries]
+
+Builds a SearchIndex over that many generated Customers and prints how
+long the build took and the p50, p99 and max latency of typeahead
+queries: each keystroke of a name, username or email, and two terms.
+"""
+import sys
+import time
+import random
+from service.search import SearchIndex
+from .serving_bench import percentile
+
+SYLLABLES = ['an', 'be', 'car', 'da', 'el', 'fi', 'go', 'ha', 'is', 'jo', 'ka', 'li',
+             'mo', 'na', 'or', 'pe', 'qui', 'ra', 'so', 'ta', 'ul', 've', 'wi', 'xa',
+             'yo', 'ze']
+DOMAINS = ['example.com', 'mail.org', 'customers.net', 'shop.io']
+
+
+def name(rand):
+    """ Returns a made up name of two or three syllables """
+    return ''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 3))).title()
+
+
+def customer(rand, number):
+    """ Returns the searched fields of a made up Customer """
+    first, last = name(rand), name(rand)
+    username = '{}{}{}'.format(first[0], last, number % 100).lower()
+    return {'first_name': first, 'last_name': last, 'username': username,
+            'email': '{}.{}@{}'.format(first, last, rand.choice(DOMAINS)).lower()}
+
+
+def queries(rand, docs, total):
+    """ Returns the queries typed while looking up random Customers """
+    typed = []
+    while len(typed) < total:
+        doc = rand.choice(docs)
+        field = rand.choice(['first_name', 'last_name', 'username', 'email'])
+        for length in range(1, min(len(doc[field]), 8) + 1):
+            typed.append(doc[field][:length])
+        typed.append('{} {}'.format(doc['first_name'][:3], doc['last_name'][:2]))
+    return typed[:total]
+
+
+def run(customers=300000, total=2000, seed=1):
+    """ Builds the index and times the queries, returns the results """
+    rand = random.Random(seed)
+    docs = [customer(rand, number) for number in range(customers)]
+    index = SearchIndex()
+    started = time.time()
+    index.build(lambda: ((str(number), doc) for number, doc in enumerate(docs)))
+    build_seconds = time.time() - started
+
+    latencies = []
+    for query in queries(rand, docs, total):
+        started = time.time()
+        index.search(query)
+        latencies.append(time.time() - started)
+    latencies.sort()
+    started = time.time()
+    writes = 1000
+    for number in range(writes):
+        index.add('new{}'.format(number), customer(rand, number))
+    return {
+        'customers': customers,
+        'build_seconds': build_seconds,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'add_ms': (time.time() - started) * 1000 / writes,
+    }
+
+
+if __name__ == '__main__':
+    CUSTOMERS = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    QUERIES = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print('{customers:,} customers built in {build_seconds:.1f}s, queries p50 {p50_ms:.2f} '
+          'p99 {p99_ms:.2f} max {max_ms:.2f} ms, writes {add_ms:.3f} ms each'.format(
+              **run(CUSTOMERS, QUERIES)))
@@ -0,0 +1,45 @@
+"""
+Micro-benchmark of Customer serialize and deserialize
+
+Run with:
+  python -m benchmarks.serialize_bench [iterations]
+
+Prints how many Customers per second each path handles, which is the
+work done once per document on the list endpoints. The response paths
+compare marshal() and json.dumps, as the API used to encode a Customer,
+with to_api() and the fastjson encoder it uses now.
+"""
+import sys
+import json
+import timeit
+from flask_restplus import marshal
+from service import Customer_model, fastjson
+from service.models import Customer
+
+DOCUMENT = {"_id": "0a1b2c3d4e5f", "first_name": "Arturo", "last_name": "Frank",
+            "address": "USA", "email": "abc@abc.com", "username": "IAmUser",
+            "password": "password", "phone_number": "1231231234",
+            "active": True, "id": 1}
+
+
+def run(iterations=100000):
+    """ Times each path and returns the Customers per second """
+    customer = Customer().deserialize(DOCUMENT)
+    paths = {
+        'serialize': lambda: customer.serialize(),
+        'deserialize': lambda: Customer().deserialize(DOCUMENT),
+        'round trip': lambda: Customer().deserialize(DOCUMENT).serialize(),
+        'marshal+json': lambda: json.dumps(marshal(customer.serialize(), Customer_model)),
+        'to_api+' + fastjson.encoder: lambda: fastjson.dumps(customer.to_api()),
+    }
+    results = {}
+    for name, path in paths.items():
+        seconds = min(timeit.repeat(path, number=iterations, repeat=3))
+        results[name] = iterations / seconds
+    return results
+
+
+if __name__ == '__main__':
+    ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for path, rate in sorted(run(ITERATIONS).items()):
+        print('{:<14} {:>12,.0f} customers/s'.format(path, rate))
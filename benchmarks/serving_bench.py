@@ -0,0 +1,123 @@
+"""
+Benchmark of the sync and gevent gunicorn serving modes
+
+Run with:
+  python -m benchmarks.serving_bench [requests] [concurrency] [latency]
+
+Starts the service under gunicorn.conf.py once per worker class, with
+the storage backend the environment selects, creates one Customer and
+reads it back from many client threads at once. Prints the throughput
+and latency of each mode. The difference shows when the backend waits
+on the network, as it does with Cloudant: given a latency in seconds,
+the service uses a FakeCouchDB that takes that long to answer.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+import threading
+import requests
+from .couchdb_fake import FakeCouchDB
+
+WORKER_CLASSES = ('sync', 'gevent')
+CUSTOMER = {'first_name': 'Arturo', 'last_name': 'Frank', 'address': 'USA',
+            'email': 'abc@abc.com', 'username': 'bench', 'password': 'password',
+            'phone_number': '1231231234', 'active': True, 'id': 1}
+PORT = int(os.environ.get('BENCH_PORT', '5099'))
+
+
+def start(worker_class, **settings):
+    """ Starts gunicorn with a worker class and waits until it answers
+
+    The settings are added to the environment of the service.
+    """
+    env = dict(os.environ, PORT=str(PORT), WORKER_CLASS=worker_class, LOG_LEVEL='warning',
+               **settings)
+    # the cache would hide the backend, which is what this measures
+    env.setdefault('CACHE_SIZE', '0')
+    server = subprocess.Popen(['gunicorn', '--config', 'gunicorn.conf.py', 'service:app'],
+                              env=env)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=1).close()
+            return server
+        except socket.error:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def load(url, total, concurrency):
+    """ GETs url total times from concurrency threads, returns the latencies """
+    latencies = []
+    lock = threading.Lock()
+    remaining = [total]
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            started = time.time()
+            session.get(url).raise_for_status()
+            elapsed = time.time() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def percentile(values, fraction):
+    """ Returns the value below which fraction of the sorted values fall """
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(total=2000, concurrency=50, latency=None):
+    """ Benchmarks each worker class and returns its results """
+    results = {}
+    base = 'http://127.0.0.1:{}'.format(PORT)
+    settings = {}
+    couch = None
+    if latency is not None:
+        couch = FakeCouchDB(latency=latency).start()
+        settings = {'STORAGE_BACKEND': 'cloudant',
+                    'BINDING_CLOUDANT': json.dumps(couch.credentials())}
+    for worker_class in WORKER_CLASSES:
+        server = start(worker_class, **settings)
+        try:
+            resp = requests.post(base + '/customers', headers={'Content-Type': 'application/json'},
+                                 data=json.dumps(CUSTOMER))
+            url = '{}/customers/{}'.format(base, resp.json()['_id'])
+            load(url, concurrency, concurrency)     # warm up
+            started = time.time()
+            latencies = sorted(load(url, total, concurrency))
+            seconds = time.time() - started
+        finally:
+            server.terminate()
+            server.wait()
+        results[worker_class] = {
+            'requests_per_second': total / seconds,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+    if couch is not None:
+        couch.stop()
+    return results
+
+
+if __name__ == '__main__':
+    TOTAL = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    LATENCY = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    for mode, result in sorted(run(TOTAL, CONCURRENCY, LATENCY).items()):
+        print('{:<8} {requests_per_second:>8,.0f} req/s  p50 {p50_ms:>7.1f} ms  '
+              'p99 {p99_ms:>7.1f} ms'.format(mode, **result))
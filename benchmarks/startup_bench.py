@@ -0,0 +1,104 @@
+"""
+Startup report of the service
+
+Run with:
+  python -m benchmarks.startup_bench [--budget-ms 1000] [--top 20]
+
+Imports the service, timing every module it imports, then boots it with
+the storage backend of STORAGE_BACKEND and serves its first requests.
+Prints the slowest imports, with the time spent in the module itself and
+in everything it imported, then the time of each phase, and exits with 1
+when importing and booting the service takes longer than the budget.
+"""
+import sys
+import time
+import argparse
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+# the longest import and boot, in milliseconds, a new instance may take
+STARTUP_BUDGET_MS = 1000
+
+
+class ImportTimer(object):
+    """ Times each import that loads new modules, while it is active """
+
+    def __init__(self):
+        self.imports = []
+        self._children = []
+        self._import = None
+
+    def __enter__(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        return self
+
+    def __exit__(self, *exc):
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globs=None, *args, **kwargs):
+        loaded = len(sys.modules)
+        self._children.append(0.0)
+        started = time.time()
+        try:
+            return self._import(name, globs, *args, **kwargs)
+        finally:
+            elapsed = time.time() - started
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            if len(sys.modules) > loaded:
+                importer = (globs or {}).get('__name__', '?')
+                self.imports.append({'module': name or importer, 'importer': importer,
+                                     'cumulative_ms': elapsed * 1000,
+                                     'self_ms': (elapsed - children) * 1000})
+
+
+def timed(phase, phases):
+    """ Returns a function that adds the time since it was made to phases """
+    started = time.time()
+
+    def done():
+        phases.append((phase, (time.time() - started) * 1000))
+    return done
+
+
+def run(top=20):
+    """ Imports, boots and calls the service, returns the imports and the phases """
+    if 'service' in sys.modules:
+        raise RuntimeError('The service is already imported')
+    phases = []
+    done = timed('import', phases)
+    with ImportTimer() as timer:
+        import service
+    done()
+    done = timed('boot', phases)
+    service.boot()
+    done()
+    client = service.app.test_client()
+    for phase, url in (('first request', '/customers?limit=10'),
+                       ('swagger.json', '/swagger.json')):
+        done = timed(phase, phases)
+        client.get(url)
+        done()
+    slowest = sorted(timer.imports, key=lambda item: item['self_ms'], reverse=True)[:top]
+    return slowest, phases
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    PARSER.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    PARSER.add_argument('--top', type=int, default=20)
+    ARGS = PARSER.parse_args()
+    IMPORTS, PHASES = run(ARGS.top)
+    print('{:>9} {:>11}  {}'.format('self ms', 'cumulative', 'module (imported by)'))
+    for item in IMPORTS:
+        print('{self_ms:>9.1f} {cumulative_ms:>11.1f}  {module} ({importer})'.format(**item))
+    print('')
+    for PHASE, MS in PHASES:
+        print('{:<14} {:>8.1f} ms'.format(PHASE, MS))
+    STARTUP = sum(ms for phase, ms in PHASES if phase in ('import', 'boot'))
+    print('{:<14} {:>8.1f} ms of a {:.0f} ms budget'.format('startup', STARTUP, ARGS.budget_ms))
+    sys.exit(1 if STARTUP > ARGS.budget_ms else 0)
@@ -0,0 +1,43 @@
+"""
+Gunicorn configuration for the Customer Service
+
+Run with:
+  gunicorn --config gunicorn.conf.py service:app
+
+By default each worker is a gevent worker: gunicorn patches the standard
+library before the service is imported, so the Cloudant HTTP calls, the
+retry sleeps and the _changes feed thread all yield to other requests
+while they wait, and one process keeps hundreds of requests in flight.
+WORKER_CLASS=sync serves one request at a time per worker instead.
+
+Each worker boots the service, opening the database, before it accepts
+connections, so a new instance only takes traffic once it is ready.
+"""
+import os
+import tempfile
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', '5000'))
+worker_class = os.environ.get('WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+# the most requests a gevent worker serves at once
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '1000'))
+timeout = int(os.environ.get('WORKER_TIMEOUT', '30'))
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+# import the service in each worker, after gevent has patched it
+preload_app = False
+
+# the workers write their Prometheus metrics to files in this directory
+# so /metrics reports them all, whichever worker serves it
+os.environ.setdefault('prometheus_multiproc_dir', tempfile.mkdtemp(prefix='customers-metrics-'))
+
+
+def post_worker_init(worker):
+    """ Boots the service in a worker that has imported it """
+    from service import boot
+    boot()
+
+
+def child_exit(server, worker):
+    """ Drops the in-flight gauge of a worker that exited """
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -5,7 +5,7 @@ Start the Customer Service and initializes logging
 """
 
 import os
-from service import app
+from service import app, boot
 
 # Pull options from environment
 DEBUG = (os.getenv('DEBUG', 'True') == 'True')
@@ -18,4 +18,5 @@ if __name__ == "__main__":
     print "************************************************"
     print " C U S T O M E R  S E R V I C E   R U N N I N G"
     print "************************************************"
+    boot()
     app.run(host='0.0.0.0', port=int(PORT), debug=DEBUG)
@@ -3,22 +3,32 @@ Package: app
 
 Package for the application models and services
 This module also sets up the logging to be used with gunicorn
+
+The service starts in two phases: importing this package builds the app
+and its routes, and boot() then opens the database. gunicorn boots each
+worker before it accepts connections (see gunicorn.conf.py), so no
+request waits for the database to be connected.
 """
+import time
+# when the import started, to log how long it took, libraries included
+IMPORT_STARTED = time.time()
 import os
 import sys
 import logging
-from flask import Flask
-from flask_restful import Api
-from flask_restplus import Api as  BaseApi, Resource, fields
-from .models import Customer, DataValidationError
+from flask import Flask, request, g
+from flask_restplus import Api as  BaseApi, Model as BaseModel, fields
+from .models import Customer, DataValidationError, CUSTOMER_FIELDS
+from .resilience import resilience
+from .profiling import profiler
+from .compression import compressor
+from .fastjson import output_json
+from . import metrics
 
 # Create Flask application
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'please, tell nobody... Shhhh'
 app.config['LOGGING_LEVEL'] = logging.INFO
 
-api = Api(app)
-
 class Api(BaseApi):
     def _register_doc(self, app_or_blueprint):
         # HINT: This is just a copy of the original implementation with the last line commented out.
@@ -30,55 +40,52 @@ class Api(BaseApi):
     def base_path(self):
         return ''
 
+
+class Model(BaseModel):
+    """ A Swagger model the doc decorators share instead of copying it """
+    def __deepcopy__(self, memo):
+        # every @ns.response and @ns.expect deep copies its docs, models
+        # included, as the service is imported; a model is not changed
+        # once it is defined, so they can all hold this one
+        return self
+
 ######################################################################
 # Configure Swagger before initilaizing it
 ######################################################################
-apii = Api(app,
+# the one Api of the service, which routes the resources and documents
+# them; the Swagger spec is only built on the first GET /swagger.json
+api = Api(app,
           version='3.0.0',
           title='Customer REST API Service ',
           description='This is a customer server.',
           doc='/apidocs/index.html'
          )
 
-# This namespace is the start of the path i.e., /cutomers
-ns = apii.namespace('Customers',default=None, description='Customer operations')
-apii.namespaces.pop(0)
+# This namespace is the start of the path i.e., /customers
+ns = api.namespace('Customers', path='/customers', description='Customer operations')
+api.namespaces.pop(0)
+
+# encode the JSON responses with the fastest library installed
+api.representation('application/json')(output_json)
 
 # Define the model so that the docs reflect what can be sent
-Customer_model = apii.model('Customer', {
-    '_id': fields.String(readOnly=True,
-                         description='The unique id assigned internally by service'),
-    'first_name': fields.String(required=True,
-                          description='The first name of a Customer'),
-    'last_name': fields.String(required=True,
-                              description='The last name of a Customer'),
-    'address': fields.String(required=True,
-                              description='The address of a Customer'),
-    'phone_number': fields.String(required=True,
-                              description='The phone_number of a Customer'),
-    'email': fields.String(required=True,
-                              description='The last name of a Customer'),
-    'username': fields.String(required=True,
-                              description='The last username of a Customer'),
-    'password': fields.String(required=True,
-                              description='The last password of a Customer'),
-    'active': fields.String(required=True,
-                              description='The acive status of a Customer'),
-    'id': fields.Integer(required=True,
-                              description='The ID of a Customer'),
-
-})
+customer_fields = dict(
+    (name, getattr(fields, kind)(required=True, description=description))
+    for name, kind, description in CUSTOMER_FIELDS)
+customer_fields['_id'] = fields.String(readOnly=True,
+                                       description='The unique id assigned internally by service')
+Customer_model = api.add_model('Customer', Model('Customer', customer_fields))
 
 
+# the Customer resources route themselves on ns as they are imported
 from service.resources import HomePage
 from service.resources import CustomerResource
 from service.resources import CustomerCollection
 from service.resources import DisableAction
+from service.resources import CustomerSearch
+from service.resources import CustomerExport, CustomerImport
 
 api.add_resource(HomePage, '/')
-api.add_resource(CustomerCollection, '/customers')
-api.add_resource(CustomerResource, '/customers/<customer_id>')
-api.add_resource(DisableAction, '/customers/<customer_id>/disable')
 
 #  import service
 
@@ -99,8 +106,68 @@ app.logger.info('************************************************************')
 app.logger.info('Logging established')
 
 
-@app.before_first_request
-def init_db(dbname="customers"):
-    print("Creating")
-    """ Initlaize the model """
+def boot(dbname="customers"):
+    """ Opens the database, so the service is ready for requests
+
+    Connecting, creating the database and its indexes and starting the
+    changes feed all happen here, before the first request instead of
+    during it. When search is enabled, its index starts building in the
+    background.
+    """
+    started = time.time()
     Customer.init_db(dbname)
+    if Customer.search_enabled:
+        Customer.build_search_index()
+    app.logger.info('Booted in %.0f ms', (time.time() - started) * 1000)
+
+
+@app.before_first_request
+def boot_on_first_request():
+    """ Boots a service that was started without boot(), like with flask run """
+    if Customer.backend is None:
+        boot()
+
+
+@app.before_request
+def start_metrics():
+    """ Counts the request in flight and notes when it started """
+    g.metrics_started = metrics.start_request()
+
+
+@app.after_request
+def record_metrics(response):
+    """ Records the request by route template and status code """
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.end_request(request.method, route, response.status_code,
+                        g.get('metrics_started', 0))
+    return response
+
+
+@app.teardown_request
+def finish_metrics(exception=None):
+    """ Counts the request out of flight once it is done """
+    metrics.finish_request()
+
+
+@app.before_request
+def start_deadline():
+    """ Gives the request its time budget for calls to the database """
+    resilience.start_request()
+
+
+@app.teardown_request
+def end_deadline(exception=None):
+    """ Removes the deadline once the request is done """
+    resilience.end_request()
+
+
+# profile requests only when PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+profiler.init_app(app)
+
+# compress responses for the clients that send Accept-Encoding
+compressor.init_app(app)
+
+# the export-customers and import-customers commands of the flask command
+from service import commands
+
+app.logger.info('Imported in %.0f ms', (time.time() - IMPORT_STARTED) * 1000)
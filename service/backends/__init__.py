@@ -0,0 +1,14 @@
+"""
+This Package contains the storage backends of the Customer model
+"""
+
+from .base import StorageBackend, ConflictError
+from .cloudant_backend import CloudantBackend
+from .memory_backend import MemoryBackend
+from .sqlite_backend import SQLiteBackend
+
+BACKENDS = {
+    'cloudant': CloudantBackend,
+    'memory': MemoryBackend,
+    'sqlite': SQLiteBackend,
+}
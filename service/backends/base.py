@@ -0,0 +1,179 @@
+"""
+Storage backend interface
+
+StorageBackend - the operations the Customer model needs from a store of
+                 JSON documents, with CouchDB semantics: every document
+                 has an _id and a _rev, ids are listed in sorted order
+                 and design documents are never returned as data
+"""
+import uuid
+
+
+class ConflictError(Exception):
+    """ Raised when a write names a revision that is no longer current """
+    pass
+
+
+def new_id():
+    """ Returns a new document id like the ones CouchDB generates """
+    return uuid.uuid4().hex
+
+
+def next_rev(rev=None):
+    """ Returns the revision that follows rev """
+    generation = int(rev.split('-', 1)[0]) if rev else 0
+    return '{}-{}'.format(generation + 1, uuid.uuid4().hex)
+
+
+def conflict(doc_id):
+    """ Returns the bulk status of a document whose revision is not current """
+    return {'id': doc_id, 'error': 'conflict', 'reason': 'Document update conflict.'}
+
+
+# the Mango operators of the selectors the query compiler writes
+OPERATORS = {
+    '$eq': lambda value, argument: value == argument,
+    '$ne': lambda value, argument: value != argument,
+    '$in': lambda value, argument: value in argument,
+    '$nin': lambda value, argument: value not in argument,
+    '$gt': lambda value, argument: value > argument,
+    '$gte': lambda value, argument: value >= argument,
+    '$lt': lambda value, argument: value < argument,
+    '$lte': lambda value, argument: value <= argument,
+}
+
+
+def matches(selector, doc):
+    """ Checks a document against a selector of field conditions
+
+    A condition is a value the field equals, or a dict of operators.
+    """
+    for field, condition in selector.items():
+        if field not in doc:
+            return False
+        if isinstance(condition, dict):
+            if not all(OPERATORS[operator](doc[field], argument)
+                       for operator, argument in condition.items()):
+                return False
+        elif doc[field] != condition:
+            return False
+    return True
+
+
+def project(doc, fields):
+    """ Returns a copy of doc with only the given fields, or all of them """
+    if fields is None:
+        return dict(doc)
+    return dict((field, doc[field]) for field in fields if field in doc)
+
+
+class StorageBackend(object):
+    """ Base class of the Customer storage backends """
+
+    def create(self, doc):
+        """ Creates a document and returns its new _id """
+        raise NotImplementedError()
+
+    def update(self, doc):
+        """ Replaces the document with the same _id and returns the new _rev
+
+        A doc with a _rev only replaces that revision and raises
+        ConflictError when the stored one differs. Without a _rev the
+        current revision is replaced, or None is returned when there is
+        no document to replace.
+        """
+        raise NotImplementedError()
+
+    def delete(self, doc_id):
+        """ Deletes a document if it exists
+
+        Raises:
+            ConflictError: when the document changed while it was deleted
+        """
+        raise NotImplementedError()
+
+    def get(self, doc_id):
+        """ Returns a document or None if it does not exist """
+        raise NotImplementedError()
+
+    def find(self, selector, index=None, fields=None):
+        """ Returns the documents whose fields equal the selector's
+
+        Args:
+            selector (dict): field equalities
+            index (string): the declared index that covers the selector
+            fields (list): the only fields to return, None for all
+        """
+        raise NotImplementedError()
+
+    def all_docs(self, batch_size, fields=None):
+        """ Generator of every document, read batch_size at a time
+
+        Args:
+            batch_size (int): number of documents read per request
+            fields (list): the only fields to return, None for all
+        """
+        raise NotImplementedError()
+
+    def page(self, selector, limit, cursor=None, index=None, fields=None):
+        """ Returns one page of the documents matching a selector
+
+        An empty selector pages through every document in _id order.
+
+        Args:
+            selector (dict): field equalities
+            limit (int): the most documents returned
+            cursor (string): where the page starts, from the previous page
+            index (string): the declared index that covers the selector
+            fields (list): the only fields to return, None for all
+        Returns:
+            the documents and the cursor of the next page, or None when
+            there are no more documents
+        Raises:
+            ValueError: when the cursor is not one this backend made
+        """
+        raise NotImplementedError()
+
+    def bulk_save(self, docs, update=True):
+        """ Creates or updates documents in one batch
+
+        Args:
+            docs (list): the documents, those with an _id and no _rev
+                replace the current revision of that document, and those
+                with a _rev are a conflict unless it is the current one
+            update (bool): False to only create documents, so one whose
+                _id is taken is a conflict
+        Returns:
+            one status per document, in order: {'id', 'ok'} or
+            {'id', 'error', 'reason'}
+        """
+        raise NotImplementedError()
+
+    def bulk_delete(self, doc_ids):
+        """ Deletes documents in one batch, returning statuses like bulk_save """
+        raise NotImplementedError()
+
+    def remove_all(self, mode):
+        """ Deletes every document but keeps the indexes """
+        raise NotImplementedError()
+
+    def create_indexes(self, indexes):
+        """ Creates the declared indexes: name -> list of fields """
+        raise NotImplementedError()
+
+    def update_seq(self):
+        """ Returns a value that changes whenever any document is written """
+        raise NotImplementedError()
+
+    def follow_changes(self, callback, include_docs=False):
+        """ Calls back with the changes written by other processes
+
+        Each change carries its doc when include_docs is True.
+
+        Backends that live inside a single process have nothing to follow.
+        """
+        pass
+
+    def close(self):
+        """ Stops any background work of the backend """
+        pass
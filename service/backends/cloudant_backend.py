@@ -0,0 +1,399 @@
+"""
+Cloudant / CouchDB storage backend
+
+CloudantBackend - stores the Customers in a Cloudant or CouchDB database
+"""
+import os
+import json
+import logging
+from cloudant.client import Cloudant
+from cloudant.database import CloudantDatabase
+from cloudant.document import Document
+from cloudant.error import CloudantDatabaseException
+from cloudant.query import Query
+from requests import HTTPError, ConnectionError
+from service.changes import ChangesFollower
+from service.fastjson import dumps
+from service.resilience import resilience, DeadlineAdapter
+from .base import StorageBackend, ConflictError
+
+# get configruation from enviuronment (12-factor)
+ADMIN_PARTY = os.environ.get('ADMIN_PARTY', 'False').lower() == 'true'
+CLOUDANT_HOST = os.environ.get('CLOUDANT_HOST', 'localhost')
+CLOUDANT_USERNAME = os.environ.get('CLOUDANT_USERNAME', 'admin')
+CLOUDANT_PASSWORD = os.environ.get('CLOUDANT_PASSWORD', 'pass')
+
+# HTTP connections kept open to Cloudant, enough for the requests a
+# gevent worker has in flight to not open a new connection each time
+CLOUDANT_POOL_SIZE = int(os.environ.get('CLOUDANT_POOL_SIZE', '100'))
+
+# documents read per _find request when a query is iterated
+QUERY_PAGE_SIZE = int(os.environ.get('QUERY_PAGE_SIZE', '200'))
+
+# number of documents deleted per _bulk_docs request by remove_all
+REMOVE_ALL_BATCH_SIZE = int(os.environ.get('REMOVE_ALL_BATCH_SIZE', '5000'))
+
+
+class CloudantBackend(StorageBackend):
+    """ Stores documents in a Cloudant or CouchDB database """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, dbname='customers'):
+        """ Connects to Cloudant and opens or creates the database """
+        self.client = self.connect()
+        self.database = self.open_database(dbname)
+        self.changes_follower = None
+
+    @staticmethod
+    def credentials():
+        """ Finds the Cloudant credentials in the environment """
+        opts = {}
+        vcap_services = {}
+
+        # Try and get VCAP from the environment or a file if developing
+        if 'VCAP_SERVICES' in os.environ:
+            CloudantBackend.logger.info('Running in Bluemix mode.')
+            CloudantBackend.logger.info(os.environ['VCAP_SERVICES'])
+            vcap_services = json.loads(os.environ['VCAP_SERVICES'])
+        # if VCAP_SERVICES isn't found, maybe we are running on Kubernetes?
+        elif 'BINDING_CLOUDANT' in os.environ:
+            CloudantBackend.logger.info('Found Kubernetes Bindings')
+            creds = json.loads(os.environ['BINDING_CLOUDANT'])
+            vcap_services = {"cloudantNoSQLDB": [{"credentials": creds}]}
+        else:
+            CloudantBackend.logger.info('VCAP_SERVICES and BINDING_CLOUDANT undefined.')
+            creds = {
+                "username": CLOUDANT_USERNAME,
+                "password": CLOUDANT_PASSWORD,
+                "host": CLOUDANT_HOST,
+                "port": 5984,
+                "url": "http://" + CLOUDANT_HOST + ":5984/"
+            }
+            vcap_services = {"cloudantNoSQLDB": [{"credentials": creds}]}
+
+        # Look for Cloudant in VCAP_SERVICES
+        for service in vcap_services:
+            if service.startswith('cloudantNoSQLDB'):
+                cloudant_service = vcap_services[service][0]
+                CloudantBackend.logger.info(cloudant_service)
+                opts['username'] = cloudant_service['credentials']['username']
+                opts['password'] = cloudant_service['credentials']['password']
+                opts['host'] = cloudant_service['credentials']['host']
+                opts['port'] = cloudant_service['credentials']['port']
+                opts['url'] = cloudant_service['credentials']['url']
+
+        CloudantBackend.logger.info(opts)
+        if any(k not in opts for k in ('host', 'username', 'password', 'port', 'url')):
+            CloudantBackend.logger.info('Error - Failed to retrieve options. '
+                                        'Check that app is bound to a Cloudant service.')
+            exit(-1)
+        return opts
+
+    @staticmethod
+    def connect():
+        """ Returns a Cloudant client connected with the environment's credentials """
+        opts = CloudantBackend.credentials()
+        CloudantBackend.logger.info('Cloudant Endpoint: %s', opts['url'])
+        try:
+            if ADMIN_PARTY:
+                CloudantBackend.logger.info('Running in Admin Party Mode...')
+            return Cloudant(opts['username'],
+                            opts['password'],
+                            url=opts['url'],
+                            connect=True,
+                            auto_renew=True,
+                            admin_party=ADMIN_PARTY,
+                            adapter=DeadlineAdapter(resilience,
+                                                    pool_maxsize=CLOUDANT_POOL_SIZE)
+                            )
+        except ConnectionError:
+            raise AssertionError('Cloudant service could not be reached')
+
+    def open_database(self, dbname):
+        """ Returns the named database, creating it if it doesn't exist
+
+        A HEAD finds an existing database and a PUT is only sent for a
+        missing one, so every boot after the first costs one request.
+        """
+        database = CloudantDatabase(self.client, dbname)
+        try:
+            database.create()
+        except CloudantDatabaseException:
+            raise AssertionError('Database [{}] could not be obtained'.format(dbname))
+        return database
+
+######################################################################
+#  D O C U M E N T   M E T H O D S
+######################################################################
+
+    @resilience('write', idempotent=False)
+    def create(self, doc):
+        # a POST with the body encoded by fastjson, rather than
+        # create_document() which also keeps the document in a local cache
+        resp = self.database.r_session.post(
+            self.database.database_url, data=dumps(doc),
+            headers={'Content-Type': 'application/json'})
+        resp.raise_for_status()
+        return str(resp.json()['id'])
+
+    @resilience('write', idempotent=False)
+    def update(self, doc):
+        if not doc.get('_rev'):
+            revs = self._current_revs([doc['_id']])
+            if doc['_id'] not in revs:
+                return None
+            doc = dict(doc, _rev=revs[doc['_id']])
+        # a single PUT that CouchDB only applies to the given revision,
+        # rather than Document.save() which asks if the document exists first
+        resp = self.database.r_session.put(
+            Document(self.database, doc['_id']).document_url,
+            data=dumps(doc),
+            headers={'Content-Type': 'application/json'})
+        if resp.status_code == 409:
+            raise ConflictError('Document update conflict: {}'.format(doc['_id']))
+        resp.raise_for_status()
+        return resp.json()['rev']
+
+    @resilience('write')
+    def delete(self, doc_id):
+        # a DELETE of the current revision, rather than through the
+        # library's local document cache, which is never invalidated
+        revs = self._current_revs([doc_id])
+        if doc_id not in revs:
+            return
+        resp = self.database.r_session.delete(
+            Document(self.database, doc_id).document_url, params={'rev': revs[doc_id]})
+        if resp.status_code == 404:
+            return
+        if resp.status_code == 409:
+            raise ConflictError('Document delete conflict: {}'.format(doc_id))
+        resp.raise_for_status()
+
+    @resilience('read')
+    def get(self, doc_id):
+        # read the database directly rather than the library's local
+        # document cache, which is never invalidated
+        document = Document(self.database, doc_id)
+        try:
+            document.fetch()
+        except HTTPError as err:
+            if err.response is not None and err.response.status_code == 404:
+                return None
+            raise
+        return dict(document)
+
+    def find(self, selector, index=None, fields=None):
+        if index is None:
+            CloudantBackend.logger.warning('No index for fields %s, query will scan '
+                                           'the whole database', sorted(selector))
+        # page with bookmarks so each request is a protected call
+        bookmark = None
+        while True:
+            docs, bookmark = self._query_page(selector, QUERY_PAGE_SIZE, bookmark, index, fields)
+            for doc in docs:
+                yield doc
+            if bookmark is None:
+                return
+
+    def all_docs(self, batch_size, fields=None):
+        if fields is not None:
+            # _all_docs cannot project, so page through _find on _id instead
+            for doc in self._find_all(batch_size, fields):
+                yield doc
+            return
+        startkey = None
+        while True:
+            # ask for one extra row so we know where the next page starts
+            rows = self._all_docs_page(batch_size + 1, startkey)
+            for row in rows[:batch_size]:
+                if not row['id'].startswith('_design/'):
+                    yield row['doc']
+            if len(rows) <= batch_size:
+                return
+            startkey = rows[batch_size]['id']
+
+    def _find_all(self, batch_size, fields):
+        """ Generator of every document with only the given fields """
+        fields = list(fields) if '_id' in fields else list(fields) + ['_id']
+        startkey = None
+        while True:
+            # ask for one extra document so we know where the next page starts
+            docs = self._find_page(startkey, batch_size + 1, fields)
+            for doc in docs[:batch_size]:
+                if not doc['_id'].startswith('_design/'):
+                    yield doc
+            if len(docs) <= batch_size:
+                return
+            startkey = docs[batch_size]['_id']
+
+    @resilience('read')
+    def _find_page(self, startkey, limit, fields):
+        """ Fetches a page of projected documents in _id order from startkey """
+        query = Query(self.database, selector={'_id': {'$gte': startkey}},
+                      fields=fields, sort=[{'_id': 'asc'}], limit=limit)
+        return query().get('docs', [])
+
+    def page(self, selector, limit, cursor=None, index=None, fields=None):
+        if selector:
+            return self._query_page(selector, limit, cursor, index, fields)
+        # without a selector the cursor is the startkey of the next page
+        if fields is not None:
+            docs = self._find_page(cursor, limit + 1, fields)
+        else:
+            docs = []
+            startkey = cursor
+            # the design documents sort among the Customers, read past them
+            while len(docs) <= limit:
+                wanted = limit + 1 - len(docs)
+                rows = self._all_docs_page(wanted, startkey)
+                docs.extend(row['doc'] for row in rows
+                            if not row['id'].startswith('_design/'))
+                if len(rows) < wanted:
+                    break
+                startkey = rows[-1]['id'] + u'\u0000'
+        next_cursor = docs[limit]['_id'] if len(docs) > limit else None
+        return docs[:limit], next_cursor
+
+    @resilience('read')
+    def _query_page(self, selector, limit, bookmark, index, fields):
+        """ Fetches one page of a Mango query, the cursor is its bookmark """
+        options = {'selector': selector, 'limit': limit}
+        if bookmark:
+            options['bookmark'] = bookmark
+        if index is not None:
+            options['use_index'] = index
+        if fields is not None:
+            options['fields'] = fields
+        try:
+            result = Query(self.database, **options)()
+        except HTTPError as err:
+            if bookmark and err.response is not None and err.response.status_code == 400:
+                raise ValueError('Invalid cursor: {}'.format(bookmark))
+            raise
+        docs = result.get('docs', [])
+        # a full page may be the last one, the next one is then empty
+        return docs, result.get('bookmark') if len(docs) == limit else None
+
+    @resilience('read')
+    def _all_docs_page(self, limit, startkey=None):
+        """ Fetches one page of _all_docs rows with their documents """
+        options = {'include_docs': True, 'limit': limit}
+        if startkey is not None:
+            options['startkey'] = startkey
+        return self.database.all_docs(**options).get('rows', [])
+
+######################################################################
+#  B U L K   M E T H O D S
+######################################################################
+
+    def bulk_save(self, docs, update=True):
+        if not update:
+            # without a _rev, CouchDB refuses to replace a document
+            return self._bulk_docs(docs)
+        # a document read with a _rev keeps it, and conflicts if it is stale
+        revs = self._current_revs([doc['_id'] for doc in docs
+                                   if doc.get('_id') and not doc.get('_rev')])
+        for doc in docs:
+            if not doc.get('_rev') and doc.get('_id') in revs:
+                doc['_rev'] = revs[doc['_id']]
+        return self._bulk_docs(docs)
+
+    def bulk_delete(self, doc_ids):
+        revs = self._current_revs(doc_ids)
+        docs = [{'_id': doc_id, '_rev': revs[doc_id], '_deleted': True}
+                for doc_id in doc_ids if doc_id in revs]
+        statuses = iter(self._bulk_docs(docs) if docs else [])
+        return [next(statuses) if doc_id in revs else
+                {'id': doc_id, 'error': 'not_found', 'reason': 'missing'}
+                for doc_id in doc_ids]
+
+    @resilience('read')
+    def _current_revs(self, ids):
+        """ Returns the current revision of each existing document id """
+        if not ids:
+            return {}
+        rows = self.database.all_docs(keys=ids).get('rows', [])
+        return dict((row['id'], row['value']['rev']) for row in rows
+                    if 'value' in row and not row['value'].get('deleted'))
+
+    @resilience('bulk', idempotent=False)
+    def _bulk_docs(self, docs):
+        """ Sends documents to _bulk_docs and returns the status of each one """
+        resp = self.database.r_session.post(
+            self.database.database_url + '/_bulk_docs', data=dumps({'docs': docs}),
+            headers={'Content-Type': 'application/json'})
+        resp.raise_for_status()
+        return resp.json()
+
+    @resilience('admin', idempotent=False)
+    def remove_all(self, mode):
+        if mode == 'recreate':
+            self._recreate_database()
+        else:
+            self._bulk_delete_all()
+        # forget the documents cached by the cloudant library
+        self.database.clear()
+
+    def _bulk_delete_all(self):
+        """ Deletes every non-design document in _bulk_docs batches """
+        startkey = None
+        while True:
+            options = {'limit': REMOVE_ALL_BATCH_SIZE}
+            if startkey is not None:
+                options['startkey'] = startkey
+            rows = self.database.all_docs(**options).get('rows', [])
+            docs = [{'_id': row['id'], '_rev': row['value']['rev'], '_deleted': True}
+                    for row in rows if not row['id'].startswith('_design/')]
+            if docs:
+                self._bulk_docs(docs)
+            if len(rows) < REMOVE_ALL_BATCH_SIZE:
+                return
+            # start after the last id of this page
+            startkey = rows[-1]['id'] + u'\u0000'
+
+    def _recreate_database(self):
+        """ Drops and recreates the database, restoring its design documents """
+        ddocs = [row['doc'] for row in self.database.all_docs(
+            startkey='_design/', endkey='_design0', include_docs=True).get('rows', [])]
+        for ddoc in ddocs:
+            ddoc.pop('_rev', None)
+        dbname = self.database.database_name
+        self.client.delete_database(dbname)
+        self.database = self.client.create_database(dbname)
+        if ddocs:
+            self._bulk_docs(ddocs)
+        if self.changes_follower is not None:
+            self.follow_changes(self.changes_follower.callback,
+                                self.changes_follower.include_docs)
+
+######################################################################
+#  I N D E X E S   A N D   C H A N G E S
+######################################################################
+
+    @resilience('admin')
+    def create_indexes(self, indexes):
+        existing = self.database.get_query_indexes(raw_result=True)
+        ddocs = set(index['ddoc'] for index in existing.get('indexes', []))
+        for name, fields in indexes.items():
+            if '_design/' + name in ddocs:
+                continue
+            CloudantBackend.logger.info('Creating index %s on %s', name, fields)
+            self.database.create_query_index(design_document_id=name,
+                                             index_name=name,
+                                             fields=fields)
+
+    @resilience('read')
+    def update_seq(self):
+        return self.database.metadata()['update_seq']
+
+    def follow_changes(self, callback, include_docs=False):
+        """ Follows the _changes feed in a background thread """
+        self.close()
+        self.changes_follower = ChangesFollower(self.database, callback,
+                                                include_docs=include_docs)
+        self.changes_follower.start()
+
+    def close(self):
+        if self.changes_follower is not None:
+            self.changes_follower.stop()
+            self.changes_follower = None
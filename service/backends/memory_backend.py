@@ -0,0 +1,187 @@
+"""
+In-memory storage backend
+
+MemoryBackend - keeps the Customers in a dict with secondary indexes, for
+                unit tests and load tests that must not need a database
+"""
+import threading
+from .base import (StorageBackend, ConflictError, new_id, next_rev, conflict,
+                   matches, project)
+
+
+class MemoryStore(object):
+    """ The documents of one in-memory database and their indexes """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.seq = 0
+        # index name -> fields, and field -> value -> set of ids
+        self.indexes = {}
+        self.values = {}
+
+    def index(self, doc):
+        """ Adds a document to the secondary indexes """
+        for field, values in self.values.items():
+            if field in doc:
+                values.setdefault(self.key(doc[field]), set()).add(doc['_id'])
+
+    def unindex(self, doc):
+        """ Removes a document from the secondary indexes """
+        for field, values in self.values.items():
+            if field in doc:
+                ids = values.get(self.key(doc[field]))
+                if ids:
+                    ids.discard(doc['_id'])
+
+    @staticmethod
+    def key(value):
+        """ Makes any JSON value usable as a dict key """
+        return repr(value) if isinstance(value, (dict, list)) else value
+
+
+class MemoryBackend(StorageBackend):
+    """ Stores documents in process memory
+
+    Databases are kept by name for the life of the process, so opening
+    the same name twice sees the same documents, like a server would.
+    """
+    stores = {}
+
+    def __init__(self, dbname='customers'):
+        self.store = MemoryBackend.stores.setdefault(dbname, MemoryStore())
+
+    def _put(self, doc):
+        """ Writes a copy of doc with a new revision and returns the status """
+        store = self.store
+        old = store.docs.get(doc['_id'])
+        doc = dict(doc)
+        doc['_rev'] = next_rev(old['_rev'] if old else None)
+        if old:
+            store.unindex(old)
+        store.docs[doc['_id']] = doc
+        store.index(doc)
+        store.seq += 1
+        return {'id': doc['_id'], 'rev': doc['_rev'], 'ok': True}
+
+    def _remove(self, doc_id):
+        """ Deletes a document and returns the status """
+        doc = self.store.docs.pop(doc_id, None)
+        if doc is None:
+            return {'id': doc_id, 'error': 'not_found', 'reason': 'missing'}
+        self.store.unindex(doc)
+        self.store.seq += 1
+        return {'id': doc_id, 'ok': True}
+
+    def create(self, doc):
+        doc = dict(doc)
+        doc.setdefault('_id', new_id())
+        with self.store.lock:
+            return self._put(doc)['id']
+
+    def update(self, doc):
+        with self.store.lock:
+            old = self.store.docs.get(doc['_id'])
+            if doc.get('_rev') and (old is None or old['_rev'] != doc['_rev']):
+                raise ConflictError('Document update conflict: {}'.format(doc['_id']))
+            if old is not None:
+                return self._put(doc)['rev']
+        return None
+
+    def delete(self, doc_id):
+        with self.store.lock:
+            self._remove(doc_id)
+
+    def get(self, doc_id):
+        with self.store.lock:
+            doc = self.store.docs.get(doc_id)
+            return dict(doc) if doc else None
+
+    def _candidates(self, selector):
+        """ Returns the documents the smallest matching index allows """
+        store = self.store
+        candidates = None
+        for field, condition in selector.items():
+            if field not in store.values:
+                continue
+            if not isinstance(condition, dict):
+                values = [condition]
+            elif '$eq' in condition or '$in' in condition:
+                values = [condition['$eq']] if '$eq' in condition else condition['$in']
+            else:
+                continue    # a range or an exclusion, matches() checks it
+            ids = set()
+            for value in values:
+                ids.update(store.values[field].get(store.key(value), ()))
+            if candidates is None or len(ids) < len(candidates):
+                candidates = ids
+        if candidates is None:
+            return store.docs.values()
+        return [store.docs[doc_id] for doc_id in candidates]
+
+    def find(self, selector, index=None, fields=None):
+        with self.store.lock:
+            return [project(doc, fields) for doc in self._candidates(selector)
+                    if matches(selector, doc)]
+
+    def page(self, selector, limit, cursor=None, index=None, fields=None):
+        # the cursor is the _id the next page starts at
+        with self.store.lock:
+            docs = sorted((doc for doc in self._candidates(selector)
+                           if matches(selector, doc) and (cursor is None or doc['_id'] >= cursor)),
+                          key=lambda doc: doc['_id'])[:limit + 1]
+            next_cursor = docs[limit]['_id'] if len(docs) > limit else None
+            return [project(doc, fields) for doc in docs[:limit]], next_cursor
+
+    def all_docs(self, batch_size, fields=None):
+        with self.store.lock:
+            ids = sorted(self.store.docs)
+        for start in range(0, len(ids), batch_size):
+            with self.store.lock:
+                batch = [self.store.docs.get(doc_id) for doc_id in ids[start:start + batch_size]]
+            for doc in batch:
+                if doc is not None:
+                    yield project(doc, fields)
+
+    def bulk_save(self, docs, update=True):
+        statuses = []
+        with self.store.lock:
+            for doc in docs:
+                doc = dict(doc)
+                doc.setdefault('_id', new_id())
+                old = self.store.docs.get(doc['_id'])
+                # a document with a _rev only replaces that revision
+                if (old is not None and not update) or \
+                        (doc.get('_rev') and (old is None or old['_rev'] != doc['_rev'])):
+                    statuses.append(conflict(doc['_id']))
+                    continue
+                statuses.append(self._put(doc))
+        return statuses
+
+    def bulk_delete(self, doc_ids):
+        with self.store.lock:
+            return [self._remove(doc_id) for doc_id in doc_ids]
+
+    def remove_all(self, mode):
+        store = self.store
+        with store.lock:
+            store.docs.clear()
+            for values in store.values.values():
+                values.clear()
+            store.seq += 1
+
+    def update_seq(self):
+        return self.store.seq
+
+    def create_indexes(self, indexes):
+        store = self.store
+        with store.lock:
+            store.indexes.update(indexes)
+            for fields in indexes.values():
+                for field in fields:
+                    if field not in store.values:
+                        store.values[field] = {}
+                        for doc in store.docs.values():
+                            if field in doc:
+                                store.values[field].setdefault(
+                                    store.key(doc[field]), set()).add(doc['_id'])
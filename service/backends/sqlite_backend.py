@@ -0,0 +1,221 @@
+"""
+SQLite storage backend
+
+SQLiteBackend - keeps the Customers as JSON in a SQLite table, with a
+                column and a SQL index for each indexed field
+"""
+import os
+import re
+import json
+import sqlite3
+import threading
+from .base import (StorageBackend, ConflictError, new_id, next_rev, conflict,
+                   matches, project)
+
+# the SQLite database file, the default keeps it in memory
+SQLITE_PATH = os.environ.get('SQLITE_PATH', ':memory:')
+
+# the selector operators an indexed column can narrow, matches() checks the rest
+SQL_OPERATORS = {'$eq': '=', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+
+class SQLiteBackend(StorageBackend):
+    """ Stores documents in a SQLite table named after the database """
+
+    def __init__(self, dbname='customers', path=None):
+        self.table = '"{}"'.format(re.sub(r'\W', '_', dbname))
+        self.connection = sqlite3.connect(path or SQLITE_PATH,
+                                          check_same_thread=False)
+        self.lock = threading.RLock()
+        self.fields = []
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY, '
+                'rev TEXT NOT NULL, doc TEXT NOT NULL)'.format(self.table))
+            # one write counter per table, read by update_seq
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS update_seq (name TEXT PRIMARY KEY, '
+                'seq INTEGER NOT NULL)')
+            self.connection.execute(
+                'INSERT OR IGNORE INTO update_seq (name, seq) VALUES (?, 0)', (self.table,))
+            for column in self.connection.execute(
+                    'PRAGMA table_info({})'.format(self.table)):
+                if column[1].startswith('f_'):
+                    self.fields.append(column[1][2:])
+
+    def _column_values(self, doc):
+        """ Returns the values of the indexed columns for a document """
+        return [doc.get(field) if isinstance(doc.get(field), (int, float, str, type(u'')))
+                else None for field in self.fields]
+
+    def _bump_seq(self):
+        """ Counts a write to the table """
+        self.connection.execute(
+            'UPDATE update_seq SET seq = seq + 1 WHERE name = ?', (self.table,))
+
+    def _put(self, doc):
+        """ Writes doc with a new revision and returns the status """
+        row = self.connection.execute(
+            'SELECT rev FROM {} WHERE id = ?'.format(self.table), (doc['_id'],)).fetchone()
+        doc = dict(doc)
+        doc['_rev'] = next_rev(row[0] if row else None)
+        columns = ''.join(', "f_{}"'.format(field) for field in self.fields)
+        marks = ', ?' * len(self.fields)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO {} (id, rev, doc{}) VALUES (?, ?, ?{})'.format(
+                self.table, columns, marks),
+            [doc['_id'], doc['_rev'], json.dumps(doc)] + self._column_values(doc))
+        self._bump_seq()
+        return {'id': doc['_id'], 'rev': doc['_rev'], 'ok': True}
+
+    def _remove(self, doc_id):
+        """ Deletes a document and returns the status """
+        cursor = self.connection.execute(
+            'DELETE FROM {} WHERE id = ?'.format(self.table), (doc_id,))
+        if not cursor.rowcount:
+            return {'id': doc_id, 'error': 'not_found', 'reason': 'missing'}
+        self._bump_seq()
+        return {'id': doc_id, 'ok': True}
+
+    def create(self, doc):
+        doc = dict(doc)
+        doc.setdefault('_id', new_id())
+        with self.lock, self.connection:
+            return self._put(doc)['id']
+
+    def update(self, doc):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT rev FROM {} WHERE id = ?'.format(self.table), (doc['_id'],)).fetchone()
+            if doc.get('_rev') and (row is None or row[0] != doc['_rev']):
+                raise ConflictError('Document update conflict: {}'.format(doc['_id']))
+            if row is not None:
+                return self._put(doc)['rev']
+        return None
+
+    def delete(self, doc_id):
+        with self.lock, self.connection:
+            self._remove(doc_id)
+
+    def get(self, doc_id):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT doc FROM {} WHERE id = ?'.format(self.table), (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _where(self, selector):
+        """ Returns the conditions on indexed columns that narrow a selector """
+        where = []
+        params = []
+        for field, condition in selector.items():
+            if field not in self.fields:
+                continue
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for operator, argument in condition.items():
+                if operator == '$in' and argument:
+                    where.append('"f_{}" IN ({})'.format(field, ', '.join('?' * len(argument))))
+                    params.extend(argument)
+                elif operator in SQL_OPERATORS and argument is not None:
+                    where.append('"f_{}" {} ?'.format(field, SQL_OPERATORS[operator]))
+                    params.append(argument)
+        return where, params
+
+    def find(self, selector, index=None, fields=None):
+        where, params = self._where(selector)
+        sql = 'SELECT doc FROM {}'.format(self.table)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        # the columns only narrow the search, check every field exactly
+        docs = (json.loads(row[0]) for row in rows)
+        return [project(doc, fields) for doc in docs if matches(selector, doc)]
+
+    def page(self, selector, limit, cursor=None, index=None, fields=None):
+        # the cursor is the id the next page starts at
+        where, params = self._where(selector)
+        sql = 'SELECT id, doc FROM {} WHERE {} ORDER BY id LIMIT ?'.format(
+            self.table, ' AND '.join(where + ['id >= ?']))
+        docs = []
+        start = cursor or ''
+        # rows only narrowed by the columns may not match, so read on
+        # until there is one document more than the page holds
+        while len(docs) <= limit:
+            with self.lock:
+                rows = self.connection.execute(sql, params + [start, limit + 1]).fetchall()
+            for row in rows:
+                doc = json.loads(row[1])
+                if matches(selector, doc):
+                    docs.append(doc)
+            if len(rows) <= limit:
+                break
+            start = rows[-1][0] + u'\u0000'
+        next_cursor = docs[limit]['_id'] if len(docs) > limit else None
+        return [project(doc, fields) for doc in docs[:limit]], next_cursor
+
+    def all_docs(self, batch_size, fields=None):
+        last_id = ''
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    'SELECT id, doc FROM {} WHERE id > ? ORDER BY id LIMIT ?'.format(self.table),
+                    (last_id, batch_size)).fetchall()
+            for row in rows:
+                yield project(json.loads(row[1]), fields)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def bulk_save(self, docs, update=True):
+        with self.lock, self.connection:
+            statuses = []
+            for doc in docs:
+                doc = dict(doc)
+                doc.setdefault('_id', new_id())
+                row = self.connection.execute(
+                    'SELECT rev FROM {} WHERE id = ?'.format(self.table), (doc['_id'],)).fetchone()
+                # a document with a _rev only replaces that revision
+                if (row is not None and not update) or \
+                        (doc.get('_rev') and (row is None or row[0] != doc['_rev'])):
+                    statuses.append(conflict(doc['_id']))
+                    continue
+                statuses.append(self._put(doc))
+            return statuses
+
+    def bulk_delete(self, doc_ids):
+        with self.lock, self.connection:
+            return [self._remove(doc_id) for doc_id in doc_ids]
+
+    def remove_all(self, mode):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM {}'.format(self.table))
+            self._bump_seq()
+
+    def update_seq(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT seq FROM update_seq WHERE name = ?', (self.table,)).fetchone()[0]
+
+    def create_indexes(self, indexes):
+        with self.lock, self.connection:
+            for name, fields in sorted(indexes.items()):
+                for field in fields:
+                    if field not in self.fields:
+                        self._add_column(field)
+                self.connection.execute('CREATE INDEX IF NOT EXISTS "{}_{}" ON {} ({})'.format(
+                    self.table.strip('"'), re.sub(r'\W', '_', name), self.table,
+                    ', '.join('"f_{}"'.format(field) for field in fields)))
+
+    def _add_column(self, field):
+        """ Adds a column for field and fills it from the stored documents """
+        self.connection.execute('ALTER TABLE {} ADD COLUMN "f_{}"'.format(self.table, field))
+        self.fields.append(field)
+        rows = self.connection.execute('SELECT id, doc FROM {}'.format(self.table)).fetchall()
+        for doc_id, doc in rows:
+            value = self._column_values(json.loads(doc))[-1]
+            self.connection.execute('UPDATE {} SET "f_{}" = ? WHERE id = ?'.format(
+                self.table, field), (value, doc_id))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,89 @@
+"""
+Cache for Customer documents
+
+LRUCache - a size bounded, thread safe, least recently used cache whose
+           entries also expire after a time to live
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Least recently used cache with a time to live
+
+    A maxsize of 0 disables the cache: nothing is stored and every get
+    is a miss.
+    """
+
+    def __init__(self, maxsize=1000, ttl=60, clock=time.time):
+        """ Initialize the cache
+
+        Args:
+            maxsize (int): the most entries kept before evicting
+            ttl (float): seconds an entry stays valid
+            clock (callable): returns the current time in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """ Returns the cached value for key or None """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires <= self._clock():
+                self.expirations += 1
+                self.misses += 1
+                return None
+            # re-insert to mark it as the most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """ Stores a value, evicting the least recently used entries """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, self._clock() + self.ttl)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """ Removes a key from the cache """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """ Removes every entry from the cache """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """ Returns the counters and settings of the cache """
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,84 @@
+"""
+Changes feed follower
+
+ChangesFollower - a background thread that follows the _changes feed of
+                  a database so that per-process caches can evict the
+                  documents that other workers and instances wrote
+"""
+import logging
+import threading
+
+
+class ChangesFollower(threading.Thread):
+    """
+    Follows the continuous _changes feed of a database
+
+    Every change is passed to a callback. When the feed drops the
+    follower reconnects, with a growing delay, and resumes from the last
+    seq it saw so no change is missed.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, database, callback, since='now', heartbeat=30000,
+                 retry_delay=1, max_retry_delay=60, include_docs=False):
+        """ Initialize the follower
+
+        Args:
+            database: the cloudant database to follow
+            callback (callable): called with each change dict
+            since: the seq to start after, 'now' skips the history
+            heartbeat (int): milliseconds between keep-alive lines
+            retry_delay (float): seconds to wait before the first reconnect
+            max_retry_delay (float): the longest wait between reconnects
+            include_docs (bool): True to pass each change with its doc
+        """
+        super(ChangesFollower, self).__init__(name='changes-follower')
+        self.daemon = True
+        self.database = database
+        self.callback = callback
+        self.since = since
+        self.heartbeat = heartbeat
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.include_docs = include_docs
+        self.reconnects = 0
+        self._stopped = threading.Event()
+        self._feed = None
+
+    def run(self):
+        """ Follows the feed until stopped, reconnecting when it fails """
+        delay = self.retry_delay
+        while not self._stopped.is_set():
+            try:
+                self.follow()
+                delay = self.retry_delay
+            except Exception as err:    # pylint: disable=broad-except
+                ChangesFollower.logger.warning(
+                    'Changes feed failed, resuming from %s in %ss: %s',
+                    self.since, delay, err)
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+            if not self._stopped.is_set():
+                self.reconnects += 1
+
+    def follow(self):
+        """ Reads the feed from the last seen seq until it ends """
+        self._feed = self.database.changes(feed='continuous',
+                                           since=self.since,
+                                           heartbeat=self.heartbeat,
+                                           include_docs=self.include_docs)
+        for change in self._feed:
+            if self._stopped.is_set():
+                return
+            if not change or 'seq' not in change:
+                continue    # heartbeat or a line we do not understand
+            self.callback(change)
+            self.since = change['seq']
+        if self._feed.last_seq:
+            self.since = self._feed.last_seq
+
+    def stop(self):
+        """ Stops following the feed """
+        self._stopped.set()
+        if self._feed is not None:
+            self._feed.stop()
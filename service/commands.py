@@ -0,0 +1,71 @@
+"""
+Command line tools of the service
+
+Run with the flask command, for example:
+  FLASK_APP=service flask export-customers customers.ndjson
+  FLASK_APP=service flask import-customers customers.ndjson
+
+Both use the storage backend of STORAGE_BACKEND, like the service does.
+"""
+import os
+import json
+import click
+from service import app, boot
+from service.models import Customer
+from service.transfer import (EXPORTERS, READERS, EXPORT_BATCH_SIZE,
+                              IMPORT_BATCH_SIZE, IMPORT_WORKERS, Importer,
+                              CheckpointError, fingerprint)
+
+
+def connect():
+    """ Opens the database, unless it is already open """
+    if Customer.backend is None:
+        boot()
+
+
+def format_of(path, name):
+    """ Returns the format asked for, or the one of the file extension """
+    if name:
+        return name
+    return 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'ndjson'
+
+
+@app.cli.command('export-customers')
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'name', type=click.Choice(sorted(EXPORTERS)),
+              help='ndjson or csv, by default from the file extension')
+def export_customers(output, name):
+    """ Writes every Customer to OUTPUT """
+    connect()
+    name = format_of(output, name)
+    with open(output, 'wb') as export:
+        for chunk in EXPORTERS[name](Customer.all(batch_size=EXPORT_BATCH_SIZE)):
+            export.write(chunk)
+    click.echo('Exported Customers to {} as {}'.format(output, name))
+
+
+@app.cli.command('import-customers')
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'name', type=click.Choice(sorted(READERS)),
+              help='ndjson or csv, by default from the file extension')
+@click.option('--checkpoint', help='progress file, SOURCE.checkpoint by default')
+@click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+              help='rows per _bulk_docs request')
+@click.option('--workers', type=int, default=IMPORT_WORKERS,
+              help='batches written at the same time')
+def import_customers(source, name, checkpoint, batch_size, workers):
+    """ Imports the Customers of SOURCE, resuming from its checkpoint
+
+    Run it again after it was interrupted and the rows that were written
+    are skipped. The checkpoint is removed once the import is done.
+    """
+    connect()
+    name = format_of(source, name)
+    importer = Importer(checkpoint or source + '.checkpoint', batch_size, workers)
+    with open(source, 'rb') as lines:
+        source_print, lines = fingerprint(lines, os.path.getsize(source))
+        try:
+            progress = importer.run(READERS[name](lines), source_print)
+        except CheckpointError as error:
+            raise click.ClickException(str(error))
+    click.echo(json.dumps(progress, indent=2, sort_keys=True))
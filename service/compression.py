@@ -0,0 +1,152 @@
+"""
+Response compression
+
+Compressor - compresses responses with brotli, when the brotli package is
+             installed, or gzip, whichever the client prefers in its
+             Accept-Encoding header
+
+Only text bodies of at least COMPRESS_MIN_SIZE bytes are compressed, so
+small responses are not slowed down for nothing. A streamed response, like
+?stream=true or an export, is compressed chunk by chunk and each chunk is
+flushed, so the client still gets the Customers as they are read.
+"""
+import os
+import zlib
+try:
+    import brotli
+except ImportError:
+    brotli = None
+from flask import request
+
+# COMPRESSION=False turns it off
+COMPRESSION = os.environ.get('COMPRESSION', 'True').lower() == 'true'
+# bodies smaller than this many bytes are sent as they are
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+# gzip level from 1 (fastest) to 9 (smallest) and brotli quality from 0 to 11
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv',
+                      'text/plain', 'text/html', 'text/css', 'application/javascript')
+
+# gzip framing around the deflate stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class GzipStream(object):
+    """ Compresses a body piece by piece into one gzip stream """
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    def process(self, data):
+        """ Returns the compressed data, flushed so it can be sent now """
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """ Returns the end of the stream """
+        return self._compressor.flush()
+
+
+class BrotliStream(object):
+    """ Compresses a body piece by piece into one brotli stream """
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data):
+        """ Returns the compressed data, flushed so it can be sent now """
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        """ Returns the end of the stream """
+        return self._compressor.finish()
+
+
+class Compressor(object):
+    """ Compresses the responses of an app for the clients that accept it """
+
+    def __init__(self, enabled=COMPRESSION, min_size=COMPRESS_MIN_SIZE, level=COMPRESS_LEVEL,
+                 brotli_quality=BROTLI_QUALITY, mimetypes=COMPRESS_MIMETYPES):
+        """ Initialize the compressor
+
+        Args:
+            enabled (bool): False to never compress
+            min_size (int): the smallest body compressed, in bytes
+            level (int): the gzip compression level
+            brotli_quality (int): the brotli quality
+            mimetypes (tuple): the content types that are compressed
+        """
+        self.enabled = enabled
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = mimetypes
+
+    @property
+    def encodings(self):
+        """ Returns the encodings offered, preferred first """
+        return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def init_app(self, app):
+        """ Hooks the compressor into a Flask app when it is enabled """
+        if not self.enabled:
+            return
+        app.after_request(self.compress)
+
+    def stream(self, encoding):
+        """ Returns a new compression stream of an encoding """
+        if encoding == 'br':
+            return BrotliStream(self.brotli_quality)
+        return GzipStream(self.level)
+
+    def compressible(self, response):
+        """ Checks if a response may be compressed at all """
+        return (200 <= response.status_code < 300 and response.status_code != 204
+                and request.method != 'HEAD'
+                and not response.direct_passthrough
+                and 'Content-Encoding' not in response.headers
+                and response.mimetype in self.mimetypes
+                and 'no-transform' not in response.headers.get('Cache-Control', ''))
+
+    def compress(self, response):
+        """ Compresses a response with the encoding the client prefers """
+        if not self.compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self.chunks(response.response, self.stream(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            stream = self.stream(encoding)
+            response.set_data(stream.process(data) + stream.finish())
+        response.headers['Content-Encoding'] = encoding
+        # the compressed bytes differ, so a strong tag can only be weak now
+        tag, weak = response.get_etag()
+        if tag and not weak:
+            response.set_etag(tag, weak=True)
+        return response
+
+    @staticmethod
+    def chunks(body, stream):
+        """ Generator of the compressed chunks of a streamed body """
+        try:
+            for chunk in body:
+                if not chunk:
+                    continue
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                yield stream.process(chunk)
+            yield stream.finish()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+# the compressor of the service, configured from the environment
+compressor = Compressor()
@@ -0,0 +1,81 @@
+"""
+Fast JSON encoding
+
+dumps       - encodes a document as JSON text with orjson or ujson, when
+              one of them is installed, or with the json module
+output_json - the JSON representation of the Apis, which encodes every
+              response body with dumps
+
+JSON_ENCODER names the library to use; 'auto', the default, picks the
+fastest one installed. A document the library cannot encode, like an
+integer too large for it, is encoded by the json module instead, so the
+choice of library only changes the speed.
+"""
+import os
+import json
+import logging
+from flask import make_response
+
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto').lower()
+# the libraries 'auto' tries, fastest first
+PREFERENCE = ('orjson', 'ujson', 'json')
+
+logger = logging.getLogger(__name__)
+
+
+def load(name):
+    """ Returns the encode function of a JSON library
+
+    Raises:
+        ImportError: when the library is not installed
+        ValueError: when there is no such library
+    """
+    if name == 'orjson':
+        import orjson
+        return lambda document: orjson.dumps(document).decode('utf-8')
+    if name == 'ujson':
+        import ujson
+        return lambda document: ujson.dumps(document, escape_forward_slashes=False)
+    if name == 'json':
+        return json.dumps
+    raise ValueError('Unknown JSON encoder: {}'.format(name))
+
+
+def use(name):
+    """ Makes dumps use a JSON library, or the fastest one for 'auto'
+
+    Returns:
+        the name of the library used, which is 'json' when the one asked
+        for is not installed
+    """
+    global encoder, _encode    # pylint: disable=global-statement
+    for candidate in PREFERENCE if name == 'auto' else (name, 'json'):
+        try:
+            _encode = load(candidate)
+        except ImportError:
+            if candidate == name:
+                logger.warning('JSON encoder %s is not installed, using json', name)
+            continue
+        encoder = candidate
+        return encoder
+
+
+# the name of the library dumps uses
+encoder = 'json'
+_encode = json.dumps
+use(JSON_ENCODER)
+
+
+def dumps(document):
+    """ Returns a document as JSON text """
+    try:
+        return _encode(document)
+    except (TypeError, OverflowError):
+        return json.dumps(document)
+
+
+def output_json(data, code, headers=None):
+    """ Makes a Flask response with a JSON encoded body """
+    response = make_response(dumps(data) + '\n', code)
+    response.headers.extend(headers or {})
+    return response
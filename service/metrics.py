@@ -0,0 +1,91 @@
+"""
+Prometheus metrics of the Customer Service
+
+The request counters, latency histograms and in-flight gauge are
+recorded by the hooks of the Flask app, and the operation histogram by
+the timed decorator on the Customer data-layer methods. When gunicorn
+runs several workers, prometheus_multiproc_dir (set by gunicorn.conf.py)
+makes each worker write its metrics to files that /metrics adds up.
+"""
+import os
+import time
+from functools import wraps
+from inspect import isgeneratorfunction
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry,
+                               REGISTRY, CONTENT_TYPE_LATEST, generate_latest)
+from prometheus_client import multiprocess
+
+REQUESTS = Counter('customers_http_requests_total',
+                   'HTTP requests served', ['method', 'route', 'status'])
+REQUEST_LATENCY = Histogram('customers_http_request_duration_seconds',
+                            'Seconds from the request to the response headers',
+                            ['method', 'route', 'status'])
+IN_FLIGHT = Gauge('customers_http_requests_in_flight',
+                  'HTTP requests being served', multiprocess_mode='livesum')
+OPERATION_LATENCY = Histogram('customers_operation_duration_seconds',
+                              'Seconds spent in each Customer data-layer operation',
+                              ['operation'])
+
+
+def timed(operation):
+    """ Decorator that records the duration of a data-layer operation
+
+    A generator is timed while it runs, across all of its items, and not
+    while its caller works on them.
+    """
+    histogram = OPERATION_LATENCY.labels(operation)
+
+    def decorator(function):
+        if isgeneratorfunction(function):
+            @wraps(function)
+            def generator(*args, **kwargs):
+                spent = 0.0
+                items = function(*args, **kwargs)
+                try:
+                    while True:
+                        started = time.time()
+                        try:
+                            item = next(items)
+                        finally:
+                            spent += time.time() - started
+                        yield item
+                except StopIteration:
+                    pass
+                finally:
+                    items.close()
+                    histogram.observe(spent)
+            return generator
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time():
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_request():
+    """ Counts a request in flight and returns when it started """
+    IN_FLIGHT.inc()
+    return time.time()
+
+
+def end_request(method, route, status, started):
+    """ Records a served request """
+    REQUESTS.labels(method, route, status).inc()
+    REQUEST_LATENCY.labels(method, route, status).observe(time.time() - started)
+
+
+def finish_request():
+    """ Counts a request out of flight """
+    IN_FLIGHT.dec()
+
+
+def latest():
+    """ Returns the metrics of every worker in the text format, and its type """
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
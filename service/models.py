@@ -22,25 +22,34 @@ Customer - A Customer used in the Customer Store
 
 """
 import os
-import json
 import logging
-import time
 import random
-from cloudant.client import Cloudant
-from cloudant.query import Query
-from requests import HTTPError, ConnectionError
-from retry import retry
+from itertools import islice
+from requests import HTTPError
+from .cache import LRUCache
+from .metrics import timed
+from .query import compile_query, indexable_fields
+from .search import SearchIndex, IndexNotReady, SearchDisabled, SEARCH_FIELDS
+from .backends import BACKENDS, CloudantBackend, ConflictError
 
 # get configruation from enviuronment (12-factor)
-ADMIN_PARTY = os.environ.get('ADMIN_PARTY', 'False').lower() == 'true'
-CLOUDANT_HOST = os.environ.get('CLOUDANT_HOST', 'localhost')
-CLOUDANT_USERNAME = os.environ.get('CLOUDANT_USERNAME', 'admin')
-CLOUDANT_PASSWORD = os.environ.get('CLOUDANT_PASSWORD', 'pass')
-
-if 'VCAP_SERVICES' in os.environ or 'BINDING_CLOUDANT' in os.environ:
-    WAIT_SECONDS = 0.5
-else:
-    WAIT_SECONDS = 0
+# number of documents fetched per _all_docs request when listing customers
+ALL_DOCS_BATCH_SIZE = int(os.environ.get('ALL_DOCS_BATCH_SIZE', '100'))
+# number of documents sent per _bulk_docs request by save_many/delete_many
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '500'))
+# how remove_all truncates the database: 'bulk' deletes or 'recreate'
+REMOVE_ALL_MODE = os.environ.get('REMOVE_ALL_MODE', 'bulk')
+# read-through cache in front of Customer.find, CACHE_SIZE=0 turns it off
+CACHE_SIZE = int(os.environ.get('CACHE_SIZE', '1000'))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '30'))
+# follow the _changes feed so the cache sees writes from other processes
+CHANGES_FEED = os.environ.get('CHANGES_FEED', 'True').lower() == 'true'
+# keep the typeahead search index in every worker, about 2.7 KB per Customer
+SEARCH_INDEX = os.environ.get('SEARCH_INDEX', 'False').lower() == 'true'
+# the most Customers the search index holds, searches are turned down past it
+SEARCH_INDEX_MAX_DOCS = int(os.environ.get('SEARCH_INDEX_MAX_DOCS', '10000'))
+# number of documents fetched per request when the search index is built
+SEARCH_BUILD_BATCH_SIZE = int(os.environ.get('SEARCH_BUILD_BATCH_SIZE', '1000'))
 
 
 class DataValidationError(Exception):
@@ -48,15 +57,79 @@ class DataValidationError(Exception):
     pass
 
 
+# The fields of a Customer, shared with the Swagger model in service/__init__.py:
+# (name, flask_restplus field type, description)
+CUSTOMER_FIELDS = (
+    ('first_name', 'String', 'The first name of a Customer'),
+    ('last_name', 'String', 'The last name of a Customer'),
+    ('address', 'String', 'The address of a Customer'),
+    ('email', 'String', 'The email of a Customer'),
+    ('username', 'String', 'The username of a Customer'),
+    ('password', 'String', 'The password of a Customer'),
+    ('phone_number', 'String', 'The phone_number of a Customer'),
+    ('active', 'String', 'The active status of a Customer'),
+    ('id', 'Integer', 'The ID of a Customer'),
+)
+FIELD_NAMES = tuple(field[0] for field in CUSTOMER_FIELDS)
+
+# the kinds the query parameters are converted to; active is documented
+# as a String but stored as a boolean, or as "False" by the disable action,
+# so a filter on it matches each way of writing the value
+QUERY_KINDS = dict(((name, kind) for name, kind, _ in CUSTOMER_FIELDS), active='Boolean')
+QUERY_SPELLINGS = {'active': lambda value: [value, str(value), str(value).lower()]}
+
+
+def as_string(value):
+    """ Formats a value like a flask_restplus String field """
+    return None if value is None else unicode(value)
+
+
+def as_integer(value):
+    """ Formats a value like a flask_restplus Integer field """
+    return None if value is None else int(value)
+
+
+# how the API formats each field of a Customer, after its Swagger model
+API_FORMATS = dict(((name, {'String': as_string, 'Integer': as_integer}[kind])
+                    for name, kind, _ in CUSTOMER_FIELDS), _id=as_string)
+
+
+def chunks(items, size):
+    """ Splits any iterable into lists of at most size items """
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 class Customer(object):
     """
     Class that represents a Customer
 
     This version uses an in-memory collection of customers for testing
     """
+    __slots__ = FIELD_NAMES + ('_id', '_rev')
+
     logger = logging.getLogger(__name__)
+    backend = None
+    # the Cloudant client and database when backend is a CloudantBackend
     client = None
     database = None
+    cache = LRUCache(CACHE_SIZE, CACHE_TTL)
+    # typeahead index over SEARCH_FIELDS, only built when search is enabled
+    search_enabled = SEARCH_INDEX
+    search_index = SearchIndex(max_docs=SEARCH_INDEX_MAX_DOCS)
+
+    # Mango JSON indexes created by init_db: design document -> fields
+    indexes = {
+        'username-index': ['username'],
+        'address-index': ['address'],
+        'email-index': ['email'],
+        'last-name-index': ['last_name'],
+        'id-index': ['id'],
+    }
 
     def __init__(self, first_name='', last_name='',
                  address='', email='', username='', password='',
@@ -64,6 +137,7 @@ class Customer(object):
         """ Initialize a Customer. """
         self.id = id
         self._id = None
+        self._rev = None
         self.first_name = first_name
         self.last_name = last_name
         self.address = address
@@ -73,7 +147,7 @@ class Customer(object):
         self.phone_number = phone_number
         self.active = active
 
-    @retry(HTTPError, delay=1, backoff=2, tries=5)
+    @timed('create')
     def create(self):
         """
         Creates a new Customer in the database POST
@@ -81,29 +155,31 @@ class Customer(object):
         if self.username is None:   # name is the only required field
             raise DataValidationError('username attribute is not set')
 
+        doc = self.serialize()
         try:
-            document = self.database.create_document(self.serialize())
+            self._id = Customer.backend.create(doc)
         except HTTPError as err:
             Customer.logger.warning('Create failed: %s', err)
             return
+        Customer.search_index.add(self._id, doc)
 
-        if document.exists():
-            self._id = str(document['_id'])
-
-    @retry(HTTPError, delay=1, backoff=2, tries=5)
+    @timed('update')
     def update(self):
         """
         Updates a Customer in the database
+
+        The write only succeeds if the stored revision is still the _rev
+        this Customer was read with, otherwise ConflictError is raised
         """
+        doc = self.serialize()
         try:
-            document = self.database[self._id]
-        except KeyError:
-            document = None
-        if document:
-            document.update(self.serialize())
-            document.save()
-
-    @retry(HTTPError, delay=1, backoff=2, tries=5)
+            rev = Customer.backend.update(doc)
+        finally:
+            Customer.cache.invalidate(self._id)
+        if rev:
+            self._rev = rev
+        Customer.search_index.add(self._id, doc)
+
     def save(self):
         """
         Saves a Customer to the data store
@@ -115,18 +191,21 @@ class Customer(object):
         else:
             self.create()
 
-    @retry(HTTPError, delay=2, backoff=3, tries=5)
+    @timed('delete')
     def delete(self):
-        """ Removes a Customer from the data store """
-        # Customer.data.remove(self)
+        """ Removes a Customer from the data store
+
+        Raises ConflictError when the Customer was changed while it was deleted
+        """
         try:
-            document = self.database[self._id]
-        except KeyError:
-            document = None
-        if document:
-            document.delete()
+            Customer.backend.delete(self._id)
+        finally:
+            Customer.cache.invalidate(self._id)
+        Customer.search_index.remove(self._id)
+
+    # serialize, to_api and deserialize run once per document on list endpoints,
+    # so they spell out every field of CUSTOMER_FIELDS instead of looping
 
-    @retry(HTTPError, delay=2, backoff=3, tries=5)
     def serialize(self):
         """ serializes a Customer into a dictionary """
         customer = {"id": self.id,
@@ -142,9 +221,35 @@ class Customer(object):
 
         if self._id:
             customer['_id'] = self._id
+        if self._rev:
+            customer['_rev'] = self._rev
         return customer
 
-    @retry(HTTPError, delay=1, backoff=2, tries=5)
+    def to_api(self, fields=None):
+        """
+        Returns the Customer as the API sends it
+
+        This is what marshal() with the Customer model returns, without
+        marshal() looking up and calling a field object per value, since
+        a Customer already holds every field of the model.
+
+        Args:
+            fields (list): the only fields returned, None returns them all
+        """
+        if fields is not None:
+            return dict((name, API_FORMATS[name](getattr(self, name))) for name in fields)
+        return {"_id": as_string(self._id),
+                "id": as_integer(self.id),
+                "first_name": as_string(self.first_name),
+                "last_name": as_string(self.last_name),
+                "address": as_string(self.address),
+                "email": as_string(self.email),
+                "username": as_string(self.username),
+                "password": as_string(self.password),
+                "phone_number": as_string(self.phone_number),
+                "active": as_string(self.active)
+                }
+
     def deserialize(self, data):
         """
         Deserializes a Customer from a dictionary
@@ -152,10 +257,8 @@ class Customer(object):
         Args:
             data (dict): A dictionary containing the Customer data
         """
-        Customer.logger.info(data)
         try:
-            print("data is: ", data)
-            self.id = data.get("id", random.randint(5, 1000))
+            self.id = data["id"] if "id" in data else random.randint(5, 1000)
             self.first_name = data["first_name"]
             self.last_name = data["last_name"]
             self.address = data["address"]
@@ -166,77 +269,326 @@ class Customer(object):
             self.active = data["active"]
         except KeyError as error:
             raise DataValidationError('Invalid customer: missing ' + error.args[0])
-        except TypeError as error:
+        except (TypeError, AttributeError):
             raise DataValidationError('Invalid customer: body of request contained bad or no data')
 
         if "_id" in data:
             self._id = data["_id"]
+        if "_rev" in data:
+            self._rev = data["_rev"]
+        return self
+
+    def deserialize_fields(self, data):
+        """
+        Deserializes the fields a projected document has, and leaves the
+        others at their defaults
+
+        Args:
+            data (dict): A document read with only some of its fields
+        """
+        for name in FIELD_NAMES:
+            if name in data:
+                setattr(self, name, data[name])
+        if "_id" in data:
+            self._id = data["_id"]
+        if "_rev" in data:
+            self._rev = data["_rev"]
         return self
 
+    @staticmethod
+    def from_doc(doc, fields=None):
+        """ Returns the Customer in a document read with the given fields """
+        if fields is None:
+            return Customer().deserialize(doc)
+        return Customer().deserialize_fields(doc)
+
+    @staticmethod
+    def projection(fields):
+        """ Returns the document fields to read for the Customer fields, or None for all """
+        if fields is None:
+            return None
+        return list(fields) if '_id' in fields else list(fields) + ['_id']
+
 ######################################################################
 #  S T A T I C   D A T A B S E   M E T H O D S
 ######################################################################
 
     @classmethod
-    def remove_all(cls):
-        """ Removes all documents from the database (use for testing)  """
-        for document in cls.database:
-            time.sleep(WAIT_SECONDS)
-            document.delete()
+    @timed('save_many')
+    def save_many(cls, customers, chunk_size=None, update=True):
+        """
+        Saves many Customers with batched writes (_bulk_docs on Cloudant)
 
+        Customers that have an _id are updated and the rest are created.
+        A Customer read at a revision that is no longer the current one is
+        a conflict, like with save(). A document that fails does not stop
+        the others from being written.
+
+        Args:
+            customers (iterable): the Customers to save
+            chunk_size (int): number of documents sent per request
+            update (bool): False to only create Customers, so one whose _id
+                is taken is a conflict
+        Returns:
+            one result per Customer, in order: a dict with the '_id' and
+            either 'ok' or an 'error' and its 'reason'
+        """
+        results = []
+        for chunk in chunks(customers, chunk_size or BULK_CHUNK_SIZE):
+            results.extend(cls._save_chunk(chunk, update))
+        return results
+
+    @classmethod
+    def _save_chunk(cls, chunk, update=True):
+        """ Saves one chunk of Customers in a single bulk write """
+        results = [None] * len(chunk)
+        pending = []
+        for position, customer in enumerate(chunk):
+            if customer.username is None:
+                results[position] = {'_id': customer._id, 'error': 'invalid',
+                                     'reason': 'username attribute is not set'}
+            else:
+                pending.append(position)
+        if not pending:
+            return results
+
+        docs = [chunk[position].serialize() for position in pending]
+        for position, doc, status in zip(pending, docs, cls.backend.bulk_save(docs, update)):
+            results[position] = cls._bulk_result(status)
+            if 'ok' in results[position]:
+                chunk[position]._id = status['id']
+                chunk[position]._rev = status.get('rev')
+                cls.cache.invalidate(status['id'])
+                cls.search_index.add(status['id'], doc)
+        return results
 
     @classmethod
-    def all(cls):
-        """ Query that returns all Customers """
+    @timed('delete_many')
+    def delete_many(cls, customers, chunk_size=None):
+        """
+        Removes many Customers with batched writes (_bulk_docs on Cloudant)
+
+        Args:
+            customers (iterable): the Customers to delete
+            chunk_size (int): number of documents sent per request
+        Returns:
+            one result per Customer, in order, like save_many
+        """
         results = []
-        for doc in cls.database:
-            time.sleep(WAIT_SECONDS)
-            customer = Customer().deserialize(doc)
-            results.append(customer)
+        for chunk in chunks(customers, chunk_size or BULK_CHUNK_SIZE):
+            statuses = cls.backend.bulk_delete([customer._id for customer in chunk])
+            for customer, status in zip(chunk, statuses):
+                cls.cache.invalidate(customer._id)
+                if 'error' not in status:
+                    cls.search_index.remove(customer._id)
+                results.append(cls._bulk_result(status))
         return results
 
+    @staticmethod
+    def _bulk_result(status):
+        """ Converts a bulk write status into a save_many/delete_many result """
+        if 'error' in status:
+            return {'_id': status.get('id'), 'error': status['error'],
+                    'reason': status.get('reason', '')}
+        return {'_id': status['id'], 'ok': True}
+
+    @classmethod
+    def remove_all(cls, mode=None):
+        """
+        Removes all Customers from the database (use for testing)
+
+        The indexes are always kept.
+
+        Args:
+            mode (string): on Cloudant 'bulk' deletes the documents with
+                large _bulk_docs batches and 'recreate' drops and recreates
+                the database; defaults to REMOVE_ALL_MODE
+        """
+        mode = mode or REMOVE_ALL_MODE
+        if mode not in ('bulk', 'recreate'):
+            raise DataValidationError('Unknown remove_all mode: {}'.format(mode))
+        cls.backend.remove_all(mode)
+        cls._use_backend(cls.backend)
+        cls.cache.clear()
+        cls.search_index.clear()
+
+    @classmethod
+    @timed('all')
+    def all(cls, batch_size=None, fields=None):
+        """ Generator that yields all Customers
+
+        Documents are read in pages of batch_size (from _all_docs on
+        Cloudant) so only one page is held in memory at a time.
+
+        Args:
+            batch_size (int): number of documents fetched per request
+            fields (list): the only fields to read, the others keep
+                their defaults; None reads them all
+        """
+        projection = cls.projection(fields)
+        for doc in cls.backend.all_docs(batch_size or ALL_DOCS_BATCH_SIZE, projection):
+            yield cls.from_doc(doc, projection)
+
 ######################################################################
 #  F I N D E R   M E T H O D S
 ######################################################################
     @classmethod
+    def index_for(cls, selector):
+        """ Returns the declared index that best covers a selector
+
+        An index can serve the query when all of its fields have an
+        equality, $in or range condition in the selector; the one
+        covering the most fields wins.
+
+        Args:
+            selector (dict): a Mango selector
+        Returns:
+            the design document name of the index or None
+        """
+        fields = indexable_fields(selector)
+        best = None
+        for name, index_fields in cls.indexes.items():
+            if not set(index_fields) <= fields:
+                continue
+            if best is None or len(index_fields) > len(cls.indexes[best]):
+                best = name
+        return best
+
+    @classmethod
+    def _query(cls, selector, fields=None):
+        """ Returns the documents matching a selector, using an index if one applies """
+        return cls.backend.find(selector, cls.index_for(selector), fields)
+
+    @classmethod
+    @timed('find_by')
     def find_by(cls, **kwargs):
         """ Find records using selector """
-        query = Query(cls.database, selector=kwargs)
-        results = []
-        for doc in query.result:
-            customer = Customer()
-            customer.deserialize(doc)
-            results.append(customer)
-        # return [doc for doc in query.result]
-        return results
+        return list(cls.iter_by(**kwargs))
+
+    @classmethod
+    @timed('iter_by')
+    def iter_by(cls, fields=None, **kwargs):
+        """ Generator of the records matching a selector, read lazily
+
+        Args:
+            fields (list): the only fields to read (the Mango fields
+                option), None reads them all
+        """
+        projection = cls.projection(fields)
+        for doc in cls._query(kwargs, projection):
+            yield cls.from_doc(doc, projection)
 
     @classmethod
-    def find(cls, customer_id):
-        """ Finds a Customer by it's ID """
+    @timed('page')
+    def page(cls, limit, cursor=None, fields=None, **kwargs):
+        """ Returns one page of the Customers matching a selector
+
+        Pages come from a Mango bookmark on Cloudant, or from the startkey
+        of _all_docs when there is no selector, so every page costs the
+        same however deep into the list it is.
+
+        Args:
+            limit (int): the most Customers returned
+            cursor (string): the cursor returned with the previous page
+            fields (list): the only fields to read, None reads them all
+        Returns:
+            the list of Customers and the cursor of the next page, or
+            None when this is the last page
+        """
+        projection = cls.projection(fields)
         try:
-            document = cls.database[customer_id]
-            return Customer().deserialize(document)
-        except KeyError:
-            return None
+            docs, next_cursor = cls.backend.page(kwargs, limit, cursor,
+                                                 cls.index_for(kwargs), projection)
+        except ValueError as error:
+            raise DataValidationError(str(error))
+        return [cls.from_doc(doc, projection) for doc in docs], next_cursor
+
+    @classmethod
+    @timed('find')
+    def find(cls, customer_id, cached=True):
+        """ Finds a Customer by it's ID, reading through the cache
+
+        With cached=False the Customer is read from the database, and the
+        cache is refreshed with it, for a write that needs its current _rev
+        """
+        data = cls.cache.get(customer_id) if cached else None
+        if data is None:
+            data = cls.backend.get(customer_id)
+            if data is None:
+                cls.cache.invalidate(customer_id)
+                return None
+            cls.cache.set(customer_id, data)
+        return Customer().deserialize(data)
+
+    @classmethod
+    def update_seq(cls):
+        """ Returns a value that changes whenever any Customer is written """
+        return cls.backend.update_seq()
 
     @classmethod
     def find_by_query(cls, **kwargs):
-        """ Returns the list of the Customers in a data list which
-        satisfied the query
+        """ Returns the Customers whose fields equal all the given values """
+        return cls.find_by(**kwargs)
+
+    @staticmethod
+    def selector(args):
+        """ Compiles filter parameters into a Mango selector
+
         Args:
-            key (string): the attributes name
-            value: attributes values
+            args: query parameters named after Customer fields, with the
+                operators of service.query
+        Raises:
+            DataValidationError: when a field or a value is not valid
         """
-        query = Query(cls.database, selector=kwargs)
-        key = kwargs.keys()[0]
-        results = []
-        for doc in query.result:
-            customer = Customer()
-            customer.deserialize(doc)
-            if doc[key] == kwargs[key]:
-                results.append(customer)
-        time.sleep(WAIT_SECONDS)
-        return results
+        try:
+            return compile_query(args, QUERY_KINDS, QUERY_SPELLINGS)
+        except ValueError as error:
+            raise DataValidationError(str(error))
+
+    @classmethod
+    @timed('search')
+    def search(cls, query, limit=10):
+        """ Returns the best matches of a typeahead query, best first
+
+        The query is matched by prefix against the words of SEARCH_FIELDS
+        in the search index, which is built from the database in the
+        background (see build_search_index).
+
+        Returns:
+            a list of dicts with the _id, the SEARCH_FIELDS and the score
+
+        Raises:
+            SearchDisabled: when SEARCH_INDEX is off, or the index would
+                hold more than SEARCH_INDEX_MAX_DOCS Customers
+            IndexNotReady: while the index is being built
+        """
+        if not cls.search_enabled:
+            raise SearchDisabled('Search is turned off, set SEARCH_INDEX=true to turn it on')
+        if cls.search_index.too_large:
+            raise SearchDisabled('There are more Customers than the {} the search index '
+                                 'may hold'.format(cls.search_index.max_docs))
+        if not cls.search_index.built:
+            cls.build_search_index()
+            raise IndexNotReady('The search index is being built')
+        return cls.search_index.search(query, limit)
+
+    @classmethod
+    def build_search_index(cls, wait=False):
+        """ Starts building the search index in the background, unless it is built
+
+        Args:
+            wait (bool): True to return only once the index is built
+        """
+        cls.search_index.start_build(cls._search_docs)
+        if wait:
+            cls.search_index.wait()
+
+    @classmethod
+    def _search_docs(cls):
+        """ Generator of (id, doc) of every Customer, read with SEARCH_FIELDS only """
+        projection = cls.projection(SEARCH_FIELDS)
+        for doc in cls.backend.all_docs(SEARCH_BUILD_BATCH_SIZE, projection):
+            yield doc['_id'], doc
 
     @classmethod
     def find_by_name(cls, username):
@@ -249,76 +601,64 @@ class Customer(object):
         return cls.find_by(address=address)
 
 ############################################################
-#  C L O U D A N T   D A T A B A S E   C O N N E C T I O N
+#  S T O R A G E   B A C K E N D
 ############################################################
 
     @staticmethod
     def init_db(dbname='customers', connect=True):
         """
-        Initialized Coundant database connection
+        Initialize the storage backend named by STORAGE_BACKEND
+
+        'cloudant' (the default) connects to Cloudant or CouchDB, while
+        'memory' and 'sqlite' need no running service.
         """
-        opts = {}
-        vcap_services = {}
-
-        # Try and get VCAP from the environment or a file if developing
-        if 'VCAP_SERVICES' in os.environ:
-            Customer.logger.info('Running in Bluemix mode.')
-            Customer.logger.info(os.environ['VCAP_SERVICES'])
-            vcap_services = json.loads(os.environ['VCAP_SERVICES'])
-        # if VCAP_SERVICES isn't found, maybe we are running on Kubernetes?
-        elif 'BINDING_CLOUDANT' in os.environ:
-            Customer.logger.info('Found Kubernetes Bindings')
-            creds = json.loads(os.environ['BINDING_CLOUDANT'])
-            vcap_services = {"cloudantNoSQLDB": [{"credentials": creds}]}
+        name = os.environ.get('STORAGE_BACKEND', 'cloudant').lower()
+        if name not in BACKENDS:
+            raise AssertionError('Unknown storage backend [{}]'.format(name))
+        if Customer.backend is not None:
+            Customer.backend.close()
+            Customer.backend = None
+        Customer.logger.info('Using the %s storage backend', name)
+        Customer._use_backend(BACKENDS[name](dbname))
+        Customer.create_indexes()
+        Customer.follow_changes()
+
+    @classmethod
+    def _use_backend(cls, backend):
+        """ Makes backend the store of all Customers """
+        cls.backend = backend
+        if isinstance(backend, CloudantBackend):
+            cls.client = backend.client
+            cls.database = backend.database
         else:
-            Customer.logger.info('VCAP_SERVICES and BINDING_CLOUDANT undefined.')
-            creds = {
-                "username": CLOUDANT_USERNAME,
-                "password": CLOUDANT_PASSWORD,
-                "host": CLOUDANT_HOST,
-                "port": 5984,
-                "url": "http://" + CLOUDANT_HOST + ":5984/"
-            }
-            vcap_services = {"cloudantNoSQLDB": [{"credentials": creds}]}
-
-        # Look for Cloudant in VCAP_SERVICES
-        for service in vcap_services:
-            if service.startswith('cloudantNoSQLDB'):
-                cloudant_service = vcap_services[service][0]
-                Customer.logger.info(cloudant_service)
-                opts['username'] = cloudant_service['credentials']['username']
-                opts['password'] = cloudant_service['credentials']['password']
-                opts['host'] = cloudant_service['credentials']['host']
-                opts['port'] = cloudant_service['credentials']['port']
-                opts['url'] = cloudant_service['credentials']['url']
-
-        Customer.logger.info(opts)
-        if any(k not in opts for k in ('host', 'username', 'password', 'port', 'url')):
-            Customer.logger.info('Error - Failed to retrieve options. '
-                                 'Check that app is bound to a Cloudant service.')
-            exit(-1)
-
-        Customer.logger.info('Cloudant Endpoint: %s', opts['url'])
-        try:
-            if ADMIN_PARTY:
-                Customer.logger.info('Running in Admin Party Mode...')
-            Customer.client = Cloudant(opts['username'],
-                                       opts['password'],
-                                       url=opts['url'],
-                                       connect=True,
-                                       auto_renew=True,
-                                       admin_party=ADMIN_PARTY
-                                       )
-
-        except ConnectionError:
-            raise AssertionError('Cloudant service could not be reached')
-
-        # Create database if it doesn't exist
-        try:
-            Customer.database = Customer.client[dbname]
-        except KeyError:
-            # Create a database using an initialized client
-            Customer.database = Customer.client.create_database(dbname)
-        # check for success
-        if not Customer.database.exists():
-            raise AssertionError('Database [{}] could not be obtained'.format(dbname))
+            cls.client = None
+            cls.database = None
+
+    @classmethod
+    def create_indexes(cls):
+        """ Creates any declared index that is missing from the store """
+        cls.backend.create_indexes(cls.indexes)
+
+    @classmethod
+    def follow_changes(cls):
+        """
+        Starts following the changes written by other processes
+
+        The cache and the search index are cleared, since they may hold
+        documents of another database. The feed carries the documents,
+        which the search index needs.
+        """
+        cls.cache.clear()
+        cls.search_index.clear(built=False)
+        if not CHANGES_FEED:
+            return
+        cls.backend.follow_changes(cls._on_change, include_docs=True)
+
+    @classmethod
+    def _on_change(cls, change):
+        """ Evicts a document that was changed by any process, and indexes it again """
+        cls.cache.invalidate(change['id'])
+        if change.get('deleted'):
+            cls.search_index.remove(change['id'])
+        elif 'doc' in change:
+            cls.search_index.add(change['id'], change['doc'])
@@ -0,0 +1,176 @@
+"""
+Request profiling
+
+Profiler - profiles single requests with cProfile, when an admin asks for
+           it with the X-Profile header or for a sampled fraction of the
+           requests, and keeps the profiles as pstats files that the
+           admin endpoints list and report on
+
+Nothing is hooked into the app unless PROFILE_TOKEN or
+PROFILE_SAMPLE_RATE is set, so profiling costs nothing when it is off.
+The profiles are kept in PROFILE_DIR, which all the gunicorn workers of
+a host share. Under gevent a profile also shows the other requests the
+worker served while the profiled one was waiting.
+"""
+import os
+import json
+import time
+import uuid
+import glob
+import hmac
+import random
+import pstats
+import cProfile
+import tempfile
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from flask import request, g
+
+# the admin secret of the X-Profile and X-Admin-Token headers
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+# fraction of all requests to profile, 0 profiles only on request
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR',
+                             os.path.join(tempfile.gettempdir(), 'customers-profiles'))
+# the most profiles kept, the oldest are deleted first
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '50'))
+
+PROFILE_HEADER = 'X-Profile'
+ADMIN_HEADER = 'X-Admin-Token'
+
+
+class Profiler(object):
+    """ Profiles requests and stores the profiles """
+
+    def __init__(self, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE,
+                 directory=PROFILE_DIR, keep=PROFILE_KEEP, sample=random.random):
+        """ Initialize the profiler
+
+        Args:
+            token (string): the admin secret, None disables the headers
+            sample_rate (float): fraction of the requests to profile
+            directory (string): where the profiles are stored
+            keep (int): the most profiles stored
+            sample (callable): returns a random number in [0, 1)
+        """
+        self.token = token
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.keep = keep
+        self._sample = sample
+        # cProfile can only profile one request of a thread at a time
+        self._running = False
+
+    @property
+    def enabled(self):
+        """ Checks if any request may be profiled """
+        return bool(self.token) or self.sample_rate > 0
+
+    def init_app(self, app):
+        """ Hooks the profiler into a Flask app when it is enabled """
+        if not self.enabled:
+            return
+        app.before_request(self.start)
+        app.after_request(self.note_status)
+        app.teardown_request(self.stop)
+
+    def authorized(self, header=ADMIN_HEADER):
+        """ Checks if the request carries the admin token in a header """
+        value = request.headers.get(header)
+        return bool(self.token) and value is not None and \
+            hmac.compare_digest(str(value), str(self.token))
+
+    def wanted(self):
+        """ Checks if the current request should be profiled """
+        return self.authorized(PROFILE_HEADER) or self._sample() < self.sample_rate
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+
+    def start(self):
+        """ Starts profiling the request if it should be """
+        if self._running or not self.wanted():
+            return
+        self._running = True
+        g.profile = cProfile.Profile()
+        g.profile_started = time.time()
+        g.profile.enable()
+
+    @staticmethod
+    def note_status(response):
+        """ Remembers the status of a profiled request """
+        if 'profile' in g:
+            g.profile_status = response.status_code
+        return response
+
+    def stop(self, exception=None):
+        """ Stops profiling the request and stores the profile
+
+        This runs when the request is torn down, so a streamed response
+        is profiled until its last chunk.
+        """
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        self._running = False
+        self.save(profile, {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': g.get('profile_status'),
+            'started': g.profile_started,
+            'seconds': time.time() - g.profile_started,
+        })
+
+######################################################################
+#  S T O R A G E
+######################################################################
+
+    def save(self, profile, info):
+        """ Stores a profile and its request information """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        profile_id = '{}-{}'.format(time.strftime('%Y%m%dT%H%M%S'), uuid.uuid4().hex[:8])
+        info = dict(info, id=profile_id)
+        profile.dump_stats(self.path(profile_id))
+        with open(os.path.join(self.directory, profile_id + '.json'), 'w') as info_file:
+            json.dump(info, info_file)
+        for old in self.profiles()[self.keep:]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, old['id'] + extension))
+                except OSError:
+                    pass
+        return profile_id
+
+    def profiles(self):
+        """ Returns the information of the stored profiles, newest first """
+        profiles = []
+        for name in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(name) as info_file:
+                    profiles.append(json.load(info_file))
+            except (IOError, ValueError):
+                continue    # deleted, or still being written, by another worker
+        return sorted(profiles, key=lambda info: info['started'], reverse=True)
+
+    def path(self, profile_id):
+        """ Returns the pstats file of a profile """
+        return os.path.join(self.directory, os.path.basename(profile_id) + '.prof')
+
+    def report(self, profile_id, sort='cumulative', limit=50):
+        """ Returns the text report of a profile, or None if there is none """
+        if not os.path.exists(self.path(profile_id)):
+            return None
+        stream = StringIO()
+        stats = pstats.Stats(self.path(profile_id), stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        stats.print_callers(limit)
+        return stream.getvalue()
+
+
+# the profiler of the service, configured from the environment
+profiler = Profiler()
@@ -0,0 +1,128 @@
+"""
+Query compiler
+
+compile_query - turns the filter parameters of a list request into one
+                Mango selector, so every filter runs in the database
+
+The parameters are named after the fields, with a suffix for operators:
+
+    last_name=Frank             the field equals the value
+    last_name=Frank&last_name=Jude
+    last_name__in=Frank,Jude    the field is one of the values
+    last_name__ne=Frank         the field is not the value
+    username__prefix=ar         the field starts with the text
+    id__gte=10&id__lt=20        ranges, with gt, gte, lt and lte
+
+Values are converted to the kind of their field: Integer fields take
+numbers and Boolean fields take true or false, in any case, or 1 or 0.
+"""
+
+# the separator of a field and its operator, and the operators after it
+OPERATOR_SEPARATOR = '__'
+RANGE_OPERATORS = ('gt', 'gte', 'lt', 'lte')
+OPERATORS = ('in', 'ne', 'prefix') + RANGE_OPERATORS
+
+# sorts after every other character, so a prefix is a range of keys
+PREFIX_END = u'\ufff0'
+
+BOOLEAN_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+
+
+def convert(field, kind, value):
+    """ Returns a parameter value as the kind of its field """
+    if kind == 'Integer':
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError('{} must be a number, not {}'.format(field, value))
+    if kind == 'Boolean':
+        try:
+            return BOOLEAN_VALUES[value.lower()]
+        except KeyError:
+            raise ValueError('{} must be true or false, not {}'.format(field, value))
+    return value
+
+
+def split(name):
+    """ Returns the field and the operator of a parameter name """
+    field, separator, operator = name.rpartition(OPERATOR_SEPARATOR)
+    if separator and operator in OPERATORS:
+        return field, operator
+    return name, None
+
+
+def parameters(args):
+    """ Returns (name, values) of query parameters, a MultiDict or a dict """
+    if hasattr(args, 'lists'):
+        return list(args.lists())
+    return [(name, value if isinstance(value, list) else [value])
+            for name, value in args.items()]
+
+
+def compile_query(args, kinds, spellings=None):
+    """ Compiles query parameters into a Mango selector
+
+    Args:
+        args: the query parameters, a MultiDict or a dict
+        kinds (dict): field name -> 'String', 'Integer' or 'Boolean'
+        spellings (dict): field name -> function that returns every
+            stored value equal to a converted one, for fields whose
+            documents do not all store the same type
+    Returns:
+        the selector, a dict of field -> value or operator conditions
+    Raises:
+        ValueError: when a field, an operator or a value is not valid
+    """
+    spellings = spellings or {}
+    conditions = {}
+    for name, values in parameters(args):
+        field, operator = split(name)
+        if field not in kinds:
+            raise ValueError('Unknown field: {}'.format(field))
+        kind = kinds[field]
+        if operator == 'in':
+            values = [value for listed in values for value in listed.split(',')]
+        elif operator is not None and len(values) > 1:
+            raise ValueError('{} can only be given once'.format(name))
+        values = [convert(field, kind, value) for value in values]
+        condition = conditions.setdefault(field, {})
+        if operator is None or operator == 'in':
+            allowed = [spelled for value in values
+                       for spelled in spellings.get(field, lambda v: [v])(value)]
+            if '$in' in condition:
+                allowed = [value for value in allowed if value in condition['$in']]
+            condition['$in'] = allowed
+        elif operator == 'ne':
+            condition['$nin'] = spellings.get(field, lambda v: [v])(values[0])
+        elif operator == 'prefix':
+            if kind != 'String':
+                raise ValueError('Only text fields can be matched by prefix')
+            condition['$gte'] = values[0]
+            condition['$lt'] = values[0] + PREFIX_END
+        else:
+            condition['$' + operator] = values[0]
+    return dict((field, simplify(condition)) for field, condition in conditions.items())
+
+
+def simplify(condition):
+    """ Writes a single allowed value as a plain equality """
+    if list(condition) == ['$in'] and len(condition['$in']) == 1:
+        return condition['$in'][0]
+    return condition
+
+
+def indexable_fields(selector):
+    """ Returns the fields of a selector that an index can narrow
+
+    A JSON index serves a query when each of its fields has an equality,
+    a range or an $in condition; $ne and $nin have to scan anyway.
+    """
+    fields = set()
+    for field, condition in selector.items():
+        if field.startswith('$'):
+            continue
+        if not isinstance(condition, dict) or \
+                any(operator in condition for operator in
+                    ('$eq', '$in', '$gt', '$gte', '$lt', '$lte')):
+            fields.add(field)
+    return fields
@@ -0,0 +1,259 @@
+"""
+Resilience for the calls to Cloudant
+
+Resilience     - runs each call to the database with a timeout for its
+                 kind of operation, inside the deadline of the current
+                 request, retries transient failures with jittered
+                 exponential backoff, and stops calling a failing
+                 database with a circuit breaker
+DeadlineAdapter - requests transport adapter that applies those timeouts
+"""
+import os
+import math
+import time
+import random
+import logging
+import threading
+from functools import wraps
+from circuitbreaker import CircuitBreaker, CircuitBreakerError
+from requests import HTTPError, ConnectionError, Timeout
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout
+from werkzeug.exceptions import ServiceUnavailable, GatewayTimeout
+
+# seconds a request may spend waiting on the database, retries included
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', '10'))
+# attempts per call, and the bounds of the jittered delay between them
+RETRY_TRIES = int(os.environ.get('RETRY_TRIES', '4'))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', '0.1'))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', '2'))
+# consecutive failures that open the circuit, and seconds it stays open
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', '5'))
+BREAKER_RECOVERY = float(os.environ.get('BREAKER_RECOVERY', '30'))
+# seconds one HTTP request of each kind of operation may take
+OPERATION_TIMEOUTS = {
+    'read': float(os.environ.get('CLOUDANT_READ_TIMEOUT', '5')),
+    'write': float(os.environ.get('CLOUDANT_WRITE_TIMEOUT', '10')),
+    'bulk': float(os.environ.get('CLOUDANT_BULK_TIMEOUT', '30')),
+    'admin': float(os.environ.get('CLOUDANT_ADMIN_TIMEOUT', '60')),
+}
+
+# statuses of requests the server refused before doing anything, which
+# are safe to retry, and of requests that may have been applied
+REJECTED_STATUSES = (429, 503)
+FAILED_STATUSES = (500, 502, 504)
+
+
+class CircuitOpenError(ServiceUnavailable):
+    """ The database is not called while the circuit breaker is open """
+
+    def __init__(self, retry_after):
+        super(CircuitOpenError, self).__init__(
+            'The database is unavailable, retry in {} seconds'.format(retry_after))
+        self.retry_after = retry_after
+
+    def get_headers(self, environ=None):
+        headers = super(CircuitOpenError, self).get_headers(environ)
+        headers.append(('Retry-After', str(self.retry_after)))
+        return headers
+
+
+class DeadlineExceeded(GatewayTimeout):
+    """ The request ran out of time before the database answered """
+    description = 'The database did not answer in time'
+
+
+class TransientError(Exception):
+    """ Wraps a failure that counts against the circuit breaker """
+
+    def __init__(self, error):
+        super(TransientError, self).__init__(str(error))
+        self.error = error
+
+
+def status_code(error):
+    """ Returns the HTTP status of an HTTPError, or None """
+    response = getattr(error, 'response', None)
+    return response.status_code if response is not None else None
+
+
+class Resilience(object):
+    """
+    Retries, deadlines, timeouts and a circuit breaker for database calls
+
+    Use an instance as a decorator with the kind of operation:
+
+        @resilience('read')
+        def get(self, doc_id): ...
+
+    Calls made inside a protected call, like the pages of a bulk delete,
+    are not protected again.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, name='cloudant', tries=RETRY_TRIES, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY, failure_threshold=BREAKER_FAILURES,
+                 recovery_timeout=BREAKER_RECOVERY, timeouts=None,
+                 sleep=time.sleep, clock=time.time):
+        """ Initialize the resilience layer
+
+        Args:
+            name (string): the name of the circuit breaker
+            tries (int): attempts per call
+            base_delay (float): seconds the jittered delay grows from
+            max_delay (float): the longest delay between attempts
+            failure_threshold (int): consecutive failures that open the circuit
+            recovery_timeout (float): seconds the circuit stays open
+            timeouts (dict): seconds per kind of operation
+            sleep (callable): waits between attempts
+            clock (callable): returns the current time in seconds
+        """
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeouts = dict(OPERATION_TIMEOUTS, **(timeouts or {}))
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold,
+                                      recovery_timeout=recovery_timeout,
+                                      expected_exception=TransientError,
+                                      name=name)
+        self._sleep = sleep
+        self._clock = clock
+        self._local = threading.local()
+        self.retries = 0
+        self.trips = 0
+        self.rejections = 0
+        self.deadlines_exceeded = 0
+
+    def __call__(self, operation, idempotent=True):
+        """ Decorator that protects a function as an operation
+
+        Args:
+            operation (string): a key of the timeouts
+            idempotent (bool): False when repeating a call that may have
+                been applied is not safe
+        """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                return self.call(operation, function, args, kwargs, idempotent)
+            return wrapper
+        return decorator
+
+######################################################################
+#  D E A D L I N E S
+######################################################################
+
+    def start_request(self, seconds=REQUEST_DEADLINE):
+        """ Starts the deadline of the current request """
+        self._local.deadline = self._clock() + seconds
+
+    def end_request(self):
+        """ Removes the deadline of the current request """
+        self._local.deadline = None
+
+    def remaining(self):
+        """ Returns the seconds left before the deadline, or None """
+        deadline = getattr(self._local, 'deadline', None)
+        return None if deadline is None else deadline - self._clock()
+
+    def timeout(self):
+        """ Returns the timeout of the HTTP request being made, or None """
+        return getattr(self._local, 'timeout', None)
+
+######################################################################
+#  C A L L S
+######################################################################
+
+    def call(self, operation, function, args=(), kwargs=None, idempotent=True):
+        """ Calls function with the timeout, retry and breaker rules """
+        kwargs = kwargs or {}
+        if getattr(self._local, 'active', False):
+            return function(*args, **kwargs)
+        self._local.active = True
+        try:
+            return self._attempts(operation, function, args, kwargs, idempotent)
+        finally:
+            self._local.active = False
+            self._local.timeout = None
+
+    def _attempts(self, operation, function, args, kwargs, idempotent):
+        """ Calls function until it succeeds, or should not be retried """
+        attempt = 0
+        while True:
+            remaining = self.remaining()
+            if remaining is not None and remaining <= 0:
+                self.deadlines_exceeded += 1
+                raise DeadlineExceeded()
+            timeout = self.timeouts[operation]
+            self._local.timeout = timeout if remaining is None else min(timeout, remaining)
+            try:
+                return self.breaker.call(self._guarded, function, args, kwargs)
+            except CircuitBreakerError:
+                self.rejections += 1
+                raise CircuitOpenError(int(math.ceil(max(self.breaker.open_remaining, 1))))
+            except TransientError as transient:
+                error = transient.error
+            if self.breaker.opened:
+                self.trips += 1
+                Resilience.logger.warning('Circuit %s opened after %s', self.breaker.name, error)
+            attempt += 1
+            if attempt >= self.tries or not self.retryable(error, idempotent):
+                raise error
+            # full jitter: anywhere between no wait and the exponential bound
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            remaining = self.remaining()
+            if remaining is not None and delay >= remaining:
+                raise error
+            self.retries += 1
+            Resilience.logger.info('Retrying %s in %.2fs after %s', operation, delay, error)
+            self._sleep(delay)
+
+    @staticmethod
+    def _guarded(function, args, kwargs):
+        """ Calls function and marks the failures the breaker counts """
+        try:
+            return function(*args, **kwargs)
+        except HTTPError as error:
+            if status_code(error) in REJECTED_STATUSES + FAILED_STATUSES:
+                raise TransientError(error)
+            raise
+        except (ConnectionError, Timeout) as error:
+            raise TransientError(error)
+
+    @staticmethod
+    def retryable(error, idempotent):
+        """ Checks if a transient failure may be retried """
+        if isinstance(error, HTTPError):
+            code = status_code(error)
+            return code in REJECTED_STATUSES or (idempotent and code in FAILED_STATUSES)
+        # a connect timeout never reached the server, other failures may have
+        return isinstance(error, ConnectTimeout) or idempotent
+
+    def stats(self):
+        """ Returns the counters and the state of the circuit breaker """
+        return {
+            'state': self.breaker.state,
+            'failures': self.breaker.failure_count,
+            'retries': self.retries,
+            'trips': self.trips,
+            'rejections': self.rejections,
+            'deadlines_exceeded': self.deadlines_exceeded,
+        }
+
+
+class DeadlineAdapter(HTTPAdapter):
+    """ HTTPAdapter that limits each request to the timeout of its call """
+
+    def __init__(self, resilience, **kwargs):
+        self.resilience = resilience
+        super(DeadlineAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        timeout = self.resilience.timeout()
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        return super(DeadlineAdapter, self).send(request, **kwargs)
+
+
+# the resilience layer of the Cloudant backend
+resilience = Resilience()
@@ -4,5 +4,7 @@ This Package contains all of the RESTful resources
 
 from .customer_resource import CustomerResource
 from .customer_collection import CustomerCollection
+from .customer_search import CustomerSearch
+from .customer_transfer import CustomerExport, CustomerImport
 from .home_page import HomePage
 from .disable_action import DisableAction
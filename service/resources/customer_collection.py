@@ -1,24 +1,59 @@
 """
 This module contains the Pet Collection Resource
 """
-from flask import request, abort
-from flask_restful import Resource
+import hashlib
+from flask import request, abort, Response, stream_with_context
+from werkzeug.urls import url_encode
+from werkzeug.datastructures import MultiDict
+from flask_restplus import Resource
 from flask_api import status
 from werkzeug.exceptions import BadRequest
-from service import app, api, apii, ns, Customer_model
-from service.models import Customer, DataValidationError
-from . import CustomerResource
+from service import app, api, ns, Customer_model
+from service.models import Customer, DataValidationError, chunks
+from service.resilience import resilience
+from service.fastjson import dumps
+from .customer_resource import CustomerResource, requested_fields
+
+NDJSON = 'application/x-ndjson'
+# query parameters that control the response instead of filtering customers
+CONTROL_PARAMS = ('stream', 'fields', 'limit', 'cursor')
+# number of customers sent per chunk of a streamed list
+STREAM_CHUNK_SIZE = 100
+# page size when a cursor is given without a limit, and the largest page
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
 
 @ns.route('/', strict_slashes=False)
 class CustomerCollection(Resource):
     """ Handles all interactions with collections of Customers """
 
-    @ns.doc('query_customers')
+    @ns.doc('query_customers', params={
+        'stream': 'true to stream the list as it is read from the database',
+        'fields': 'comma separated Customer fields to return, all of them by default',
+        'limit': 'the most Customers returned, with a Link to the next page',
+        'cursor': 'the page to return, from the Link of the previous page'})
+    @ns.response(400, 'An unknown field, a bad filter, or a bad limit or cursor, was requested')
     @ns.response(404, 'Customer not found')
-    @ns.marshal_list_with(Customer_model)
+    @ns.response(304, 'No Customer has changed since the If-None-Match tag')
+    @ns.response(200, 'The list of Customers', [Customer_model])
+    @ns.produces(['application/json', NDJSON])
     def get(self):
         """query and get the intersection of the queries.
         if there is no given query return all the list
+
+        The list is streamed to the client, one chunk of customers at a
+        time, when ?stream=true is given or the client accepts
+        application/x-ndjson.
+        ?fields= limits the Customers to the named fields, which are the
+        only ones read from the database.
+        ?limit= returns one page of the list with a Link: rel="next"
+        header, whose ?cursor= gives the following page.
+        Any other parameter filters on a Customer field, like
+        ?last_name=Frank, ?id__gte=10 or ?username__prefix=ar, and all of
+        them run as one Mango query (see service.query).
+        The weak ETag follows the database update_seq, so a client that
+        sends it back in If-None-Match gets a 304, without the query
+        being run, until any Customer is written.
         Args:
             **par: parameter of query
             empty equry
@@ -29,46 +64,112 @@ class CustomerCollection(Resource):
         """
         app.logger.info('Query a Customer with query')
         app.logger.info('Queries are: {}'.format(request.args.items().__str__()))
-        username = request.args.get('username')
-        address = request.args.get('address')
-
-        if username:
-            # Query customers by name
-            app.logger.info('Filtering by username:%s', username)
-            results = Customer.find_by_name(username)
-
-            message = [customer.serialize() for customer in results]
-            return_code = status.HTTP_200_OK
-        elif address:
-            # Query customers by name
-            app.logger.info('Filtering by username:%s', username)
-            results = Customer.find_by_address(address)
-
-            message = [customer.serialize() for customer in results]
-            return_code = status.HTTP_200_OK
-
-        elif request.args:
-            # Query customers by query
-            #key = request.args.keys()
-            app.logger.info('Filtering by query:%s', request.args.keys())
-            results = Customer.find_by(kwargs=request.args)
-            #results = Customer.find_by_query({key:request.args.get(key)})
-            message = [customer.serialize() for customer in results]
-            return_code = status.HTTP_200_OK
+        fields = requested_fields()
+        limit = self.page_limit()
+        etag = self.etag()
+        headers = {'ETag': 'W/"{}"'.format(etag), 'Vary': 'Accept'}
+        if request.if_none_match.contains_weak(etag):
+            return '', status.HTTP_304_NOT_MODIFIED, headers
+        filters = MultiDict((key, value) for key, value in request.args.items(multi=True)
+                            if key not in CONTROL_PARAMS)
+        app.logger.info('Filtering by query:%s', filters.keys())
+        try:
+            selector = Customer.selector(filters)
+        except DataValidationError as error:
+            raise BadRequest(str(error))
+
+        if limit:
+            try:
+                results, next_cursor = Customer.page(limit, request.args.get('cursor'),
+                                                     fields, **selector)
+            except DataValidationError as error:
+                raise BadRequest(str(error))
+            if next_cursor:
+                headers['Link'] = '<{}>; rel="next"'.format(self.page_url(next_cursor, limit))
+        elif selector:
+            results = Customer.iter_by(fields, **selector)
         else:
-                # List all customers.
-            results = Customer.all()
-            message = [customer.serialize() for customer in results]
-            return_code = status.HTTP_200_OK
-        return message, return_code
+            results = Customer.all(fields=fields)
+
+        if self.streaming():
+            response = self.stream(results, fields)
+            response.headers.extend(headers)
+            return response
+        message = [customer.to_api(fields) for customer in results]
+        return message, status.HTTP_200_OK, headers
+
+    @staticmethod
+    def page_limit():
+        """ Returns the page size asked for, or None for the whole list """
+        if 'limit' not in request.args and 'cursor' not in request.args:
+            return None
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PAGE_LIMIT))
+        except ValueError:
+            raise BadRequest('limit must be a number')
+        if not 0 < limit <= MAX_PAGE_LIMIT:
+            raise BadRequest('limit must be between 1 and {}'.format(MAX_PAGE_LIMIT))
+        return limit
+
+    @staticmethod
+    def page_url(cursor, limit):
+        """ Returns the URL of the page that starts at cursor """
+        args = request.args.copy()
+        args['cursor'] = cursor
+        args['limit'] = limit
+        return '{}?{}'.format(request.base_url, url_encode(args))
+
+    @staticmethod
+    def etag():
+        """ Returns a tag that changes whenever any Customer is written
+
+        CouchDB update_seq values are long, so the tag is a digest of it
+        """
+        return hashlib.md5(str(Customer.update_seq()).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def streaming():
+        """ Checks if the client asked for a streamed list """
+        if request.args.get('stream', '').lower() == 'true':
+            return True
+        return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+    @staticmethod
+    def stream(results, fields=None):
+        """ Streams Customers as NDJSON, or as a JSON array, while they are read
+
+        Customers are sent in chunks of STREAM_CHUNK_SIZE so memory use
+        and the time to the first byte do not grow with the list.
+        """
+        ndjson = request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+        def encode(customer):
+            return dumps(customer.to_api(fields))
+
+        def generate():
+            # a stream is as long as the list, so only the timeout of
+            # each database call bounds it, not the request deadline
+            resilience.end_request()
+            if ndjson:
+                for chunk in chunks(results, STREAM_CHUNK_SIZE):
+                    yield ''.join(encode(customer) + '\n' for customer in chunk)
+            else:
+                separator = '['
+                for chunk in chunks(results, STREAM_CHUNK_SIZE):
+                    yield separator + ','.join(encode(customer) for customer in chunk)
+                    separator = ','
+                yield ']\n' if separator == ',' else '[]\n'
+
+        mimetype = NDJSON if ndjson else 'application/json'
+        return Response(stream_with_context(generate()), mimetype=mimetype)
 
     @ns.doc('create_customers')
     @ns.expect(Customer_model)
     @ns.response(400, 'The posted data was not valid')
-    @ns.response(201, 'Customer created successfully')
-    @ns.marshal_with(Customer_model, code=201)
+    @ns.response(201, 'Customer created successfully', Customer_model)
+    @ns.response(207, 'A list of Customers was posted and some were not created')
     def post(self):
-        """Create a customer in the database"""
+        """Create a customer, or a list of customers, in the database"""
         app.logger.info('Creating a new customer')
 
         content_type = request.headers.get('Content-Type')
@@ -94,6 +195,8 @@ class CustomerCollection(Resource):
         elif content_type == 'application/json':
             app.logger.info('Processing JSON data')
             data = request.get_json()
+            if isinstance(data, list):
+                return self.create_many(data)
             data.pop("_id", None)
         else:
             message = 'Unsupported Content-Type: {}'.format(content_type)
@@ -107,4 +210,37 @@ class CustomerCollection(Resource):
         customer.save()
         app.logger.info('Customer with new id [%s] saved!', customer.id)
         location_url = api.url_for(CustomerResource, customer_id=customer.id, _external=True)
-        return customer.serialize(), status.HTTP_201_CREATED, {'Location': location_url}
+        return (customer.to_api(),
+                status.HTTP_201_CREATED, {'Location': location_url})
+
+    @staticmethod
+    def create_many(items):
+        """Create a list of customers with bulk writes
+
+        Returns one result per item, in order, and 207 Multi-Status
+        when any of them could not be created
+        """
+        app.logger.info('Creating %d customers in bulk', len(items))
+        results = [None] * len(items)
+        customers = []
+        positions = []
+        for position, data in enumerate(items):
+            if not isinstance(data, dict):
+                results[position] = {'_id': None, 'error': 'invalid',
+                                     'reason': 'Invalid customer: not an object'}
+                continue
+            data.pop("_id", None)
+            try:
+                customers.append(Customer().deserialize(data))
+            except DataValidationError as error:
+                results[position] = {'_id': None, 'error': 'invalid',
+                                     'reason': str(error)}
+                continue
+            positions.append(position)
+
+        for position, result in zip(positions, Customer.save_many(customers)):
+            results[position] = result
+
+        if any('error' in result for result in results):
+            return results, status.HTTP_207_MULTI_STATUS
+        return results, status.HTTP_201_CREATED
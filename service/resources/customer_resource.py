@@ -1,13 +1,39 @@
 """
 This module contains all of Resources for the Customer API
 """
+import re
 import json
 from flask import abort, request, make_response
-from flask_restful import Resource
+from flask_restplus import Resource
 from flask_api import status
 from werkzeug.exceptions import BadRequest
-from service import app, api, apii, ns, Customer_model
-from service.models import Customer, DataValidationError
+from service import app, api, ns, Customer_model
+from service.models import Customer, DataValidationError, ConflictError
+
+# a document revision, as CouchDB and the other backends write it
+REVISION = re.compile(r'^\d+-\w+$')
+
+
+def requested_fields():
+    """ Returns the Customer fields named in ?fields=, or None for all of them """
+    value = request.args.get('fields')
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in Customer_model]
+    if unknown:
+        raise BadRequest('Unknown fields: {}'.format(', '.join(unknown)))
+    return fields
+
+
+def tag_revision(tag):
+    """ Returns the _rev an ETag of a Customer names, or None for another tag
+
+    The tag of some of the fields is the _rev followed by ;fields=
+    """
+    rev = tag.split(';', 1)[0]
+    return rev if REVISION.match(rev) else None
+
 
 ######################################################################
 #  PATH: /pets/{id}
@@ -25,32 +51,55 @@ class CustomerResource(Resource):
     DELETE /customers/{id} - Deletes a Customer with the id
     """
 
-    @ns.doc('get_customers')
+    @ns.doc('get_customers', params={
+        'fields': 'comma separated Customer fields to return, all of them by default'})
+    @ns.response(400, 'An unknown field was requested')
     @ns.response(404, 'Customer not found')
-    @ns.marshal_with(Customer_model)
+    @ns.response(304, 'The Customer has not changed since the If-None-Match revision')
+    @ns.response(200, 'The Customer', Customer_model)
     def get(self, customer_id):
         """
         Retrieve a single Customer
+
+        The ETag is the document's _rev, so a client that sends it back
+        in If-None-Match gets a 304 until the Customer changes. Some of
+        the fields are another representation of it, so the ETag of
+        ?fields= is weak and names the fields too.
         """
         app.logger.info('Finding a Customer with id [{}]'.format(customer_id))
+        fields = requested_fields()
+        # the whole document is read, and cached, and only the response
+        # is limited to the requested fields
         customer = Customer.find(customer_id)
-        if customer:
-            message = customer.serialize()
-            return_code = status.HTTP_200_OK
-        else:
+        if not customer:
             message = {'error': 'Customer with id: %s was not found' % str(customer_id)}
-            return_code = status.HTTP_404_NOT_FOUND
-        return message, return_code
+            return message, status.HTTP_404_NOT_FOUND
+        headers = {}
+        if customer._rev:
+            if fields:
+                tag = '{};fields={}'.format(customer._rev, ','.join(sorted(set(fields))))
+                headers['ETag'] = 'W/"{}"'.format(tag)
+            else:
+                tag = customer._rev
+                headers['ETag'] = '"{}"'.format(tag)
+            if request.if_none_match.contains_weak(tag):
+                return '', status.HTTP_304_NOT_MODIFIED, headers
+        return customer.to_api(fields), status.HTTP_200_OK, headers
 
 
     @ns.doc('update_customer')
     @ns.response(404, 'Customer not found')
     @ns.response(400, 'The posted Customer data was not valid')
+    @ns.response(409, 'The Customer was changed since the If-Match revision')
+    @ns.response(200, 'The updated Customer', Customer_model)
     @ns.expect(Customer_model)
-    @ns.marshal_with(Customer_model)
     def put(self, customer_id):
         """
         Update a single Customer
+
+        The update is one conditional write of the revision that was read,
+        or of the revision given in If-Match, and fails with 409 when the
+        Customer was changed by someone else in the meantime.
         """
         app.logger.info('Updating a Customer with id [{}]'.format(customer_id))
 
@@ -59,7 +108,9 @@ class CustomerResource(Resource):
         if not content_type or content_type != 'application/json':
             abort(status.HTTP_400_BAD_REQUEST, "No Content-Type set")
 
-        customer = Customer.find(customer_id)
+        # without If-Match the update replaces the current revision, which
+        # the cache may not have yet
+        customer = Customer.find(customer_id, cached=bool(request.if_match))
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, "Customer with id '{}' was not found.".format(customer_id))
 
@@ -71,14 +122,41 @@ class CustomerResource(Resource):
             raise BadRequest(str(error))
 
         customer._id = customer_id
-        customer.save()
+        customer._rev = self.expected_rev(customer)
+        try:
+            customer.save()
+        except ConflictError:
+            abort(status.HTTP_409_CONFLICT,
+                  "Customer with id '{}' was changed by another request.".format(customer_id))
 
-        message = customer.serialize()
+        message = customer.to_api()
         return_code = status.HTTP_200_OK
-        return message, return_code
+        return message, return_code, {'ETag': '"{}"'.format(customer._rev)}
+
+    @staticmethod
+    def expected_rev(customer):
+        """ Returns the revision an update must replace
+
+        That is the revision the client sent in If-Match, or the one the
+        Customer was read with when there is no If-Match header. A weak
+        tag names a revision too: a compressed GET weakens the ETag. A
+        tag that is not a revision is never sent to the database.
+        """
+        if not request.if_match or request.if_match.star_tag:
+            return customer._rev
+        revs = set(tag_revision(tag) for tag in request.if_match.as_set(include_weak=True))
+        revs.discard(None)
+        if customer._rev in revs:
+            return customer._rev
+        if len(revs) == 1:
+            # the read may be stale, the database decides if this one is current
+            return revs.pop()
+        abort(status.HTTP_409_CONFLICT,
+              "Customer with id '{}' is not at any If-Match revision.".format(customer._id))
 
     @ns.doc('delete_customers')
     @ns.response(204, 'Customer deleted')
+    @ns.response(409, 'The Customer was changed while it was deleted')
     def delete(self, customer_id):
         """
         Delete a Customer
@@ -86,7 +164,11 @@ class CustomerResource(Resource):
         app.logger.info('Deleting a Customer with id [{}]'.format(customer_id))
         customer = Customer.find(customer_id)
         if customer:
-            customer.delete()
+            try:
+                customer.delete()
+            except ConflictError:
+                abort(status.HTTP_409_CONFLICT,
+                      "Customer with id '{}' was changed by another request.".format(customer_id))
         return '', status.HTTP_204_NO_CONTENT
 
 ######################################################################
@@ -94,6 +176,13 @@ class CustomerResource(Resource):
 ######################################################################
     @app.route('/customers/reset', methods=['DELETE'])
     def customers_reset():
-        """ Removes all customers from the database """
-        Customer.remove_all()
+        """ Removes all customers from the database
+
+        ?mode=recreate drops and recreates the database instead of
+        deleting the documents in bulk
+        """
+        try:
+            Customer.remove_all(request.args.get('mode'))
+        except DataValidationError as error:
+            raise BadRequest(str(error))
         return '', status.HTTP_204_NO_CONTENT
@@ -0,0 +1,66 @@
+"""
+This module contains the Customer Search Resource
+"""
+from flask import request
+from flask_restplus import Resource, fields
+from flask_api import status
+from werkzeug.exceptions import BadRequest
+from service import app, api, ns, Model
+from service.models import Customer, IndexNotReady, SearchDisabled
+
+# matches returned when no limit is given, and the most that can be asked for
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+# seconds a client is told to wait while the search index is built
+SEARCH_RETRY_AFTER = 2
+
+Search_model = api.add_model('CustomerMatch', Model('CustomerMatch', {
+    '_id': fields.String(description='The unique id assigned internally by service'),
+    'first_name': fields.String(description='The first name of a Customer'),
+    'last_name': fields.String(description='The last name of a Customer'),
+    'username': fields.String(description='The username of a Customer'),
+    'email': fields.String(description='The email of a Customer'),
+    'score': fields.Float(description='How well the Customer matches, higher first'),
+}))
+
+######################################################################
+#  PATH: /customers/search
+######################################################################
+
+@ns.route('/search')
+class CustomerSearch(Resource):
+    """ Finds Customers as an agent types part of a name, username or email """
+
+    @ns.doc('search_customers', params={
+        'q': 'the start of any words of the first name, last name, username or email',
+        'limit': 'the most Customers returned, {} by default'.format(DEFAULT_SEARCH_LIMIT)})
+    @ns.response(400, 'No query, or a bad limit, was given')
+    @ns.response(501, 'Search is turned off, or there are too many Customers to index')
+    @ns.response(503, 'The search index is being built, retry after Retry-After seconds')
+    @ns.response(200, 'The best matching Customers, best first', [Search_model])
+    def get(self):
+        """
+        Search Customers for a typeahead
+
+        Every space separated term of ?q= has to start a word of the first
+        name, last name, username or email of a Customer, so ?q=jo sm
+        finds John Smith. Exact words rank before longer ones. The index
+        is only kept when the service runs with SEARCH_INDEX=true.
+        """
+        query = request.args.get('q', '').strip()
+        if not query:
+            raise BadRequest('q must be given')
+        try:
+            limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+        except ValueError:
+            raise BadRequest('limit must be a number')
+        if not 0 < limit <= MAX_SEARCH_LIMIT:
+            raise BadRequest('limit must be between 1 and {}'.format(MAX_SEARCH_LIMIT))
+        app.logger.info('Searching Customers for [%s]', query)
+        try:
+            return Customer.search(query, limit), status.HTTP_200_OK
+        except SearchDisabled as error:
+            return {'message': str(error)}, status.HTTP_501_NOT_IMPLEMENTED
+        except IndexNotReady as error:
+            return ({'message': str(error)}, status.HTTP_503_SERVICE_UNAVAILABLE,
+                    {'Retry-After': str(SEARCH_RETRY_AFTER)})
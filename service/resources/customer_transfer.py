@@ -0,0 +1,97 @@
+"""
+This module contains the Customer Export and Import Resources
+"""
+from flask import request, Response, stream_with_context
+from flask_restplus import Resource
+from flask_api import status
+from werkzeug.exceptions import BadRequest
+from service import app, ns
+from service.models import Customer
+from service.resilience import resilience
+from service.transfer import (EXPORTERS, READERS, FORMATS, EXPORT_BATCH_SIZE,
+                              Importer, CheckpointError, checkpoint_path, fingerprint)
+
+######################################################################
+#  PATH: /customers/export
+######################################################################
+
+@ns.route('/export')
+class CustomerExport(Resource):
+    """ Streams every Customer out of the database """
+
+    @ns.doc('export_customers', params={
+        'format': 'ndjson (the default) or csv, or ask for either with Accept'})
+    @ns.response(400, 'An unknown format was asked for')
+    @ns.response(200, 'Every Customer, one per line')
+    @ns.produces(list(FORMATS.values()))
+    def get(self):
+        """
+        Export all the Customers
+
+        The Customers are read in pages of _all_docs and sent as they are
+        read, with their _id and without their _rev, so the export can be
+        imported into another database.
+        """
+        name = request.args.get('format')
+        if name is None:
+            best = request.accept_mimetypes.best_match(list(FORMATS.values()))
+            name = 'csv' if best == FORMATS['csv'] else 'ndjson'
+        if name not in EXPORTERS:
+            raise BadRequest('format must be one of {}'.format(', '.join(sorted(EXPORTERS))))
+        app.logger.info('Exporting all Customers as %s', name)
+        customers = Customer.all(batch_size=EXPORT_BATCH_SIZE)
+
+        def generate():
+            # an export is as long as the database, so only the timeout
+            # of each database call bounds it, not the request deadline
+            resilience.end_request()
+            for chunk in EXPORTERS[name](customers):
+                yield chunk
+
+        return Response(stream_with_context(generate()), mimetype=FORMATS[name], headers={
+            'Content-Disposition': 'attachment; filename=customers.{}'.format(name)})
+
+######################################################################
+#  PATH: /customers/import
+######################################################################
+
+@ns.route('/import')
+class CustomerImport(Resource):
+    """ Loads Customers from an export """
+
+    @ns.doc('import_customers', params={
+        'checkpoint': 'a name for the import, so sending it again resumes it'})
+    @ns.response(400, 'The Content-Type or the checkpoint was not valid, '
+                      'or the checkpoint is of another body')
+    @ns.response(200, 'The counts of the Customers created, in conflict, '
+                      'invalid and failed, and the first errors')
+    def post(self):
+        """
+        Import Customers from NDJSON or CSV
+
+        The body is parsed as it is received and written in parallel
+        _bulk_docs batches. With ?checkpoint= the progress is kept on the
+        server, so when the upload breaks, posting the same body with the
+        same checkpoint skips the rows that were already written. The
+        checkpoint only resumes the import of the same body, by its length
+        and its first line, and is removed once the import is done.
+        """
+        content_type = request.mimetype
+        names = dict((mimetype, name) for name, mimetype in FORMATS.items())
+        if content_type not in names:
+            raise BadRequest('Unsupported Content-Type: {}'.format(content_type))
+        checkpoint = None
+        if 'checkpoint' in request.args:
+            try:
+                checkpoint = checkpoint_path(request.args['checkpoint'])
+            except ValueError as error:
+                raise BadRequest(str(error))
+        app.logger.info('Importing Customers from %s', names[content_type])
+        # an import is as long as its upload, like an export
+        resilience.end_request()
+        source, lines = fingerprint(request.stream, request.content_length)
+        try:
+            progress = Importer(checkpoint).run(READERS[names[content_type]](lines), source)
+        except CheckpointError as error:
+            raise BadRequest(str(error))
+        return progress, status.HTTP_200_OK
@@ -1,32 +1,47 @@
 from flask import abort, request
 from flask_api import status
-from flask_restful import Resource
+from flask_restplus import Resource
 #from service import app, api
-from service.models import Customer
-from service import app, api, apii, ns, Customer_model
+from service.models import Customer, ConflictError
+from service import app, api, ns, Customer_model
+from .customer_resource import CustomerResource
 
 ######################################################################
 # DISABLE AN CUSTOMER
 ######################################################################
 
-@ns.route('/<customer_id>/active')
+@ns.route('/<customer_id>/disable')
 @ns.param('customer_id', 'The Customer identifier')
 class DisableAction(Resource):
     """ Disable a Customer """
+    @ns.response(404, 'Customer not found')
+    @ns.response(409, 'The Customer was changed since the If-Match revision')
+    @ns.response(200, 'The disabled Customer', Customer_model)
     def put(self, customer_id):
-        """ Diable a Customer's active attributes in the database """
+        """ Diable a Customer's active attributes in the database
+
+        Like an update, it writes the revision given in If-Match, or the
+        current one when there is no If-Match header.
+        """
         app.logger.info('Disabling a Customer with id [{}]'.format(customer_id))
 
         content_type = request.headers.get('Content-Type')
         if not content_type or content_type != 'application/json':
             abort(status.HTTP_400_BAD_REQUEST, "No Content-Type set")
-        customer = Customer.find(customer_id)
+        # without If-Match the write replaces the current revision, which
+        # the cache may not have yet
+        customer = Customer.find(customer_id, cached=bool(request.if_match))
 
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, "Customer with id '{}' was not found.".format(customer_id))
 
         customer.active = "False"
-        customer.save()
-        message = customer.serialize()
+        customer._rev = CustomerResource.expected_rev(customer)
+        try:
+            customer.save()
+        except ConflictError:
+            abort(status.HTTP_409_CONFLICT,
+                  "Customer with id '{}' was changed by another request.".format(customer_id))
+        message = customer.to_api()
         return_code = status.HTTP_200_OK
-        return message, return_code
+        return message, return_code, {'ETag': '"{}"'.format(customer._rev)}
@@ -1,9 +1,13 @@
 """
 This module contains routes without Resources
 """
-from flask_restful import Resource
+from flask import Response, request, send_file, abort, jsonify
+from flask_restplus import Resource
 from flask_api import status
-from service import app, api
+from service import app, api, metrics
+from service.models import Customer
+from service.profiling import profiler
+from service.resilience import resilience
 from . import CustomerCollection
 
 ######################################################################
@@ -14,3 +18,83 @@ class HomePage(Resource):
     def get(self):
         """ Return something useful by default """
         return app.send_static_file('index.html')
+
+######################################################################
+# GET /metrics
+######################################################################
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """ Returns the Prometheus metrics of every worker """
+    body, content_type = metrics.latest()
+    return Response(body, status=status.HTTP_200_OK, content_type=content_type)
+
+
+######################################################################
+# GET /resilience
+######################################################################
+@app.route('/resilience', methods=['GET'])
+def resilience_stats():
+    """ Returns the retry and circuit breaker counters of the database calls
+
+    Only an admin with the X-Admin-Token header may read them.
+    """
+    if not profiler.authorized():
+        abort(status.HTTP_403_FORBIDDEN, 'Resilience counters need the admin token')
+    return jsonify(resilience.stats()), status.HTTP_200_OK
+
+
+######################################################################
+# GET /cache
+######################################################################
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    """ Returns the hit, miss and eviction counters of the Customer cache
+
+    Only an admin with the X-Admin-Token header may read them.
+    """
+    if not profiler.authorized():
+        abort(status.HTTP_403_FORBIDDEN, 'Cache counters need the admin token')
+    return jsonify(Customer.cache.stats()), status.HTTP_200_OK
+
+
+######################################################################
+# GET /profiles
+######################################################################
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """ Lists the stored request profiles, newest first
+
+    Only an admin with the X-Admin-Token header may read the profiles.
+    """
+    if not profiler.authorized():
+        abort(status.HTTP_403_FORBIDDEN, 'Profiles need the admin token')
+    return jsonify(profiler.profiles()), status.HTTP_200_OK
+
+######################################################################
+# GET /profiles/<profile_id>
+######################################################################
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """ Returns a request profile
+
+    The default is a text report of the slowest calls and their callers,
+    ?sort= and ?limit= change its order and length. ?format=pstats
+    returns the pstats file for snakeviz, gprof2dot or flameprof.
+    """
+    if not profiler.authorized():
+        abort(status.HTTP_403_FORBIDDEN, 'Profiles need the admin token')
+    if request.args.get('format') == 'pstats':
+        try:
+            return send_file(profiler.path(profile_id), mimetype='application/octet-stream',
+                             as_attachment=True,
+                             attachment_filename=profile_id + '.prof')
+        except IOError:
+            abort(status.HTTP_404_NOT_FOUND, 'Profile {} was not found'.format(profile_id))
+    try:
+        limit = int(request.args.get('limit', 50))
+        report = profiler.report(profile_id, request.args.get('sort', 'cumulative'), limit)
+    except (ValueError, KeyError):
+        abort(status.HTTP_400_BAD_REQUEST, 'Invalid sort or limit')
+    if report is None:
+        abort(status.HTTP_404_NOT_FOUND, 'Profile {} was not found'.format(profile_id))
+    return Response(report, status=status.HTTP_200_OK, content_type='text/plain')
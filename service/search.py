@@ -0,0 +1,323 @@
+"""
+Typeahead search
+
+SearchIndex - an inverted index from the words of the searched fields of
+              each Customer to their ids, kept in memory by every worker,
+              that finds the Customers whose words start with the words
+              of a query and ranks them
+
+The words are kept in a sorted list next to the postings, so the words
+that start with a prefix are one bisect away. The index is built from
+the database by a background thread, which the service starts as it
+boots when SEARCH_INDEX is on, so no request waits for it, and then
+follows the writes of this process and the _changes feed of the others.
+
+Each Customer takes about 2.7 KB of the memory of every worker, so an
+index holds at most max_docs of them; one that would hold more is dropped
+and searches are turned down instead.
+"""
+import re
+import heapq
+import bisect
+import logging
+import threading
+
+# the fields that are searched, and returned with each match
+SEARCH_FIELDS = ('first_name', 'last_name', 'username', 'email')
+
+# sorts after every other character, so a prefix is a range of words
+PREFIX_END = u'\ufff0'
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class IndexNotReady(Exception):
+    """ The index is searched before it was built """
+
+
+class SearchDisabled(Exception):
+    """ The index is turned off, or has more documents than it may hold """
+
+
+def normalize(text):
+    """ Returns a field value or a query as lowercase unicode """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    elif not isinstance(text, unicode):
+        text = unicode(text) if text is not None else u''
+    return text.strip().lower()
+
+
+def words(text):
+    """ Returns the lowercase words of a text, and the whole text
+
+    The whole text is kept too, so an email or a username can be found
+    by any prefix of it and not only by the prefixes of its parts.
+    """
+    text = normalize(text)
+    found = set(WORD.findall(text))
+    if text:
+        found.add(text)
+    return found
+
+
+class SearchIndex(object):
+    """ Finds Customers by the prefixes of their names, username and email """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, fields=SEARCH_FIELDS, max_expansions=2000, max_docs=0):
+        """ Initialize an empty index
+
+        Args:
+            fields (tuple): the document fields that are searched
+            max_expansions (int): the most words one term of a query is
+                expanded to, which bounds the work of a short prefix
+            max_docs (int): the most documents indexed, which bounds the
+                memory of the index, 0 for no limit
+        """
+        self.fields = fields
+        self.max_expansions = max_expansions
+        self.max_docs = max_docs
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._builder = None
+        self._generation = 0
+        self.clear(built=False)
+
+    def clear(self, built=True):
+        """ Empties the index
+
+        Args:
+            built (bool): False to build it again on the next search
+        """
+        with self._lock:
+            self._postings = {}     # word -> set of ids
+            self._words = []        # the words of _postings, sorted
+            self._docs = {}         # id -> the values of the fields
+            self.built = built
+            self.too_large = False
+            self._building = False
+            # a build that was running when the index was cleared stops
+            self._generation += 1
+
+    def __len__(self):
+        return len(self._docs)
+
+    @property
+    def active(self):
+        """ Checks if writes have to be applied, while or once it is built """
+        return self.built or self._building
+
+######################################################################
+#  M A I N T E N A N C E
+######################################################################
+
+    def build(self, load):
+        """ Indexes every document, unless the index is already built
+
+        Concurrent callers wait for the first one to finish. Writes
+        applied while the documents are read are kept, so nothing written
+        during the build is missed. A build stops when the index is
+        cleared, since its documents may be those of another database.
+
+        Args:
+            load (callable): returns an iterable of (id, doc)
+        """
+        with self._build_lock:
+            with self._lock:
+                if self.built:
+                    return
+                generation = self._generation
+                self._building = True
+            try:
+                for doc_id, doc in load():
+                    with self._lock:
+                        if self._generation != generation:
+                            return
+                        self._add(doc_id, doc, keep_sorted=False)
+                        if self._overflowed():
+                            return
+                with self._lock:
+                    if self._generation == generation:
+                        self._words = sorted(self._postings)
+                        self.built = True
+            finally:
+                with self._lock:
+                    if self._generation == generation:
+                        self._building = False
+
+    def start_build(self, load):
+        """ Builds the index in a background thread, unless it is built or being built
+
+        The thread runs outside of any request, so no request deadline
+        limits it, and a failed build is retried by the next call. An
+        index that turned out too large is not built again until it is
+        cleared.
+
+        Args:
+            load (callable): returns an iterable of (id, doc)
+        """
+        with self._lock:
+            if self.built or self.too_large:
+                return
+            if (self._builder is not None and self._builder.is_alive()
+                    and self._builder.generation == self._generation):
+                return
+            self._builder = threading.Thread(target=self._build_in_background, args=(load,),
+                                             name='search-index-build')
+            # a builder of an index that was cleared since stops by itself
+            self._builder.generation = self._generation
+            self._builder.daemon = True
+            self._builder.start()
+
+    def _build_in_background(self, load):
+        try:
+            self.build(load)
+        except Exception:    # pylint: disable=broad-except
+            SearchIndex.logger.exception('Building the search index failed')
+            self.clear(built=False)
+
+    def wait(self, timeout=None):
+        """ Waits for the background build, returns True once the index is built """
+        builder = self._builder
+        if builder is not None:
+            builder.join(timeout)
+        return self.built
+
+    def add(self, doc_id, doc):
+        """ Indexes a document, or indexes it again after it changed """
+        if not self.active or doc_id is None or doc_id.startswith('_design/'):
+            return
+        with self._lock:
+            self._add(doc_id, doc, keep_sorted=not self._building)
+            self._overflowed()
+
+    def remove(self, doc_id):
+        """ Drops a document from the index """
+        if not self.active:
+            return
+        with self._lock:
+            self._remove(doc_id, keep_sorted=not self._building)
+
+    def _overflowed(self):
+        """ Drops the index once it holds more than max_docs documents """
+        if not self.max_docs or len(self._docs) <= self.max_docs:
+            return False
+        SearchIndex.logger.warning('The search index holds more than %d documents, '
+                                   'searches are turned down', self.max_docs)
+        self.clear(built=False)
+        self.too_large = True
+        return True
+
+    def _add(self, doc_id, doc, keep_sorted):
+        values = tuple(doc.get(field) for field in self.fields)
+        if self._docs.get(doc_id) == values:
+            return
+        self._remove(doc_id, keep_sorted)
+        self._docs[doc_id] = values
+        for word in set().union(*[words(value) for value in values]):
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = set()
+                if keep_sorted:
+                    bisect.insort(self._words, word)
+            posting.add(doc_id)
+
+    def _remove(self, doc_id, keep_sorted):
+        values = self._docs.pop(doc_id, None)
+        if values is None:
+            return
+        for word in set().union(*[words(value) for value in values]):
+            posting = self._postings.get(word)
+            if posting is None:
+                continue
+            posting.discard(doc_id)
+            if not posting:
+                del self._postings[word]
+                if keep_sorted:
+                    del self._words[bisect.bisect_left(self._words, word)]
+
+######################################################################
+#  S E A R C H
+######################################################################
+
+    def search(self, query, limit=10):
+        """ Returns the best matches of a query, best first
+
+        Every term of the query, split on spaces, has to start a word of
+        the document or one of its whole fields. A match scores the length
+        of the term over the length of the word it starts, so exact words
+        rank first, and the scores of the terms add up; ties are ordered
+        by the fields.
+
+        A single term reads the words it starts shortest first and stops
+        once it has limit matches, so a short prefix of a common word does
+        not score every Customer that has it; equal scores at the limit
+        are then cut in no particular order.
+
+        Returns:
+            a list of dicts with the _id, the searched fields and the score
+        """
+        terms = set(normalize(query).split())
+        if not terms or limit <= 0:
+            return []
+        with self._lock:
+            # the term with the fewest matches narrows the others the most
+            expanded = sorted((self._expand(term) for term in terms),
+                              key=lambda expansion: expansion[2])
+            if len(expanded) == 1:
+                scores = self._first(expanded[0][0], expanded[0][1], limit)
+            else:
+                scores = None
+                for term, found, _ in expanded:
+                    scores = self._match(term, found, scores)
+                    if not scores:
+                        return []
+            best = heapq.nsmallest(limit, scores.items(),
+                                   key=lambda item: (-item[1], self._docs[item[0]], item[0]))
+            return [self._result(doc_id, score) for doc_id, score in best]
+
+    def _expand(self, term):
+        """ Returns the term, the words it starts and how many documents they have """
+        start = bisect.bisect_left(self._words, term)
+        end = bisect.bisect_left(self._words, term + PREFIX_END, start)
+        found = self._words[start:min(end, start + self.max_expansions)]
+        return term, found, sum(len(self._postings[word]) for word in found)
+
+    def _first(self, term, found, limit):
+        """ Scores the first limit documents of the words, shortest first """
+        scores = {}
+        for word in sorted(found, key=len):
+            score = float(len(term)) / len(word)
+            for doc_id in self._postings[word]:
+                scores.setdefault(doc_id, score)
+                if len(scores) >= limit:
+                    return scores
+        return scores
+
+    def _match(self, term, found, scores):
+        """ Scores the documents that have one of the words term starts
+
+        Only the documents in scores, the matches of the previous terms,
+        are kept, and their scores are added to.
+        """
+        within = None if scores is None else set(scores)
+        matched = {}
+        for word in found:
+            posting = self._postings[word]
+            if within is not None:
+                posting = posting & within
+            score = float(len(term)) / len(word)
+            for doc_id in posting:
+                if matched.get(doc_id, 0) < score:
+                    matched[doc_id] = score
+        if scores is not None:
+            for doc_id in matched:
+                matched[doc_id] += scores[doc_id]
+        return matched
+
+    def _result(self, doc_id, score):
+        result = dict(zip(self.fields, self._docs[doc_id]))
+        result['_id'] = doc_id
+        result['score'] = round(score, 3)
+        return result
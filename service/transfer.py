@@ -0,0 +1,324 @@
+"""
+Export and import of Customers
+
+export_ndjson, export_csv - generators of the chunks of an export of every
+                            Customer, read in pages of _all_docs
+read_ndjson, read_csv     - parse an import one line at a time, so a file
+                            or an upload is never held in memory
+Importer                  - validates the parsed records with
+                            Customer.deserialize and saves them in parallel
+                            _bulk_docs batches, checkpointing the rows it
+                            is done with so an interrupted import resumes
+fingerprint               - identifies the source of an import, so that a
+                            checkpoint only resumes the import of the
+                            same file
+
+An export keeps the _id of each Customer and drops its _rev, so importing
+it into another database keeps the ids, and importing it again only
+conflicts with the Customers that are already there. The rows without an
+_id are given one made from the source and the row, so the same goes for
+them.
+"""
+import os
+import re
+import csv
+import json
+import hashlib
+import tempfile
+import uuid
+from itertools import chain
+from collections import deque
+from multiprocessing.pool import ThreadPool
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from .models import Customer, DataValidationError, FIELD_NAMES, QUERY_KINDS, chunks
+from .query import convert
+from .fastjson import dumps
+
+# number of documents read per _all_docs request by an export
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+# number of rows per _bulk_docs batch, and batches written at once, by an import
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', '4'))
+# where the checkpoints of the imports made through the API are kept
+IMPORT_CHECKPOINT_DIR = os.environ.get(
+    'IMPORT_CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'customers-imports'))
+
+NDJSON = 'application/x-ndjson'
+CSV = 'text/csv'
+FORMATS = {'ndjson': NDJSON, 'csv': CSV}
+# the columns of a CSV export, in order, which an import reads back
+CSV_COLUMNS = ('_id',) + FIELD_NAMES
+# Customers encoded per chunk of an export
+EXPORT_CHUNK_SIZE = 100
+
+
+def exported(customer):
+    """ Returns the document of a Customer as it is exported """
+    doc = customer.serialize()
+    doc.pop('_rev', None)
+    return doc
+
+
+def export_ndjson(customers):
+    """ Generator of an NDJSON export, a chunk of Customers at a time """
+    for chunk in chunks(customers, EXPORT_CHUNK_SIZE):
+        yield ''.join(dumps(exported(customer)) + '\n' for customer in chunk)
+
+
+def export_csv(customers):
+    """ Generator of a CSV export with a header row, a chunk of Customers at a time """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+    for chunk in chunks(customers, EXPORT_CHUNK_SIZE):
+        buffer.seek(0)
+        buffer.truncate()
+        for customer in chunk:
+            doc = exported(customer)
+            writer.writerow([encode(doc.get(column)) for column in CSV_COLUMNS])
+        yield buffer.getvalue()
+
+
+def encode(value):
+    """ Returns a value as the UTF-8 text of a CSV cell """
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+EXPORTERS = {'ndjson': export_ndjson, 'csv': export_csv}
+
+######################################################################
+#  P A R S E R S
+######################################################################
+
+
+def read_ndjson(lines):
+    """ Generator of (line number, document, error) of NDJSON lines
+
+    Blank lines are skipped. A line that is not a JSON object comes with
+    an error and no document.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield number, None, 'Invalid customer: not JSON'
+            continue
+        if not isinstance(data, dict):
+            yield number, None, 'Invalid customer: not an object'
+            continue
+        yield number, data, None
+
+
+def read_csv(lines):
+    """ Generator of (line number, document, error) of CSV lines
+
+    The first line names the columns, like the header of an export. The
+    Integer and Boolean fields are converted back from text, and an empty
+    _id is left out so the Customer gets a new one.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [column.strip() for column in header]
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        data = dict((column, cell.decode('utf-8') if isinstance(cell, bytes) else cell)
+                    for column, cell in zip(header, row))
+        if not data.get('_id'):
+            data.pop('_id', None)
+        try:
+            for field in data:
+                if QUERY_KINDS.get(field) in ('Integer', 'Boolean') and data[field] != '':
+                    data[field] = convert(field, QUERY_KINDS[field], data[field])
+        except ValueError as error:
+            yield reader.line_num, None, 'Invalid customer: {}'.format(error)
+            continue
+        yield reader.line_num, data, None
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def fingerprint(lines, size=None):
+    """ Returns the fingerprint of an import source, and its lines to read
+
+    The fingerprint is the size of the source, when it is known, and a
+    digest of its first line, which is read ahead and given back with the
+    rest of the lines.
+    """
+    lines = iter(lines)
+    first = next(lines, b'')
+    digest = hashlib.sha1(first.encode('utf-8') if isinstance(first, unicode) else first)
+    return '{}:{}'.format('' if size is None else size, digest.hexdigest()), chain([first], lines)
+
+
+def checkpoint_path(name):
+    """ Returns the checkpoint file of an import named through the API
+
+    Raises:
+        ValueError: when the name is not letters, digits, - and _ only
+    """
+    if not re.match(r'^[\w-]{1,100}$', name):
+        raise ValueError('checkpoint must be letters, digits, - and _ only')
+    return os.path.join(IMPORT_CHECKPOINT_DIR, name + '.json')
+
+######################################################################
+#  I M P O R T E R
+######################################################################
+
+
+class CheckpointError(Exception):
+    """ Used when a checkpoint belongs to the import of another source """
+    pass
+
+
+class Importer(object):
+    """ Saves parsed records in parallel batches and checkpoints its progress
+
+    The checkpoint holds the fingerprint of the source and the line
+    number up to which every row has been written, with the counts so far.
+    Batches finish in any order but are only checkpointed in order, so when
+    an import stops, running it again with the same checkpoint skips the
+    rows that are done and repeats at most the batches that were being
+    written. Every row has an _id before it is written, so a repeated row
+    is a conflict rather than a duplicate. The checkpoint is removed once
+    the import is done.
+    """
+
+    def __init__(self, checkpoint=None, batch_size=None, workers=None, max_errors=100):
+        """ Initialize the importer
+
+        Args:
+            checkpoint (string): the checkpoint file, None to not resume
+            batch_size (int): rows sent per _bulk_docs request
+            workers (int): batches written at the same time
+            max_errors (int): the most errors reported, the rest are counted
+        """
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size or IMPORT_BATCH_SIZE
+        self.workers = workers or IMPORT_WORKERS
+        self.max_errors = max_errors
+
+    def load(self, source=None):
+        """ Returns the progress in the checkpoint, or that of a new import
+
+        A checkpoint of an import that is done is not resumed.
+        Raises:
+            CheckpointError: when the checkpoint is of another source
+        """
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as checkpoint:
+                progress = json.load(checkpoint)
+            if source is not None and progress.get('source') != source:
+                raise CheckpointError('The checkpoint is of the import of another source')
+            if not progress['done']:
+                return progress
+        # without a fingerprint, the ids of the rows are only fixed for this import
+        return {'source': source or uuid.uuid4().hex, 'line': 0, 'created': 0,
+                'conflicts': 0, 'invalid': 0, 'failed': 0, 'errors': [], 'done': False}
+
+    def save(self, progress):
+        """ Writes the progress to the checkpoint, whole or not at all """
+        if not self.checkpoint:
+            return
+        directory = os.path.dirname(os.path.abspath(self.checkpoint))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary = self.checkpoint + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(progress, checkpoint)
+        os.rename(temporary, self.checkpoint)
+
+    def remove(self):
+        """ Removes the checkpoint of an import that is done """
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def run(self, records, source=None):
+        """ Imports (line number, document, error) records
+
+        Args:
+            records (iterable): the records of a reader
+            source (string): the fingerprint of the source of the records
+        Returns:
+            the progress: the last line done, the number of Customers
+            created, of conflicts with existing ones, of invalid and of
+            failed rows, the first errors and whether it is done
+        Raises:
+            CheckpointError: when the checkpoint is of another source
+            any error of a batch write, after checkpointing the batches
+            written before it
+        """
+        progress = self.load(source)
+        todo = (record for record in records if record[0] > progress['line'])
+        pool = ThreadPool(self.workers)
+        writing = deque()
+        try:
+            for batch in chunks(todo, self.batch_size):
+                writing.append(self.write(pool, batch, progress['source']))
+                if len(writing) >= self.workers:
+                    self.finish(writing.popleft(), progress)
+            while writing:
+                self.finish(writing.popleft(), progress)
+        finally:
+            pool.terminate()
+        progress['done'] = True
+        self.remove()
+        return progress
+
+    def write(self, pool, batch, source):
+        """ Validates a batch and starts saving its valid Customers """
+        lines = []
+        customers = []
+        invalid = []
+        for line, data, error in batch:
+            if error is None:
+                data.pop('_rev', None)
+                if not data.get('_id'):
+                    data['_id'] = row_id(source, line, data)
+                try:
+                    customers.append(Customer().deserialize(data))
+                    lines.append(line)
+                    continue
+                except DataValidationError as invalid_error:
+                    error = str(invalid_error)
+            invalid.append((line, error))
+        saving = pool.apply_async(Customer.save_many, (customers, self.batch_size, False))
+        return batch[-1][0], lines, invalid, saving
+
+    def finish(self, written, progress):
+        """ Waits for a batch to be saved and checkpoints it """
+        last_line, lines, invalid, saving = written
+        errors = [(line, 'invalid', reason) for line, reason in invalid]
+        progress['invalid'] += len(invalid)
+        for line, result in zip(lines, saving.get()):
+            if 'ok' in result:
+                progress['created'] += 1
+            elif result['error'] == 'conflict':
+                progress['conflicts'] += 1
+            else:
+                progress['failed'] += 1
+                errors.append((line, result['error'], result['reason']))
+        for line, error, reason in sorted(errors):
+            if len(progress['errors']) < self.max_errors:
+                progress['errors'].append({'line': line, 'error': error, 'reason': reason})
+        progress['line'] = last_line
+        self.save(progress)
+
+
+def row_id(source, line, data):
+    """ Returns the _id of a row without one, the same each time it is imported """
+    row = json.dumps([source, line, data], sort_keys=True)
+    return hashlib.md5(row.encode('utf-8')).hexdigest()
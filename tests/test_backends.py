@@ -0,0 +1,163 @@
+"""
+Test cases for the storage backends that need no running service
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import unittest
+from service.backends import MemoryBackend, SQLiteBackend
+
+INDEXES = {'username-index': ['username'], 'address-index': ['address']}
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+class BackendTests(object):
+    """ Behaviour every storage backend must have """
+
+    def make_backend(self):
+        """ Returns the backend under test """
+        raise NotImplementedError()
+
+    def setUp(self):
+        self.backend = self.make_backend()
+        self.backend.create_indexes(INDEXES)
+        self.backend.remove_all('bulk')
+
+    def tearDown(self):
+        self.backend.close()
+
+    def test_create_and_get(self):
+        """ Create a document and get it back with a revision """
+        doc_id = self.backend.create({'username': 'kerker'})
+        doc = self.backend.get(doc_id)
+        self.assertEqual(doc['_id'], doc_id)
+        self.assertEqual(doc['username'], 'kerker')
+        self.assertTrue(doc['_rev'].startswith('1-'))
+        self.assertIsNone(self.backend.get('missing'))
+
+    def test_update(self):
+        """ Update a document and bump its revision """
+        doc_id = self.backend.create({'username': 'kerker'})
+        self.backend.update({'_id': doc_id, 'username': 'haha'})
+        doc = self.backend.get(doc_id)
+        self.assertEqual(doc['username'], 'haha')
+        self.assertTrue(doc['_rev'].startswith('2-'))
+        self.assertEqual(self.backend.find({'username': 'kerker'}), [])
+
+    def test_update_missing(self):
+        """ Updating a missing document creates nothing """
+        self.backend.update({'_id': 'missing', 'username': 'haha'})
+        self.assertIsNone(self.backend.get('missing'))
+
+    def test_delete(self):
+        """ Delete a document """
+        doc_id = self.backend.create({'username': 'kerker'})
+        self.backend.delete(doc_id)
+        self.assertIsNone(self.backend.get(doc_id))
+        self.assertEqual(self.backend.find({'username': 'kerker'}), [])
+
+    def test_find(self):
+        """ Find documents with indexed and unindexed fields """
+        self.backend.create({'username': 'kerker', 'address': 'ny', 'active': True})
+        self.backend.create({'username': 'Ker', 'address': 'ny', 'active': False})
+        self.backend.create({'username': 'kuku', 'address': 'nj', 'active': False})
+        self.assertEqual(len(self.backend.find({'address': 'ny'})), 2)
+        self.assertEqual(len(self.backend.find({'address': 'ny', 'active': False})), 1)
+        self.assertEqual(len(self.backend.find({'active': False})), 2)
+        self.assertEqual(self.backend.find({'username': 'nobody'}), [])
+
+    def test_find_and_list_some_fields(self):
+        """ Return only the requested fields """
+        doc_id = self.backend.create({'username': 'kerker', 'address': 'ny'})
+        self.assertEqual(self.backend.find({'address': 'ny'}, fields=['_id', 'username']),
+                         [{'_id': doc_id, 'username': 'kerker'}])
+        self.assertEqual(list(self.backend.all_docs(10, fields=['address'])), [{'address': 'ny'}])
+
+    def test_all_docs_in_batches(self):
+        """ List every document across several batches """
+        for i in range(7):
+            self.backend.create({'username': 'user{}'.format(i)})
+        docs = list(self.backend.all_docs(3))
+        self.assertEqual(len(docs), 7)
+        ids = [doc['_id'] for doc in docs]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_page(self):
+        """ Page through documents matched by unindexed fields """
+        for i in range(7):
+            self.backend.create({'username': 'user{}'.format(i), 'active': i % 2 == 0})
+        docs, cursor = self.backend.page({'active': True}, 3)
+        self.assertEqual(len(docs), 3)
+        rest, cursor = self.backend.page({'active': True}, 3, cursor)
+        self.assertEqual(len(rest), 1)
+        self.assertIsNone(cursor)
+        ids = [doc['_id'] for doc in docs + rest]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_bulk_save_and_delete(self):
+        """ Create, update and delete documents in bulk """
+        statuses = self.backend.bulk_save([{'username': 'a'}, {'username': 'b'}])
+        self.assertTrue(all(status['ok'] for status in statuses))
+        ids = [status['id'] for status in statuses]
+        self.backend.bulk_save([{'_id': ids[0], 'username': 'c'}])
+        self.assertEqual(self.backend.get(ids[0])['username'], 'c')
+        statuses = self.backend.bulk_save([{'_id': ids[0], 'username': 'd'}], update=False)
+        self.assertEqual(statuses[0]['error'], 'conflict')
+        stale = dict(self.backend.get(ids[1]), username='d')
+        self.backend.bulk_save([{'_id': ids[1], 'username': 'e'}])
+        statuses = self.backend.bulk_save([stale, {'_id': 'new', '_rev': '1-x', 'username': 'f'}])
+        self.assertEqual([status['error'] for status in statuses], ['conflict', 'conflict'])
+        self.assertEqual(self.backend.get(ids[1])['username'], 'e')
+        self.assertEqual(self.backend.get(ids[0])['username'], 'c')
+        statuses = self.backend.bulk_delete(ids + ['missing'])
+        self.assertTrue(statuses[0]['ok'])
+        self.assertTrue(statuses[1]['ok'])
+        self.assertEqual(statuses[2]['error'], 'not_found')
+        self.assertEqual(list(self.backend.all_docs(10)), [])
+
+    def test_remove_all(self):
+        """ Remove all documents and keep using the indexes """
+        self.backend.create({'username': 'kerker'})
+        self.backend.remove_all('bulk')
+        self.assertEqual(list(self.backend.all_docs(10)), [])
+        self.backend.create({'username': 'kerker'})
+        self.assertEqual(len(self.backend.find({'username': 'kerker'})), 1)
+
+    def test_update_seq(self):
+        """ Every write changes the update_seq """
+        seqs = [self.backend.update_seq()]
+        doc_id = self.backend.create({'username': 'kerker'})
+        seqs.append(self.backend.update_seq())
+        self.backend.update({'_id': doc_id, 'username': 'haha'})
+        seqs.append(self.backend.update_seq())
+        self.backend.get(doc_id)
+        self.assertEqual(self.backend.update_seq(), seqs[-1])
+        self.backend.delete(doc_id)
+        seqs.append(self.backend.update_seq())
+        self.assertEqual(len(set(seqs)), 4)
+
+
+class TestMemoryBackend(BackendTests, unittest.TestCase):
+    """ Test Cases for MemoryBackend """
+
+    def make_backend(self):
+        return MemoryBackend('test')
+
+
+class TestSQLiteBackend(BackendTests, unittest.TestCase):
+    """ Test Cases for SQLiteBackend """
+
+    def make_backend(self):
+        return SQLiteBackend('test', ':memory:')
+
+
+######################################################################
+#   M A I N
+######################################################################
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Test cases for the Customer cache
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import unittest
+from service.cache import LRUCache
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+class FakeClock(object):
+    """ A clock that only moves when told to """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    """ Test Cases for LRUCache """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_hit_and_miss(self):
+        """ Get a cached and a missing key """
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_lru_eviction(self):
+        """ Evict the least recently used key """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_ttl_expiration(self):
+        """ Expire an entry after its time to live """
+        self.cache.set('a', 1)
+        self.clock.now += 9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.expirations, 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate_and_clear(self):
+        """ Invalidate one key and clear the cache """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.invalidate('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_disabled(self):
+        """ A cache with no size stores nothing """
+        cache = LRUCache(maxsize=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_stats(self):
+        """ Report the counters """
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        stats = self.cache.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['maxsize'], 2)
+        self.assertEqual(stats['hits'], 1)
+
+
+######################################################################
+#   M A I N
+######################################################################
+if __name__ == '__main__':
+    unittest.main()
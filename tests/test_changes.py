@@ -0,0 +1,88 @@
+"""
+Test cases for the changes feed follower
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import unittest
+from requests import ConnectionError
+from service.changes import ChangesFollower
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+class FakeFeed(object):
+    """ A _changes feed that replays a list of lines """
+
+    def __init__(self, lines, error=None, last_seq=None):
+        self.lines = lines
+        self.error = error
+        self.last_seq = last_seq
+
+    def __iter__(self):
+        for line in self.lines:
+            yield line
+        if self.error:
+            raise self.error
+
+    def stop(self):
+        pass
+
+
+class FakeDatabase(object):
+    """ A database whose changes() hands out FakeFeeds in turn """
+
+    def __init__(self, feeds, follower=None):
+        self.feeds = list(feeds)
+        self.calls = []
+        self.follower = follower
+
+    def changes(self, **options):
+        self.calls.append(options)
+        if not self.feeds:
+            self.follower.stop()
+            return FakeFeed([])
+        return self.feeds.pop(0)
+
+
+class TestChangesFollower(unittest.TestCase):
+    """ Test Cases for ChangesFollower """
+
+    def follow(self, feeds):
+        """ Runs a follower over the feeds and returns the changes seen """
+        changes = []
+        database = FakeDatabase(feeds)
+        follower = ChangesFollower(database, changes.append, retry_delay=0)
+        database.follower = follower
+        follower.start()
+        follower.join(5)
+        self.assertFalse(follower.is_alive())
+        return changes, database, follower
+
+    def test_callback_for_each_change(self):
+        """ Call back with every change and skip heartbeats """
+        feed = FakeFeed([{'seq': '1-a', 'id': 'x'}, None, {'seq': '2-b', 'id': 'y'}])
+        changes, _, _ = self.follow([feed])
+        self.assertEqual([change['id'] for change in changes], ['x', 'y'])
+
+    def test_resume_after_reconnect(self):
+        """ Resume from the last seen seq when the feed fails """
+        first = FakeFeed([{'seq': '1-a', 'id': 'x'}], error=ConnectionError())
+        second = FakeFeed([{'seq': '2-b', 'id': 'y'}], last_seq='2-b')
+        changes, database, follower = self.follow([first, second])
+        self.assertEqual([change['id'] for change in changes], ['x', 'y'])
+        self.assertEqual(database.calls[0]['since'], 'now')
+        self.assertEqual(database.calls[1]['since'], '1-a')
+        self.assertEqual(database.calls[2]['since'], '2-b')
+        self.assertGreater(follower.reconnects, 0)
+
+
+######################################################################
+#   M A I N
+######################################################################
+if __name__ == '__main__':
+    unittest.main()
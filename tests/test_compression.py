@@ -0,0 +1,135 @@
+"""
+Test cases for the response compression
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import zlib
+import unittest
+from flask import Flask, Response, jsonify
+from service import compression
+from service.compression import Compressor
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+BODY = {'customers': [{'first_name': 'fido', 'last_name': 'dog'}] * 100}
+
+
+def gunzip(data):
+    """ Returns the body of a gzip stream """
+    return zlib.decompress(data, compression.GZIP_WBITS)
+
+
+class TestCompressor(unittest.TestCase):
+    """ Test Cases for Compressor """
+
+    def setUp(self):
+        app = Flask(__name__)
+        Compressor(min_size=100, level=1).init_app(app)
+
+        @app.route('/big')
+        def big():
+            response = jsonify(BODY)
+            response.set_etag('rev-1')
+            return response
+
+        @app.route('/small')
+        def small():
+            return jsonify(ok=True)
+
+        @app.route('/stream')
+        def stream():
+            def generate():
+                for number in range(50):
+                    yield u'{{"number": {}}}\n'.format(number)
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        @app.route('/image')
+        def image():
+            return Response(b'\x89PNG' * 100, mimetype='image/png')
+
+        self.app = app.test_client()
+
+    def get(self, path, encoding='gzip'):
+        """ Gets a path accepting an encoding """
+        return self.app.get(path, headers={'Accept-Encoding': encoding})
+
+    def test_gzip(self):
+        """ Compress a large JSON body with gzip """
+        resp = self.get('/big')
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(int(resp.headers['Content-Length']), len(resp.data))
+        self.assertEqual(gunzip(resp.data), self.app.get('/big').data)
+
+    def test_weak_etag(self):
+        """ Make the tag of a compressed body weak """
+        self.assertEqual(self.get('/big').headers['ETag'], 'W/"rev-1"')
+        self.assertEqual(self.get('/big', 'identity').headers['ETag'], '"rev-1"')
+
+    def test_not_accepted(self):
+        """ Send the body as it is to a client that does not accept gzip """
+        for encoding in ('identity', 'gzip;q=0', 'compress'):
+            resp = self.get('/big', encoding)
+            self.assertNotIn('Content-Encoding', resp.headers)
+            self.assertEqual(resp.data, self.app.get('/big').data)
+
+    def test_small_body(self):
+        """ Send a body under the minimum size as it is """
+        resp = self.get('/small')
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+
+    def test_other_types(self):
+        """ Send bodies that are not text as they are """
+        resp = self.get('/image')
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(self.get('/missing').status_code, 404)
+        self.assertNotIn('Content-Encoding', self.get('/missing').headers)
+
+    def test_stream(self):
+        """ Compress a streamed body chunk by chunk """
+        resp = self.get('/stream')
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', resp.headers)
+        lines = gunzip(resp.data).splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(lines[-1], '{"number": 49}')
+
+    def test_stream_chunks_are_flushed(self):
+        """ Send each chunk of a stream as soon as it is compressed """
+        stream = Compressor(level=6).stream('gzip')
+        decompressor = zlib.decompressobj(compression.GZIP_WBITS)
+        for line in ('{"number": 1}\n', '{"number": 2}\n'):
+            self.assertEqual(decompressor.decompress(stream.process(line)), line)
+        decompressor.decompress(stream.finish())
+        self.assertTrue(decompressor.unused_data == '' and decompressor.flush() == '')
+
+    @unittest.skipIf(compression.brotli is None, 'needs the brotli package')
+    def test_brotli(self):
+        """ Prefer brotli when the client accepts it """
+        resp = self.get('/big', 'gzip, br')
+        self.assertEqual(resp.headers['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(resp.data), self.app.get('/big').data)
+        resp = self.get('/stream', 'br')
+        self.assertEqual(len(compression.brotli.decompress(resp.data).splitlines()), 50)
+        self.assertEqual(self.get('/big', 'br;q=0.5, gzip').headers['Content-Encoding'], 'gzip')
+
+    def test_without_brotli(self):
+        """ Only offer gzip when brotli is not installed """
+        brotli, compression.brotli = compression.brotli, None
+        try:
+            self.assertEqual(self.get('/big', 'br, gzip;q=0.5').headers['Content-Encoding'],
+                             'gzip')
+        finally:
+            compression.brotli = brotli
+
+    def test_disabled(self):
+        """ Hook nothing into the app when compression is off """
+        app = Flask(__name__)
+        Compressor(enabled=False).init_app(app)
+        self.assertEqual(app.after_request_funcs, {})
@@ -23,9 +23,11 @@ Test cases can be run with:
 import os
 import json
 import time  # use for rate limiting Cloudant Lite :(
+import types
 import unittest
 from mock import patch
-from service.models import Customer, DataValidationError
+from service.models import (Customer, DataValidationError, ConflictError, IndexNotReady,
+                            SearchDisabled, FIELD_NAMES)
 from requests import HTTPError, ConnectionError
 
 ######################################################################
@@ -73,6 +75,11 @@ if 'VCAP_SERVICES' in os.environ or 'BINDING_CLOUDANT' in os.environ:
 else:
     WAIT_SECONDS = 0
 
+# tests of Cloudant specifics are skipped with the memory or sqlite backends
+cloudant_only = unittest.skipUnless(
+    os.environ.get('STORAGE_BACKEND', 'cloudant').lower() == 'cloudant',
+    'needs the Cloudant storage backend')
+
 class TestCustomers(unittest.TestCase):
     """ Test Cases for Customers """
 
@@ -108,7 +115,7 @@ class TestCustomers(unittest.TestCase):
 
     def test_add_a_customer(self):
         """ Create a customer and add it to the database """
-        customers = Customer.all()
+        customers = list(Customer.all())
         time.sleep(WAIT_SECONDS)
         self.assertEqual(customers, [])
         customer = Customer("Arturo", "Frank", "USA", "abc@abc.com", "IAmUser", "password", "1231231234", True, 1)
@@ -117,17 +124,19 @@ class TestCustomers(unittest.TestCase):
         customer.save()
         time.sleep(WAIT_SECONDS)
         self.assertNotEqual(customer._id, None)
-        customers = Customer.all()
+        customers = list(Customer.all())
         time.sleep(WAIT_SECONDS)
         self.assertEqual(len(customers), 1)
 
-    @patch('cloudant.database.CloudantDatabase.create_document')
+    @cloudant_only
+    @patch('requests.Session.post')
     def test_create_customer_with_http_error(self, bad_mock):
         """ Create a customer with http error """
         bad_mock.side_effect = HTTPError()
         customer = Customer("Arturo", "Frank", "USA", "abc@abc.com", "IAmUser", "password", "1231231234", True, 1)
         customer.save()
         time.sleep(WAIT_SECONDS)
+        self.assertEqual(customer._id, None)
 
     def test_update_a_customer(self):
         """ Update a Customer"""
@@ -141,20 +150,177 @@ class TestCustomers(unittest.TestCase):
         time.sleep(WAIT_SECONDS)
         # Fetch it back and make sure the id hasn't changed
         # but the data did change
-        customers = Customer.all()
+        customers = list(Customer.all())
         time.sleep(WAIT_SECONDS)
         self.assertEqual(len(customers), 1)
         self.assertEqual(customers[0].first_name, "k9")
 
+    def test_update_tracks_revision(self):
+        """ Update a Customer at the revision it was read with """
+        Customer("Arturo", "Frank", username="IAmUser", id=1).save()
+        customer = Customer.find_by_name("IAmUser")[0]
+        rev = customer._rev
+        self.assertIsNotNone(rev)
+        customer.first_name = "k9"
+        customer.save()
+        self.assertNotEqual(customer._rev, rev)
+        self.assertEqual(Customer.find(customer._id)._rev, customer._rev)
+
+    def test_update_conflict(self):
+        """ Update a Customer that was changed since it was read """
+        Customer("Arturo", "Frank", username="IAmUser", id=1).save()
+        first = Customer.find_by_name("IAmUser")[0]
+        second = Customer.find_by_name("IAmUser")[0]
+        first.first_name = "k9"
+        first.save()
+        second.first_name = "k10"
+        self.assertRaises(ConflictError, second.save)
+        self.assertEqual(Customer.find(first._id).first_name, "k9")
+
+    def test_read_some_fields(self):
+        """ Read Customers with only some of their fields """
+        Customer("Arturo", "Frank", "USA", "abc@abc.com", "IAmUser", "password", "123", True, 1).save()
+        customers = list(Customer.all(fields=['username', 'email']))
+        self.assertEqual(customers[0].username, "IAmUser")
+        self.assertEqual(customers[0].email, "abc@abc.com")
+        self.assertIsNotNone(customers[0]._id)
+        self.assertEqual(customers[0].password, '')
+        customers = Customer.find_by(fields=['first_name'], username="IAmUser")
+        self.assertEqual(customers[0].first_name, "Arturo")
+        self.assertEqual(customers[0].address, '')
+
+    def test_page_through_customers(self):
+        """ Read the Customers one page at a time """
+        for i in range(5):
+            Customer("Arturo", "Frank", address="ny" if i % 2 else "nj",
+                     username="user{}".format(i), id=i).save()
+        usernames = []
+        cursor = None
+        while True:
+            customers, cursor = Customer.page(2, cursor)
+            self.assertTrue(len(customers) <= 2)
+            usernames.extend(customer.username for customer in customers)
+            if cursor is None:
+                break
+        self.assertEqual(sorted(usernames), ["user{}".format(i) for i in range(5)])
+        customers, cursor = Customer.page(10, address="ny")
+        self.assertEqual(sorted(c.username for c in customers), ["user1", "user3"])
+        self.assertIsNone(cursor)
+
     def test_delete_a_customer(self):
         """ Delete a Customer"""
         customer = Customer("Arturo", "Frank", "USA", "abc@abc.com", "IAmUser", "password", "1231231234", True, 1)
         customer.save()
         time.sleep(WAIT_SECONDS)
-        self.assertEqual(len(Customer.all()), 1)
+        self.assertEqual(len(list(Customer.all())), 1)
         # delete the customer and make sure it isn't in the database
         customer.delete()
-        self.assertEqual(len(Customer.all()), 0)
+        self.assertEqual(len(list(Customer.all())), 0)
+
+    def test_delete_a_recreated_customer(self):
+        """ Delete a Customer that was deleted and created again with its _id """
+        customer = Customer("Arturo", "Frank", username="afrank")
+        customer.save()
+        time.sleep(WAIT_SECONDS)
+        customer.delete()
+        again = Customer().deserialize(dict(customer.serialize(), _id=customer._id))
+        self.assertNotIn('error', Customer.save_many([again])[0])
+        time.sleep(WAIT_SECONDS)
+        self.assertIsNotNone(Customer.find(customer._id))
+        again.delete()
+        self.assertIsNone(Customer.find(customer._id))
+        again.delete()
+
+    @cloudant_only
+    def test_delete_a_changed_customer(self):
+        """ Raise ConflictError when a Customer changes while it is deleted """
+        customer = Customer("Arturo", "Frank", username="afrank")
+        customer.save()
+        stale = Customer.backend._current_revs([customer._id])
+        customer.first_name = "k9"
+        customer.save()
+        with patch.object(Customer.backend, '_current_revs', return_value=stale):
+            self.assertRaises(ConflictError, customer.delete)
+        self.assertEqual(Customer.find(customer._id).first_name, "k9")
+
+    def test_all_is_paged(self):
+        """ List all Customers across several _all_docs pages """
+        for i in range(5):
+            Customer("Arturo", "Frank", username="user{}".format(i), id=i).save()
+        time.sleep(WAIT_SECONDS)
+        customers = Customer.all(batch_size=2)
+        self.assertIsInstance(customers, types.GeneratorType)
+        usernames = sorted(customer.username for customer in customers)
+        self.assertEqual(usernames, ["user{}".format(i) for i in range(5)])
+
+    def test_save_many(self):
+        """ Create Customers in bulk """
+        customers = [Customer("Arturo", "Frank", username="user{}".format(i), id=i)
+                     for i in range(5)]
+        customers.append(Customer("Hey", "Jude", username=None))
+        results = Customer.save_many(customers, chunk_size=2)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result.get('ok') for result in results[:5]))
+        self.assertEqual(results[5]['error'], 'invalid')
+        self.assertTrue(all(customer._id for customer in customers[:5]))
+        self.assertEqual(len(list(Customer.all())), 5)
+
+    def test_save_many_updates(self):
+        """ Update Customers in bulk """
+        customers = [Customer("Arturo", "Frank", username="user{}".format(i), id=i)
+                     for i in range(3)]
+        Customer.save_many(customers)
+        for customer in customers:
+            customer.first_name = "k9"
+        results = Customer.save_many(customers)
+        self.assertTrue(all(result.get('ok') for result in results))
+        self.assertEqual([c.first_name for c in Customer.all()], ["k9"] * 3)
+
+    def test_save_many_conflicts(self):
+        """ Update Customers in bulk without overwriting a concurrent change """
+        customers = [Customer("Arturo", "Frank", username="user{}".format(i), id=i)
+                     for i in range(3)]
+        Customer.save_many(customers)
+        time.sleep(WAIT_SECONDS)
+        other = Customer.find(customers[1]._id)
+        other.first_name = "other"
+        other.save()
+        for customer in customers:
+            customer.first_name = "k9"
+        results = Customer.save_many(customers)
+        self.assertEqual([result.get('error') for result in results], [None, 'conflict', None])
+        self.assertEqual(Customer.find(customers[1]._id).first_name, "other")
+        self.assertEqual(Customer.find(customers[0]._id).first_name, "k9")
+
+    def test_delete_many(self):
+        """ Delete Customers in bulk """
+        customers = [Customer("Arturo", "Frank", username="user{}".format(i), id=i)
+                     for i in range(3)]
+        Customer.save_many(customers)
+        customers.append(Customer("Hey", "Jude"))
+        results = Customer.delete_many(customers, chunk_size=2)
+        self.assertTrue(all(result.get('ok') for result in results[:3]))
+        self.assertEqual(results[3]['error'], 'not_found')
+        self.assertEqual(list(Customer.all()), [])
+
+    def test_remove_all_in_bulk(self):
+        """ Remove all Customers with bulk deletes """
+        Customer.save_many([Customer("Arturo", "Frank", username="user{}".format(i), id=i)
+                            for i in range(10)])
+        Customer.remove_all('bulk')
+        self.assertEqual(list(Customer.all()), [])
+
+    def test_remove_all_by_recreating(self):
+        """ Remove all Customers by recreating the database """
+        Customer.save_many([Customer("Arturo", "Frank", username="user{}".format(i), id=i)
+                            for i in range(10)])
+        Customer.remove_all('recreate')
+        self.assertEqual(list(Customer.all()), [])
+        self.assertEqual(Customer.find_by_name("user1"), [])
+
+    def test_remove_all_bad_mode(self):
+        """ Remove all Customers with an unknown mode """
+        self.assertRaises(DataValidationError, Customer.remove_all, 'truncate')
 
     def test_serialize_a_customer(self):
         """ Test serialization of a Customer """
@@ -187,6 +353,34 @@ class TestCustomers(unittest.TestCase):
         self.assertEqual(customer.first_name, "Arturo")
         self.assertEqual(customer.last_name, "Frank")
 
+    def test_serialize_matches_field_table(self):
+        """ Test that serialize emits exactly the declared fields """
+        customer = Customer("Arturo", "Frank", "USA", "abc@abc.com", "IAmUser", "password", "1231231234", True, 1)
+        self.assertEqual(sorted(customer.serialize()), sorted(FIELD_NAMES))
+        data = customer.serialize()
+        self.assertEqual(Customer().deserialize(data).serialize(), data)
+
+    def test_to_api_matches_marshal(self):
+        """ Test that to_api returns what marshal() with the model returns """
+        from flask_restplus import marshal
+        from service import Customer_model
+        customers = [Customer("Arturo", "Frank", "USA", "abc@abc.com", "IAmUser", "password", "1231231234", True, 1),
+                     Customer(u"J\xfcrgen", None, "", "j@x.de", "jy", "pw", 1231231234, False, "7"),
+                     Customer()]
+        customers[0]._id = "abc"
+        for customer in customers:
+            self.assertEqual(customer.to_api(), marshal(customer.serialize(), Customer_model))
+        fields = ['last_name', 'active', 'id']
+        model = dict((field, Customer_model[field]) for field in fields)
+        self.assertEqual(customers[1].to_api(fields), marshal(customers[1].serialize(), model))
+        self.assertEqual(sorted(customers[1].to_api(fields)), sorted(fields))
+
+    def test_customer_has_no_dict(self):
+        """ Test that Customers use slots """
+        customer = Customer()
+        self.assertFalse(hasattr(customer, '__dict__'))
+        self.assertRaises(AttributeError, setattr, customer, 'nickname', 'k9')
+
     def test_deserialize_with_no_data(self):
         """ Deserialize a Customer with no data """
         customer = Customer()
@@ -197,6 +391,12 @@ class TestCustomers(unittest.TestCase):
         customer = Customer()
         self.assertRaises(DataValidationError, customer.deserialize, {"first_name": 123})
 
+    def test_deserialize_with_a_list(self):
+        """ Deserailize a Customer from something that is not a dict """
+        customer = Customer()
+        self.assertRaises(DataValidationError, customer.deserialize, ["first_name"])
+        self.assertRaises(DataValidationError, customer.deserialize, None)
+
     def test_find_customer(self):
         """ Find a Customer by ID """
         customer = Customer("Hey", "Jude")
@@ -207,6 +407,69 @@ class TestCustomers(unittest.TestCase):
         self.assertEqual(customer._id, saved_customer._id)
         self.assertEqual(customer.first_name, "Hey")
 
+    def test_find_reads_through_cache(self):
+        """ Find a Customer twice and hit the cache """
+        customer = Customer("Hey", "Jude")
+        customer.save()
+        Customer.cache.clear()
+        hits = Customer.cache.hits
+        Customer.find(customer._id)
+        with patch('cloudant.document.Document.fetch') as fetch_mock:
+            saved_customer = Customer.find(customer._id)
+            self.assertFalse(fetch_mock.called)
+        self.assertEqual(saved_customer.first_name, "Hey")
+        self.assertEqual(Customer.cache.hits, hits + 1)
+
+    def test_update_invalidates_cache(self):
+        """ Update a Customer and find the new data """
+        customer = Customer("Hey", "Jude")
+        customer.save()
+        Customer.find(customer._id)
+        customer.first_name = "k9"
+        customer.save()
+        self.assertEqual(Customer.find(customer._id).first_name, "k9")
+
+    def test_delete_invalidates_cache(self):
+        """ Delete a Customer and no longer find it """
+        customer = Customer("Hey", "Jude")
+        customer.save()
+        Customer.find(customer._id)
+        customer.delete()
+        self.assertIsNone(Customer.find(customer._id))
+
+    @cloudant_only
+    def test_changes_feed_invalidates_cache(self):
+        """ Evict a Customer written by another process """
+        customer = Customer("Hey", "Jude")
+        customer.save()
+        Customer.find(customer._id)
+        # write behind the back of this process' cache
+        document = Customer.database[customer._id]
+        document['first_name'] = 'k9'
+        document.save()
+        for _ in range(50):
+            if Customer.find(customer._id).first_name == 'k9':
+                break
+            time.sleep(0.1)
+        self.assertEqual(Customer.find(customer._id).first_name, 'k9')
+
+    @cloudant_only
+    @patch.object(Customer, 'search_enabled', True)
+    def test_changes_feed_updates_search(self):
+        """ Search a Customer written by another process """
+        customer = Customer("Hey", "Jude")
+        customer.save()
+        Customer.build_search_index(wait=True)
+        document = Customer.database[customer._id]
+        document['first_name'] = 'k9'
+        document.save()
+        for _ in range(50):
+            if Customer.search('k9'):
+                break
+            time.sleep(0.1)
+        self.assertEqual([match['_id'] for match in Customer.search('k9')], [customer._id])
+        self.assertEqual(Customer.search('hey'), [])
+
     def test_customer_not_found(self):
         """ Test for a Customer that doesn't exist """
         customer = Customer.find('this_is_uuid')
@@ -240,6 +503,105 @@ class TestCustomers(unittest.TestCase):
         self.assertNotEqual(len(customers), 0)
         self.assertEqual(customers[0].address, "USA")
 
+    @cloudant_only
+    def test_indexes_are_created(self):
+        """ Test that init_db creates the declared indexes """
+        indexes = Customer.database.get_query_indexes(raw_result=True)['indexes']
+        ddocs = [index['ddoc'] for index in indexes]
+        for name in Customer.indexes:
+            self.assertIn('_design/' + name, ddocs)
+
+    def test_index_for(self):
+        """ Test choosing an index for a selector """
+        self.assertEqual(Customer.index_for({'username': 'IAmUser'}), 'username-index')
+        self.assertEqual(Customer.index_for({'address': 'USA', 'active': True}), 'address-index')
+        self.assertIsNone(Customer.index_for({'first_name': 'Arturo'}))
+        self.assertEqual(Customer.index_for({'id': {'$gte': 2}}), 'id-index')
+        self.assertIsNone(Customer.index_for({'username': {'$nin': ['IAmUser']}}))
+
+    def test_selector(self):
+        """ Compile query parameters into one selector """
+        selector = Customer.selector({'last_name': ['Frank', 'Jude'], 'id__gte': '2',
+                                      'id__lt': '10', 'username__prefix': 'IAm',
+                                      'active': 'false'})
+        self.assertEqual(selector['last_name'], {'$in': ['Frank', 'Jude']})
+        self.assertEqual(selector['id'], {'$gte': 2, '$lt': 10})
+        self.assertEqual(selector['username'], {'$gte': 'IAm', '$lt': u'IAm\ufff0'})
+        self.assertEqual(selector['active'], {'$in': [False, 'False', 'false']})
+        self.assertEqual(Customer.selector({'address': 'USA'}), {'address': 'USA'})
+        self.assertRaises(DataValidationError, Customer.selector, {'salary': '10'})
+        self.assertRaises(DataValidationError, Customer.selector, {'id__lte': 'ten'})
+
+    def test_find_by_selector(self):
+        """ Find Customers with operators in the selector """
+        for number, name in enumerate(['Arturo', 'Hey', 'Ann', 'Bob']):
+            Customer(name, "Frank", id=number).save()
+        found = Customer.find_by(**Customer.selector({'first_name__prefix': 'A', 'id__lt': '3'}))
+        self.assertEqual(sorted(c.first_name for c in found), ['Ann', 'Arturo'])
+        found = Customer.find_by(**Customer.selector({'first_name__in': 'Hey,Bob,Nobody'}))
+        self.assertEqual(sorted(c.first_name for c in found), ['Bob', 'Hey'])
+
+    @patch.object(Customer, 'search_enabled', True)
+    def test_search(self):
+        """ Search Customers stored before and after the index was built """
+        Customer("Arturo", "Frank", username="afrank", email="arturo@x.com").save()
+        time.sleep(WAIT_SECONDS)
+        Customer.search_index.clear(built=False)
+        self.assertRaises(IndexNotReady, Customer.search, 'art')
+        self.assertTrue(Customer.search_index.wait(10))
+        matches = Customer.search('art')
+        self.assertEqual([match['username'] for match in matches], ['afrank'])
+        customers = [Customer("Ann", "Artis", username="aartis"),
+                     Customer("Bob", "Hey", username="bhey")]
+        Customer.save_many(customers)
+        matches = Customer.search('art')
+        self.assertEqual([match['username'] for match in matches], ['aartis', 'afrank'])
+        customers[0].last_name = "Hill"
+        customers[0].save()
+        Customer.delete_many(Customer.find_by(username="afrank"))
+        self.assertEqual(Customer.search('art'), [])
+        self.assertEqual(len(Customer.search('hill')), 1)
+
+    def test_search_disabled(self):
+        """ Turn down searches while search is off or the index is too large """
+        Customer.save_many([Customer("Arturo", "Frank", username="afrank"),
+                            Customer("Ann", "Artis", username="aartis")])
+        time.sleep(WAIT_SECONDS)
+        self.assertRaises(SearchDisabled, Customer.search, 'art')
+        Customer.search_index.clear(built=False)
+        with patch.object(Customer, 'search_enabled', True), \
+                patch.object(Customer.search_index, 'max_docs', 1):
+            Customer.build_search_index(wait=True)
+            self.assertTrue(Customer.search_index.too_large)
+            self.assertRaises(SearchDisabled, Customer.search, 'art')
+        Customer.search_index.clear(built=False)
+
+    @patch.object(Customer, 'search_enabled', True)
+    def test_search_follows_changes(self):
+        """ Index the documents of the changes feed """
+        Customer.build_search_index(wait=True)
+        Customer._on_change({'id': 'other', 'doc': {'_id': 'other', 'first_name': 'Zed'}})
+        self.assertEqual([match['_id'] for match in Customer.search('ze')], ['other'])
+        Customer._on_change({'id': 'other', 'deleted': True})
+        self.assertEqual(Customer.search('ze'), [])
+
+    @cloudant_only
+    def test_remove_all_keeps_indexes(self):
+        """ Test that remove_all leaves the indexes in place """
+        Customer.remove_all()
+        indexes = Customer.database.get_query_indexes(raw_result=True)['indexes']
+        self.assertEqual(len([i for i in indexes if i['type'] == 'json']), len(Customer.indexes))
+
+    @cloudant_only
+    def test_recreate_keeps_indexes(self):
+        """ Test that recreating the database restores the indexes """
+        Customer.remove_all('recreate')
+        indexes = Customer.database.get_query_indexes(raw_result=True)['indexes']
+        ddocs = [index['ddoc'] for index in indexes]
+        for name in Customer.indexes:
+            self.assertIn('_design/' + name, ddocs)
+
+    @cloudant_only
     @patch('cloudant.database.CloudantDatabase.__getitem__')
     def test_key_error_on_delete(self, bad_key_mock):
         """ Test KeyError on delete"""
@@ -250,6 +612,7 @@ class TestCustomers(unittest.TestCase):
         customer.delete()
         time.sleep(WAIT_SECONDS)
 
+    @cloudant_only
     @patch('cloudant.database.CloudantDatabase.__getitem__')
     def test_key_error_on_update(self, bad_key_mock):
         """ Test KeyError on update """
@@ -261,12 +624,14 @@ class TestCustomers(unittest.TestCase):
         customer.save()
         time.sleep(WAIT_SECONDS)
 
+    @cloudant_only
     @patch('cloudant.client.Cloudant.__init__')
     def test_connection_error(self, bad_mock):
         """ Test Connection error handler """
         bad_mock.side_effect = ConnectionError()
         self.assertRaises(AssertionError, Customer.init_db, 'test')
 
+    @cloudant_only
     @patch.dict(os.environ, {'VCAP_SERVICES': json.dumps(VCAP_SERVICES), })
     def test_vcap_services(self):
         """ Test if VCAP_SERVICES works """
@@ -278,6 +643,7 @@ class TestCustomers(unittest.TestCase):
         self.assertNotEqual(len(customer), 0)
         self.assertEqual(customer[0].first_name, "fido")
 
+    @cloudant_only
     @patch.dict(os.environ, {'BINDING_CLOUDANT': json.dumps(TEST_CREDS), })
     def test_binding_services(self):
         """ Test if BINDING_CLOUDANT works """
@@ -289,6 +655,7 @@ class TestCustomers(unittest.TestCase):
         self.assertNotEqual(len(customer), 0)
         self.assertEqual(customer[0].first_name, "fido")
 
+    @cloudant_only
     def test_not_vcap_services(self):
         """ Test if no VCAP_SERVICES works """
         Customer.init_db()
@@ -0,0 +1,75 @@
+"""
+Test cases for the fast JSON encoding
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import json
+import unittest
+from mock import patch
+from flask import Flask
+from flask_restplus import Api, Resource
+from service import fastjson
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+DOCUMENT = {u'first_name': u'J\xfcrgen', 'url': 'http://example.com/a', 'id': 7,
+            'active': None, 'tags': [True, False, 1.5]}
+
+
+class TestFastJson(unittest.TestCase):
+    """ Test Cases for fastjson """
+
+    def setUp(self):
+        self.encoder = fastjson.encoder
+
+    def tearDown(self):
+        fastjson.use(self.encoder)
+
+    def test_encoders_agree(self):
+        """ Encode the same document with every installed library """
+        for name in fastjson.PREFERENCE:
+            if fastjson.use(name) != name:
+                continue
+            self.assertEqual(json.loads(fastjson.dumps(DOCUMENT)), DOCUMENT)
+            self.assertNotIn('\\/', fastjson.dumps(DOCUMENT))
+
+    def test_auto(self):
+        """ Pick the fastest library installed """
+        self.assertIn(fastjson.use('auto'), fastjson.PREFERENCE)
+        self.assertEqual(fastjson.use('json'), 'json')
+
+    def test_not_installed(self):
+        """ Fall back to json when the library is not installed """
+        with patch.dict('sys.modules', {'orjson': None, 'ujson': None}):
+            self.assertEqual(fastjson.use('ujson'), 'json')
+            self.assertEqual(fastjson.use('auto'), 'json')
+        self.assertRaises(ValueError, fastjson.load, 'yaml')
+
+    def test_fallback(self):
+        """ Encode what the library cannot with json """
+        def refuse(document):
+            raise OverflowError('too big')
+        with patch.object(fastjson, '_encode', refuse):
+            self.assertEqual(fastjson.dumps({'id': 2 ** 70}), '{"id": 1180591620717411303424}')
+        self.assertRaises(TypeError, fastjson.dumps, {'id': object()})
+
+    def test_output_json(self):
+        """ Encode the responses of an Api """
+        class Created(Resource):
+            """ Answers with a document and headers """
+            def get(self):
+                return {'id': 1}, 201, {'ETag': '"1-a"'}
+        app = Flask(__name__)
+        api = Api(app)
+        api.representation('application/json')(fastjson.output_json)
+        api.add_resource(Created, '/created')
+        resp = app.test_client().get('/created')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.mimetype, 'application/json')
+        self.assertEqual(resp.headers['ETag'], '"1-a"')
+        self.assertEqual(json.loads(resp.get_data()), {'id': 1})
@@ -0,0 +1,51 @@
+"""
+Test cases for the Prometheus metrics
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import unittest
+from prometheus_client import REGISTRY
+from service.metrics import timed
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+def observed(operation):
+    """ Returns how many times an operation was timed """
+    return REGISTRY.get_sample_value('customers_operation_duration_seconds_count',
+                                     {'operation': operation}) or 0
+
+
+class TestMetrics(unittest.TestCase):
+    """ Test Cases for the metrics """
+
+    def test_time_a_function(self):
+        """ Time each call of a function """
+        before = observed('test_function')
+        function = timed('test_function')(lambda value: value * 2)
+        self.assertEqual(function(2), 4)
+        self.assertEqual(function(3), 6)
+        self.assertEqual(observed('test_function'), before + 2)
+
+    def test_time_a_generator(self):
+        """ Time a generator once, when it is done """
+        before = observed('test_generator')
+
+        @timed('test_generator')
+        def generator(count):
+            for value in range(count):
+                yield value
+
+        items = generator(3)
+        self.assertEqual(observed('test_generator'), before)
+        self.assertEqual(list(items), [0, 1, 2])
+        self.assertEqual(observed('test_generator'), before + 1)
+        items = generator(3)
+        next(items)
+        items.close()
+        self.assertEqual(observed('test_generator'), before + 2)
@@ -0,0 +1,117 @@
+"""
+Test cases for the request profiling
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import shutil
+import tempfile
+import unittest
+from mock import patch
+from flask import Flask, Response
+from flask_api import status    # HTTP Status Codes
+from service import app
+from service.profiling import Profiler, profiler
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+class TestProfiling(unittest.TestCase):
+    """ Test Cases for the Profiler """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+
+        @self.app.route('/work')
+        def work():
+            return str(sum(range(1000)))
+
+        @self.app.route('/stream')
+        def stream():
+            return Response((str(value) for value in range(3)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def profiled(self, token='secret', sample_rate=0, keep=50, sample=lambda: 0.5):
+        """ Returns a test client of an app with a profiler """
+        self.profiler = Profiler(token, sample_rate, self.directory, keep, sample)
+        self.profiler.init_app(self.app)
+        return self.app.test_client()
+
+    def test_off_adds_no_hooks(self):
+        """ A profiler that is off does not hook into the app """
+        Profiler(None, 0, self.directory).init_app(self.app)
+        self.assertEqual(self.app.before_request_funcs, {})
+        self.assertEqual(self.app.teardown_request_funcs, {})
+
+    def test_profile_on_request(self):
+        """ Profile a request that has the admin token """
+        client = self.profiled()
+        client.get('/work')
+        client.get('/work', headers={'X-Profile': 'wrong'})
+        self.assertEqual(self.profiler.profiles(), [])
+        resp = client.get('/work?n=1', headers={'X-Profile': 'secret'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        profiles = self.profiler.profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['path'], '/work?n=1')
+        self.assertEqual(profiles[0]['status'], 200)
+        report = self.profiler.report(profiles[0]['id'])
+        self.assertIn('work', report)
+        self.assertIsNone(self.profiler.report('missing'))
+
+    def test_profile_sampled(self):
+        """ Profile the sampled fraction of requests """
+        samples = iter([0.05, 0.5, 0.05])
+        client = self.profiled(token=None, sample_rate=0.1, sample=lambda: next(samples))
+        for _ in range(3):
+            client.get('/work')
+        self.assertEqual(len(self.profiler.profiles()), 2)
+
+    def test_profile_streams(self):
+        """ Profile a streamed response until its last chunk """
+        client = self.profiled()
+        resp = client.get('/stream', headers={'X-Profile': 'secret'})
+        self.assertEqual(resp.data, b'012')
+        self.assertEqual(len(self.profiler.profiles()), 1)
+        self.assertFalse(self.profiler._running)
+
+    def test_keep_newest(self):
+        """ Delete the oldest profiles """
+        client = self.profiled(keep=2)
+        with patch('time.time', side_effect=[float(n) for n in range(100)]):
+            for _ in range(3):
+                client.get('/work', headers={'X-Profile': 'secret'})
+        self.assertEqual(len(self.profiler.profiles()), 2)
+
+    def test_admin_endpoints(self):
+        """ Read the profiles only with the admin token """
+        client = app.test_client()
+        admin = {'X-Admin-Token': 'secret'}
+        self.assertEqual(client.get('/profiles').status_code, status.HTTP_403_FORBIDDEN)
+        with patch.multiple(profiler, token='secret', directory=self.directory):
+            self.assertEqual(client.get('/profiles').status_code, status.HTTP_403_FORBIDDEN)
+            with self.app.test_request_context('/work', headers={'X-Profile': 'secret'}):
+                profiler.start()
+                sum(range(1000))
+                profiler.stop()
+            resp = client.get('/profiles', headers=admin)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            profile_id = resp.get_json()[0]['id']
+            resp = client.get('/profiles/' + profile_id, headers=admin)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertIn(b'function calls', resp.data)
+            resp = client.get('/profiles/{}?format=pstats'.format(profile_id), headers=admin)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            resp = client.get('/profiles/{}?sort=nonsense'.format(profile_id), headers=admin)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            resp = client.get('/profiles/missing', headers=admin)
+            self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+            resp = client.get('/profiles/missing?format=pstats', headers=admin)
+            self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
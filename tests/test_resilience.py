@@ -0,0 +1,218 @@
+"""
+Test cases for the resilience of the database calls
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import os
+import json
+import time
+import unittest
+from mock import patch
+from requests import HTTPError, ConnectionError, Response
+from requests.exceptions import ReadTimeout
+from service.resilience import (Resilience, CircuitOpenError, DeadlineExceeded, DeadlineAdapter,
+                                resilience)
+from service.backends import CloudantBackend
+from benchmarks.couchdb_fake import FakeCouchDB
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+class FakeClock(object):
+    """ A clock that only moves when told to """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def http_error(code):
+    """ Returns an HTTPError with a response of the given status """
+    response = Response()
+    response.status_code = code
+    return HTTPError('{} error'.format(code), response=response)
+
+
+class Failing(object):
+    """ A call that fails with the given errors and then returns 'ok' """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class TestResilience(unittest.TestCase):
+    """ Test Cases for Resilience """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.resilience = Resilience(tries=3, base_delay=0.1, max_delay=1,
+                                     failure_threshold=3, recovery_timeout=60,
+                                     sleep=self.clock.sleep, clock=self.clock)
+
+    def test_retry_transient_failures(self):
+        """ Retry a call until it succeeds """
+        call = Failing(http_error(503), ConnectionError('reset'))
+        self.assertEqual(self.resilience.call('read', call), 'ok')
+        self.assertEqual(call.calls, 3)
+        self.assertEqual(self.resilience.retries, 2)
+        self.assertTrue(self.clock.now <= 1000.0 + 0.2 + 0.4)
+
+    def test_give_up_after_tries(self):
+        """ Raise the last failure when the tries are used up """
+        call = Failing(*[http_error(500)] * 3)
+        self.assertRaises(HTTPError, self.resilience.call, 'read', call)
+        self.assertEqual(call.calls, 3)
+
+    def test_do_not_retry_client_errors(self):
+        """ A 404 or a 409 is an answer, not a failure """
+        call = Failing(http_error(409))
+        self.assertRaises(HTTPError, self.resilience.call, 'write', call)
+        self.assertEqual(call.calls, 1)
+        self.assertEqual(self.resilience.breaker.failure_count, 0)
+
+    def test_do_not_retry_applied_writes(self):
+        """ A write that may have been applied is not repeated """
+        call = Failing(ReadTimeout('slow'))
+        self.assertRaises(ReadTimeout, self.resilience.call, 'write', call, idempotent=False)
+        self.assertEqual(call.calls, 1)
+        call = Failing(http_error(429))
+        self.assertEqual(self.resilience.call('write', call, idempotent=False), 'ok')
+
+    def test_circuit_breaker_opens(self):
+        """ Fail fast once the circuit is open """
+        call = Failing(*[http_error(503)] * 3)
+        self.assertRaises(HTTPError, self.resilience.call, 'read', call)
+        self.assertEqual(self.resilience.trips, 1)
+        call = Failing()
+        with self.assertRaises(CircuitOpenError) as context:
+            self.resilience.call('read', call)
+        self.assertEqual(call.calls, 0)
+        self.assertEqual(context.exception.code, 503)
+        self.assertIn(('Retry-After', '60'), context.exception.get_headers())
+        stats = self.resilience.stats()
+        self.assertEqual(stats['state'], 'open')
+        self.assertEqual(stats['rejections'], 1)
+
+    def test_circuit_breaker_recovers(self):
+        """ Close the circuit after a call succeeds again """
+        resilience = Resilience(tries=1, failure_threshold=1, recovery_timeout=0.01)
+        self.assertRaises(HTTPError, resilience.call, 'read', Failing(http_error(500)))
+        self.assertEqual(resilience.stats()['state'], 'open')
+        time.sleep(0.02)
+        self.assertEqual(resilience.call('read', Failing()), 'ok')
+        self.assertEqual(resilience.stats()['state'], 'closed')
+
+    @patch('random.uniform', return_value=0.1)
+    def test_deadline(self, uniform):
+        """ Stop retrying when the request runs out of time """
+        self.resilience.start_request(0.05)
+        call = Failing(*[http_error(503)] * 2)
+        self.assertRaises(HTTPError, self.resilience.call, 'read', call)
+        self.assertEqual(call.calls, 1)
+        self.clock.now += 1
+        self.assertRaises(DeadlineExceeded, self.resilience.call, 'read', Failing())
+        self.assertEqual(self.resilience.deadlines_exceeded, 1)
+        self.resilience.end_request()
+        self.assertEqual(self.resilience.call('read', Failing()), 'ok')
+
+    def test_operation_timeouts(self):
+        """ Each HTTP request gets the timeout of its call and deadline """
+        timeouts = []
+        call = lambda: timeouts.append(self.resilience.timeout())
+        self.resilience.call('read', call)
+        self.resilience.call('bulk', call)
+        self.resilience.start_request(2)
+        self.resilience.call('bulk', call)
+        self.assertEqual(timeouts, [self.resilience.timeouts['read'],
+                                    self.resilience.timeouts['bulk'], 2])
+        self.assertIsNone(self.resilience.timeout())
+
+    def test_nested_calls(self):
+        """ Calls inside a protected call are not retried again """
+        inner = Failing(*[http_error(503)] * 9)
+        outer = lambda: self.resilience.call('read', inner)
+        self.assertRaises(HTTPError, self.resilience.call, 'admin', outer)
+        self.assertEqual(inner.calls, 3)
+
+    def test_decorator(self):
+        """ Protect a function with the decorator """
+        call = Failing(http_error(502))
+        protected = self.resilience('read')(lambda: call())
+        self.assertEqual(protected(), 'ok')
+        self.assertEqual(call.calls, 2)
+
+    @patch('requests.adapters.HTTPAdapter.send')
+    def test_adapter_timeout(self, send):
+        """ The adapter sends requests with the timeout of the call """
+        adapter = DeadlineAdapter(self.resilience)
+        self.resilience.call('write', lambda: adapter.send('request', timeout=None))
+        adapter.send('request', timeout=None)
+        self.assertEqual(send.call_args_list[0][1]['timeout'], self.resilience.timeouts['write'])
+        self.assertIsNone(send.call_args_list[1][1]['timeout'])
+
+
+class TestCloudantFaults(unittest.TestCase):
+    """ Test Cases for the Cloudant backend against a failing database """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.couch = FakeCouchDB().start()
+        env = {'BINDING_CLOUDANT': json.dumps(cls.couch.credentials())}
+        with patch.dict(os.environ, env):
+            os.environ.pop('VCAP_SERVICES', None)
+            cls.backend = CloudantBackend('faults')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.backend.client.disconnect()
+        cls.couch.stop()
+
+    def setUp(self):
+        self.couch.latency = 0
+        self.doc_id = self.backend.create({'name': 'fault'})
+
+    def test_retry_rate_limits(self):
+        """ Retry reads and writes the database rate limited """
+        self.couch.inject(429, 2)
+        requests = self.couch.requests
+        self.assertEqual(self.backend.get(self.doc_id)['name'], 'fault')
+        self.assertEqual(self.couch.requests, requests + 3)
+        self.couch.inject(429)
+        doc_id = self.backend.create({'name': 'limited'})
+        self.assertEqual(self.backend.get(doc_id)['name'], 'limited')
+
+    def test_do_not_repeat_applied_writes(self):
+        """ A create whose answer failed is not sent again """
+        self.couch.inject(500, applied=True)
+        docs = len(self.couch.databases['faults'].docs)
+        self.assertRaises(HTTPError, self.backend.create, {'name': 'lost'})
+        self.assertEqual(len(self.couch.databases['faults'].docs), docs + 1)
+        self.assertIsNotNone(self.backend.get(self.doc_id))
+
+    def test_slow_database(self):
+        """ Give up on a database slower than the deadline """
+        self.couch.latency = 0.3
+        resilience.start_request(0.1)
+        try:
+            self.assertRaises((ReadTimeout, DeadlineExceeded), self.backend.get, self.doc_id)
+        finally:
+            resilience.end_request()
+            self.couch.latency = 0
+        self.assertIsNotNone(self.backend.get(self.doc_id))
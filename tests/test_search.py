@@ -0,0 +1,187 @@
+"""
+Test cases for the typeahead search index
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import unittest
+from service.search import SearchIndex, words
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+def customer(first_name, last_name, username, email):
+    """ Returns the searched fields of a Customer document """
+    return {'first_name': first_name, 'last_name': last_name,
+            'username': username, 'email': email}
+
+
+class TestSearchIndex(unittest.TestCase):
+    """ Test Cases for SearchIndex """
+
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.build(lambda: [
+            ('1', customer('John', 'Smith', 'jsmith', 'john.smith@example.com')),
+            ('2', customer('Johnny', 'Smithers', 'johnny', 'jj@mail.org')),
+            ('3', customer('Mary', 'Jones', 'mjones', 'mary@example.com')),
+        ])
+
+    def ids(self, query, limit=10):
+        """ Returns the ids the index finds for a query, best first """
+        return [match['_id'] for match in self.index.search(query, limit)]
+
+    def test_words(self):
+        """ Split a value into lowercase words and keep the whole value """
+        self.assertEqual(words('John.Smith@Example.com'),
+                         set(['john', 'smith', 'example', 'com', 'john.smith@example.com']))
+        self.assertEqual(words(None), set())
+        self.assertEqual(words(7), set(['7']))
+
+    def test_search_by_prefix(self):
+        """ Find the Customers whose words start with the query """
+        self.assertEqual(self.ids('joh'), ['1', '2'])
+        self.assertEqual(self.ids('SMITHE'), ['2'])
+        self.assertEqual(self.ids('example'), ['1', '3'])
+        self.assertEqual(self.ids('zed'), [])
+        self.assertEqual(self.ids('  '), [])
+
+    def test_search_whole_email(self):
+        """ Find a Customer by the start of the whole email """
+        self.assertEqual(self.ids('john.smith@ex'), ['1'])
+
+    def test_every_term_matches(self):
+        """ Find only the Customers that match every term """
+        self.assertEqual(self.ids('jo sm'), ['1', '2'])
+        self.assertEqual(self.ids('mary smith'), [])
+
+    def test_rank_exact_words_first(self):
+        """ Rank an exact word before a longer one """
+        self.assertEqual(self.ids('johnny'), ['2'])
+        self.assertEqual(self.ids('john'), ['1', '2'])
+        self.assertEqual(self.ids('smithers'), ['2'])
+        matches = self.index.search('smith')
+        self.assertGreater(matches[0]['score'], matches[1]['score'])
+        self.assertEqual(matches[0]['_id'], '1')
+
+    def test_result_fields(self):
+        """ Return the searched fields with each match """
+        match = self.index.search('mary')[0]
+        self.assertEqual(match['_id'], '3')
+        self.assertEqual(match['last_name'], 'Jones')
+        self.assertEqual(match['email'], 'mary@example.com')
+        self.assertEqual(match['score'], 1.0)
+
+    def test_limit(self):
+        """ Return no more matches than the limit """
+        self.assertEqual(len(self.ids('example', limit=1)), 1)
+        self.assertEqual(self.ids('jo sm', limit=1), ['1'])
+        self.assertEqual(self.ids('example', limit=0), [])
+
+    def test_add_and_update(self):
+        """ Find a new Customer, and a changed one by its new words only """
+        self.index.add('4', customer('Joan', 'Baker', 'jbaker', 'joan@example.com'))
+        self.assertEqual(self.ids('joa'), ['4'])
+        self.index.add('3', customer('Mary', 'Hill', 'mhill', 'mary@example.com'))
+        self.assertEqual(self.ids('jones'), [])
+        self.assertEqual(self.ids('hill'), ['3'])
+        self.assertEqual(len(self.index), 4)
+
+    def test_remove(self):
+        """ Stop finding a removed Customer """
+        self.index.remove('1')
+        self.index.remove('missing')
+        self.assertEqual(self.ids('smith'), ['2'])
+        self.assertEqual(self.ids('jsmith'), [])
+        self.assertEqual(len(self.index), 2)
+
+    def test_writes_before_build(self):
+        """ Ignore writes until the index is built """
+        index = SearchIndex()
+        index.add('1', customer('John', 'Smith', 'jsmith', 'j@x.com'))
+        self.assertEqual(len(index), 0)
+        index.build(lambda: [('2', customer('Mary', 'Jones', 'mjones', 'm@x.com'))])
+        index.build(lambda: self.fail('built twice'))
+        self.assertEqual(len(index), 1)
+
+    def test_writes_during_build(self):
+        """ Keep the writes applied while the index is built """
+        index = SearchIndex()
+
+        def load():
+            yield '1', customer('John', 'Smith', 'jsmith', 'j@x.com')
+            index.add('2', customer('Mary', 'Jones', 'mjones', 'm@x.com'))
+            index.remove('1')
+
+        index.build(load)
+        self.assertEqual([match['_id'] for match in index.search('m')], ['2'])
+        self.assertEqual(index.search('smith'), [])
+
+    def test_max_expansions(self):
+        """ Expand a short prefix to at most max_expansions words """
+        index = SearchIndex(max_expansions=2)
+        index.build(lambda: [(str(number), customer('a{}'.format(number), '', '', ''))
+                             for number in range(5)])
+        self.assertEqual(len(index.search('a')), 2)
+        self.assertEqual(len(index.search('a4')), 1)
+
+    def test_clear(self):
+        """ Empty the index, and build it again when asked to """
+        self.index.clear()
+        self.assertEqual(self.ids('john'), [])
+        self.index.add('1', customer('John', 'Smith', 'jsmith', 'j@x.com'))
+        self.assertEqual(self.ids('john'), ['1'])
+        self.index.clear(built=False)
+        self.assertFalse(self.index.built)
+
+    def test_build_in_background(self):
+        """ Build the index in a thread, and again after a failed build """
+        index = SearchIndex()
+
+        def broken():
+            yield '1', customer('John', 'Smith', 'jsmith', 'j@x.com')
+            raise IOError('the database went away')
+
+        index.start_build(broken)
+        self.assertFalse(index.wait(5))
+        self.assertEqual(len(index), 0)
+        index.start_build(lambda: [('2', customer('Mary', 'Jones', 'mjones', 'm@x.com'))])
+        self.assertTrue(index.wait(5))
+        self.assertEqual([match['_id'] for match in index.search('mary')], ['2'])
+
+    def test_clear_stops_a_build(self):
+        """ Stop a build whose index was cleared """
+        index = SearchIndex()
+
+        def load():
+            yield '1', customer('John', 'Smith', 'jsmith', 'j@x.com')
+            index.clear(built=False)
+            yield '2', customer('Mary', 'Jones', 'mjones', 'm@x.com')
+
+        index.build(load)
+        self.assertFalse(index.built)
+        self.assertEqual(len(index), 0)
+
+    def test_max_docs(self):
+        """ Drop an index that would hold more than max_docs documents """
+        index = SearchIndex(max_docs=2)
+        docs = [('1', customer('John', 'Smith', 'jsmith', 'j@x.com')),
+                ('2', customer('Mary', 'Jones', 'mjones', 'm@x.com'))]
+        index.build(lambda: iter(docs))
+        self.assertTrue(index.built)
+        index.add('3', customer('Ann', 'Hill', 'ahill', 'a@x.com'))
+        self.assertTrue(index.too_large)
+        self.assertFalse(index.built)
+        self.assertEqual(len(index), 0)
+        # it is not built again until it is cleared
+        index.start_build(lambda: iter(docs))
+        self.assertFalse(index.wait(10))
+        index.clear(built=False)
+        docs.append(('3', customer('Ann', 'Hill', 'ahill', 'a@x.com')))
+        index.build(lambda: iter(docs))
+        self.assertTrue(index.too_large)
+        self.assertEqual(len(index), 0)
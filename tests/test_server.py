@@ -25,9 +25,15 @@ import unittest
 import logging
 import json
 import time
+import zlib
+from mock import patch
 from flask_api import status    # HTTP Status Codes
-from service import app
+from service import app, boot
 from service.models import Customer
+from service.resilience import CircuitOpenError, Resilience, resilience
+from service.transfer import checkpoint_path
+from service.compression import compressor
+from service.profiling import profiler
 
 # Status Codes
 HTTP_200_OK = 200
@@ -125,6 +131,32 @@ class TestCustomerServer(unittest.TestCase):
         data = json.loads(resp.data)
         self.assertEqual(len(data), 4)
 
+    def test_stream_customer_list_as_ndjson(self):
+        """ Stream the list of Customers as NDJSON """
+        resp = self.app.get('/customers', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        lines = resp.data.splitlines()
+        self.assertEqual(len(lines), 4)
+        usernames = sorted(json.loads(line)['username'] for line in lines)
+        self.assertEqual(usernames, ['Ker', 'haha', 'kerker', 'kuku'])
+
+    def test_stream_customer_list_as_json(self):
+        """ Stream the list of Customers as a JSON array """
+        resp = self.app.get('/customers', query_string='stream=true')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.is_streamed)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 4)
+
+    def test_stream_filtered_customer_list(self):
+        """ Stream a filtered list of Customers """
+        resp = self.app.get('/customers', query_string='address=nj&stream=true')
+        data = json.loads(resp.data)
+        self.assertEqual([customer['username'] for customer in data], ['kuku'])
+        resp = self.app.get('/customers', query_string='address=nowhere&stream=true')
+        self.assertEqual(json.loads(resp.data), [])
+
     def test_get_a_customer(self):
         """ Find one customer """
         customer = self.get_customer('Ker')[0]  # returns a list
@@ -148,6 +180,99 @@ class TestCustomerServer(unittest.TestCase):
         resp = self.app.get('/customers/ohno')
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_get_customer_fields(self):
+        """ Get only some fields of a Customer """
+        customer = self.get_customer('Ker')[0]
+        resp = self.app.get('/customers/{}'.format(customer['_id']),
+                            query_string='fields=id,username,email')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(resp.data), {'id': 2, 'username': 'Ker', 'email': 'c@b.com'})
+
+    def test_get_customer_list_fields(self):
+        """ Get only some fields of the list of Customers """
+        resp = self.app.get('/customers', query_string='fields=username,email')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 4)
+        self.assertTrue(all(sorted(item) == ['email', 'username'] for item in data))
+        resp = self.app.get('/customers', query_string='address=nj&fields=username&stream=true')
+        self.assertEqual(json.loads(resp.data), [{'username': 'kuku'}])
+
+    def test_get_unknown_fields(self):
+        """ Ask for a field Customers do not have """
+        resp = self.app.get('/customers', query_string='fields=username,salary')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_get_customer_list_in_pages(self):
+        """ Page through the list of Customers """
+        resp = self.app.get('/customers', query_string='limit=3')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        first = json.loads(resp.data)
+        self.assertEqual(len(first), 3)
+        link = resp.headers['Link']
+        self.assertTrue(link.endswith('>; rel="next"'))
+        resp = self.app.get(link[1:link.index('>')])
+        second = json.loads(resp.data)
+        self.assertEqual(len(second), 1)
+        self.assertNotIn('Link', resp.headers)
+        usernames = sorted(customer['username'] for customer in first + second)
+        self.assertEqual(usernames, ['Ker', 'haha', 'kerker', 'kuku'])
+
+    def test_get_filtered_customer_list_in_pages(self):
+        """ Page through a filtered list of Customers """
+        usernames = []
+        query_string = 'address=ny&limit=2&fields=username'
+        while query_string is not None:
+            resp = self.app.get('/customers', query_string=query_string)
+            page = json.loads(resp.data)
+            self.assertTrue(len(page) <= 2)
+            usernames.extend(customer['username'] for customer in page)
+            link = resp.headers.get('Link')
+            query_string = link[link.index('?') + 1:link.index('>')] if link else None
+        self.assertEqual(sorted(usernames), ['Ker', 'haha', 'kerker'])
+
+    def test_get_customer_list_bad_limit(self):
+        """ Ask for pages of a bad size """
+        for limit in ('0', 'ten', '100000'):
+            resp = self.app.get('/customers', query_string='limit=' + limit)
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_get_customer_not_modified(self):
+        """ Get a Customer with If-None-Match """
+        customer = self.get_customer('Ker')[0]
+        url = '/customers/{}'.format(customer['_id'])
+        resp = self.app.get(url)
+        etag = resp.headers['ETag']
+        self.assertTrue(etag.startswith('"'))
+        resp = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.data, '')
+        # a write changes the _rev and so the ETag
+        customer.update({'first_name': 'changed'})
+        resp = self.app.put(url, data=json.dumps(customer), content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        self.assertEqual(json.loads(resp.data)['first_name'], 'changed')
+
+    def test_get_customer_list_not_modified(self):
+        """ Get the list of Customers with If-None-Match """
+        resp = self.app.get('/customers')
+        etag = resp.headers['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        resp = self.app.get('/customers', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = self.app.get('/customers', query_string='stream=true',
+                            headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # any write changes the tag of every list
+        Customer(username='new', password='pw').save()
+        resp = self.app.get('/customers', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        self.assertEqual(len(json.loads(resp.data)), 5)
+
     def test_create_customer(self):
         """ Create a customers """
         # save the current number of pets for later comparrison
@@ -183,6 +308,38 @@ class TestCustomerServer(unittest.TestCase):
         self.assertEqual(len(data), customers_count + 1)
         self.assertIn(new_json, data)
 
+    def test_create_customers_in_bulk(self):
+        """ Create a list of customers """
+        customers_count = self.get_customers_count()
+        new_customers = [{"username": "foo{}".format(i), "password": "bar",
+                          "first_name": "value1", "last_name": "value2",
+                          "address": "Jersey", "phone_number": "773",
+                          "active": True, "email": "3333", "id": 10 + i}
+                         for i in range(3)]
+        data = json.dumps(new_customers)
+        resp = self.app.post('/customers', data=data, content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        results = json.loads(resp.data)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result['ok'] for result in results))
+        self.assertEqual(self.get_customers_count(), customers_count + 3)
+
+    def test_create_customers_in_bulk_partial_failure(self):
+        """ Create a list of customers where one is not valid """
+        customers_count = self.get_customers_count()
+        new_customers = [{"username": "foo111", "password": "bar",
+                          "first_name": "value1", "last_name": "value2",
+                          "address": "Jersey", "phone_number": "773",
+                          "active": True, "email": "3333", "id": 5},
+                         {"first_name": "value1"}]
+        data = json.dumps(new_customers)
+        resp = self.app.post('/customers', data=data, content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        results = json.loads(resp.data)
+        self.assertTrue(results[0]['ok'])
+        self.assertEqual(results[1]['error'], 'invalid')
+        self.assertEqual(self.get_customers_count(), customers_count + 1)
+
     def test_create_customer_no_content_type(self):
         """ Create a Customer with no Content-Type """
         new_customer = {"username": "foo111", "password": "bar",
@@ -287,6 +444,87 @@ class TestCustomerServer(unittest.TestCase):
         self.assertEqual(new_json['phone_number'], '773')
         self.assertEqual(new_json['id'], 77)
 
+    def test_update_customer_if_match(self):
+        """ Update a customer at the If-Match revision """
+        customer = self.get_customer('kerker')[0]
+        url = '/customers/{}'.format(customer['_id'])
+        etag = self.app.get(url).headers['ETag']
+        customer['first_name'] = 'value1'
+        resp = self.app.put(url, data=json.dumps(customer), content_type='application/json',
+                            headers={'If-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        self.assertEqual(resp.headers['ETag'], self.app.get(url).headers['ETag'])
+        # the old revision is now stale
+        customer['first_name'] = 'value2'
+        resp = self.app.put(url, data=json.dumps(customer), content_type='application/json',
+                            headers={'If-Match': etag})
+        self.assertEqual(resp.status_code, HTTP_409_CONFLICT)
+        self.assertEqual(json.loads(self.app.get(url).data)['first_name'], 'value1')
+
+    def test_get_customer_fields_etag(self):
+        """ Get some fields of a Customer with their own weak ETag """
+        customer = self.get_customer('Ker')[0]
+        url = '/customers/{}'.format(customer['_id'])
+        etag = self.app.get(url).headers['ETag']
+        resp = self.app.get(url, query_string='fields=username,email')
+        projected = resp.headers['ETag']
+        self.assertTrue(projected.startswith('W/"'))
+        self.assertNotEqual(projected[2:], etag)
+        resp = self.app.get(url, query_string='fields=email,username',
+                            headers={'If-None-Match': projected})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # the tag of the whole Customer does not stand for some of its fields
+        resp = self.app.get(url, query_string='fields=username', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(resp.data), {'username': 'Ker'})
+        resp = self.app.get(url, query_string='fields=username',
+                            headers={'If-None-Match': projected})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_update_customer_other_if_match_tags(self):
+        """ Update a customer at the revision of a projected ETag, not at a bad tag """
+        customer = self.get_customer('kerker')[0]
+        url = '/customers/{}'.format(customer['_id'])
+        projected = self.app.get(url, query_string='fields=username').headers['ETag']
+        customer['first_name'] = 'value1'
+        resp = self.app.put(url, data=json.dumps(customer), content_type='application/json',
+                            headers={'If-Match': projected})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        customer['first_name'] = 'value2'
+        for tag in ('"nonsense"', 'W/"1;fields=username"', '"-abc"'):
+            resp = self.app.put(url, data=json.dumps(customer), content_type='application/json',
+                                headers={'If-Match': tag})
+            self.assertEqual(resp.status_code, HTTP_409_CONFLICT)
+        self.assertEqual(json.loads(self.app.get(url).data)['first_name'], 'value1')
+
+    def test_update_customer_stale_cache(self):
+        """ Update a customer without If-Match while its cache entry is stale """
+        customer = self.get_customer('kerker')[0]
+        url = '/customers/{}'.format(customer['_id'])
+        self.app.get(url)
+        # another process writes it, so this one's cache holds the old _rev
+        doc = Customer.backend.get(customer['_id'])
+        doc['address'] = 'Elsewhere'
+        Customer.backend.update(doc)
+        customer['first_name'] = 'value1'
+        resp = self.app.put(url, data=json.dumps(customer), content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(self.app.get(url).data)['first_name'], 'value1')
+
+    @patch.object(compressor, 'min_size', 0)
+    def test_update_customer_if_match_compressed(self):
+        """ Update a customer at the weak If-Match revision of a compressed read """
+        customer = self.get_customer('kerker')[0]
+        url = '/customers/{}'.format(customer['_id'])
+        etag = self.app.get(url, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        customer['first_name'] = 'value1'
+        resp = self.app.put(url, data=json.dumps(customer), content_type='application/json',
+                            headers={'If-Match': etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(self.app.get(url).data)['first_name'], 'value1')
+
     def test_update_customer_no_content_type(self):
         """ Update a customer Content-Type"""
         new_customer = {"password": "bar",
@@ -328,13 +566,32 @@ class TestCustomerServer(unittest.TestCase):
 
         resp = self.app.put('/customers/{}/disable'.format(customer['_id']), content_type='application/json')
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        disabled = json.loads(resp.data)
+        etag = resp.headers['ETag']
 
         resp = self.app.get('/customers/{}'.format(customer['_id']), content_type='application/json')
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(resp.data), disabled)
+        self.assertEqual(resp.headers['ETag'], etag)
+        self.assertNotIn('_rev', disabled)
 
         new_json = json.loads(resp.data)
         self.assertEqual(new_json['active'], 'False')
 
+    def test_disable_customer_stale_cache(self):
+        """ Disable a customer without If-Match while its cache entry is stale """
+        customer = self.get_customer('kerker')[0]
+        url = '/customers/{}'.format(customer['_id'])
+        self.app.get(url)
+        # another process writes it, so this one's cache holds the old _rev
+        doc = Customer.backend.get(customer['_id'])
+        doc['address'] = 'Elsewhere'
+        Customer.backend.update(doc)
+        resp = self.app.put(url + '/disable', content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = json.loads(self.app.get(url).data)
+        self.assertEqual((data['active'], data['address']), ('False', 'Elsewhere'))
+
     def test_disable_nonexisting_customer(self):
         resp = self.app.put('/customers/3/disable', content_type='application/json')
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
@@ -365,6 +622,279 @@ class TestCustomerServer(unittest.TestCase):
         data = json.loads(resp.data)
         self.assertEqual(len(data), 3)
 
+    def test_get_customer_list_with_combined_filters(self):
+        """ Get Customers matching several filters at once """
+        def usernames(query_string):
+            resp = self.app.get('/customers', query_string=query_string)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            return sorted(customer['username'] for customer in json.loads(resp.data))
+
+        self.assertEqual(usernames('address=ny&last_name=cat'), ['Ker', 'haha'])
+        self.assertEqual(usernames('last_name=cat&last_name=dog&address=nj'), ['kuku'])
+        self.assertEqual(usernames('username__in=kuku,haha,nobody'), ['haha', 'kuku'])
+        self.assertEqual(usernames('first_name__prefix=a'), ['Ker'])
+        self.assertEqual(usernames('id__gte=2&id__lt=4'), ['Ker', 'haha'])
+        self.assertEqual(usernames('active=false&address__ne=nj'), ['haha'])
+        self.assertEqual(usernames('active=TRUE&fields=username'), ['Ker', 'kerker'])
+
+    def test_get_disabled_customers(self):
+        """ Filter on active whether it is stored as a boolean or a string """
+        customer = self.get_customer('kerker')[0]
+        self.app.put('/customers/{}/disable'.format(customer['_id']),
+                     content_type='application/json')
+        resp = self.app.get('/customers', query_string='active=0')
+        usernames = sorted(customer['username'] for customer in json.loads(resp.data))
+        self.assertEqual(usernames, ['haha', 'kerker', 'kuku'])
+
+    def test_get_customer_list_with_bad_filters(self):
+        """ Filter on a field Customers do not have, or with a bad value """
+        for query_string in ('salary=10', 'id=one', 'active=maybe',
+                             'id__prefix=1', 'id__gt=1&id__gt=2'):
+            resp = self.app.get('/customers', query_string=query_string)
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST, query_string)
+
+    def test_reset_customers(self):
+        """ Remove all customers """
+        resp = self.app.delete('/customers/reset')
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_customers_count(), 0)
+
+    def test_reset_customers_by_recreating(self):
+        """ Remove all customers by recreating the database """
+        resp = self.app.delete('/customers/reset', query_string='mode=recreate')
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_customers_count(), 0)
+
+    def test_reset_customers_bad_mode(self):
+        """ Remove all customers with an unknown mode """
+        resp = self.app.delete('/customers/reset', query_string='mode=truncate')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch.object(profiler, 'token', 'secret')
+    def test_get_cache_stats(self):
+        """ Get the Customer cache counters with the admin token """
+        customer = self.get_customer('Ker')[0]
+        self.app.get('/customers/{}'.format(customer['_id']))
+        self.app.get('/customers/{}'.format(customer['_id']))
+        resp = self.app.get('/cache')
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        resp = self.app.get('/cache', headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = json.loads(resp.data)
+        for counter in ('hits', 'misses', 'evictions', 'size', 'maxsize'):
+            self.assertIn(counter, data)
+        self.assertGreater(data['hits'], 0)
+
+    def test_get_metrics(self):
+        """ Get the Prometheus metrics """
+        customer = self.get_customer('Ker')[0]
+        self.app.get('/customers/{}'.format(customer['_id']))
+        resp = self.app.get('/metrics')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn('text/plain', resp.headers['Content-Type'])
+        self.assertIn('customers_http_requests_total{method="GET",'
+                      'route="/customers/<customer_id>",status="200"}', resp.data)
+        self.assertIn('customers_operation_duration_seconds_count{operation="find"}', resp.data)
+        self.assertIn('customers_http_requests_in_flight', resp.data)
+
+    @patch.object(profiler, 'token', 'secret')
+    def test_get_resilience_stats(self):
+        """ Get the retry and circuit breaker counters with the admin token """
+        resp = self.app.get('/resilience')
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        resp = self.app.get('/resilience', headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = json.loads(resp.data)
+        for counter in ('state', 'retries', 'trips', 'rejections', 'deadlines_exceeded'):
+            self.assertIn(counter, data)
+
+    @patch.object(Customer, 'search_enabled', True)
+    def test_search_customers(self):
+        """ Search Customers by the start of their names, username or email """
+        Customer.build_search_index(wait=True)
+        resp = self.app.get('/customers/search', query_string='q=fid')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = json.loads(resp.data)
+        self.assertEqual([match['username'] for match in data], ['kerker'])
+        self.assertEqual(set(data[0]), set(['_id', 'first_name', 'last_name',
+                                            'username', 'email', 'score']))
+        resp = self.app.get('/customers/search', query_string='q=ker')
+        data = json.loads(resp.data)
+        self.assertEqual([match['username'] for match in data], ['Ker', 'kerker'])
+        resp = self.app.get('/customers/search', query_string='q=cat re&limit=5')
+        data = json.loads(resp.data)
+        self.assertEqual([match['first_name'] for match in data], ['redo'])
+
+    def test_search_disabled(self):
+        """ Answer 501 to searches while search is off """
+        resp = self.app.get('/customers/search', query_string='q=ker')
+        self.assertEqual(resp.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertIn('SEARCH_INDEX', json.loads(resp.data)['message'])
+
+    @patch.object(Customer, 'search_enabled', True)
+    def test_search_follows_writes(self):
+        """ Search finds new Customers and no longer finds deleted ones """
+        Customer.build_search_index(wait=True)
+        customer = self.get_customer('kerker')[0]
+        self.app.delete('/customers/{}'.format(customer['_id']))
+        new_customer = {"username": "kermit", "password": "bar",
+                        "first_name": "frog", "last_name": "green",
+                        "address": "pond", "phone_number": "773",
+                        "active": True, "email": "kermit@pond.org", "id": 77}
+        self.app.post('/customers', data=json.dumps(new_customer),
+                      content_type='application/json')
+        resp = self.app.get('/customers/search', query_string='q=ker')
+        data = json.loads(resp.data)
+        self.assertEqual(sorted(match['username'] for match in data), ['Ker', 'kermit'])
+
+    @patch.object(Customer, 'search_enabled', True)
+    def test_search_index_outlives_the_deadline(self):
+        """ Answer 503 while the search index is built, past the request deadline """
+        deadlines = []
+
+        def slow_docs():
+            for customer in Customer.all():
+                deadlines.append(resilience.remaining())
+                time.sleep(0.1)
+                yield customer._id, customer.serialize()
+
+        Customer.search_index.clear(built=False)
+        with patch.object(resilience, 'start_request',
+                          lambda: Resilience.start_request(resilience, 0.05)), \
+                patch.object(Customer, '_search_docs', staticmethod(slow_docs)):
+            resp = self.app.get('/customers/search', query_string='q=ker')
+            self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertIn('Retry-After', resp.headers)
+            self.assertTrue(Customer.search_index.wait(10))
+            resp = self.app.get('/customers/search', query_string='q=ker')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(len(json.loads(resp.data)), 2)
+        self.assertEqual(set(deadlines), set([None]))
+
+    def test_search_bad_requests(self):
+        """ Search without a query or with a bad limit """
+        for query in ('', 'q=', 'q=ker&limit=0', 'q=ker&limit=many', 'q=ker&limit=101'):
+            resp = self.app.get('/customers/search', query_string=query)
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_export_customers(self):
+        """ Export the Customers as NDJSON and as CSV """
+        resp = self.app.get('/customers/export')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        self.assertIn('attachment', resp.headers['Content-Disposition'])
+        docs = [json.loads(line) for line in resp.data.splitlines()]
+        self.assertEqual(sorted(doc['username'] for doc in docs),
+                         ['Ker', 'haha', 'kerker', 'kuku'])
+        resp = self.app.get('/customers/export', headers={'Accept': 'text/csv'})
+        self.assertEqual(resp.mimetype, 'text/csv')
+        self.assertEqual(len(resp.data.splitlines()), 5)
+        resp = self.app.get('/customers/export', query_string='format=xml')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_import_customers(self):
+        """ Import an export into an empty database """
+        export = self.app.get('/customers/export', query_string='format=csv').data
+        Customer.remove_all()
+        resp = self.app.post('/customers/import', data=export, content_type='text/csv')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = json.loads(resp.data)
+        self.assertEqual(data['created'], 4)
+        self.assertEqual(data['errors'], [])
+        self.assertEqual(self.get_customers_count(), 4)
+        resp = self.app.post('/customers/import', data=export, content_type='text/plain')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        resp = self.app.post('/customers/import', query_string='checkpoint=../x',
+                             data=export, content_type='text/csv')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    @patch('service.transfer.IMPORT_WORKERS', 1)
+    @patch('service.transfer.IMPORT_BATCH_SIZE', 2)
+    def test_resume_import(self):
+        """ Skip the rows a named import already wrote """
+        export = self.app.get('/customers/export').data
+        Customer.remove_all()
+        name = 'test-{}'.format(os.getpid())
+        save_many = Customer.save_many
+        calls = []
+
+        def failing(batch, chunk_size=None, update=True):
+            calls.append(len(batch))
+            if len(calls) == 2:
+                raise IOError('connection lost')
+            return save_many(batch, chunk_size, update)
+
+        try:
+            with patch('service.models.Customer.save_many', side_effect=failing):
+                resp = self.app.post('/customers/import', query_string='checkpoint=' + name,
+                                     data=export, content_type='application/x-ndjson')
+            self.assertEqual(resp.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            self.assertEqual(self.get_customers_count(), 2)
+            # the checkpoint only resumes the import of the same body
+            resp = self.app.post('/customers/import', query_string='checkpoint=' + name,
+                                 data=''.join(export.splitlines(True)[:2]),
+                                 content_type='application/x-ndjson')
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+            resp = self.app.post('/customers/import', query_string='checkpoint=' + name,
+                                 data=export, content_type='application/x-ndjson')
+            data = json.loads(resp.data)
+            self.assertEqual(data['created'], 4)
+            self.assertEqual(data['line'], 4)
+            self.assertFalse(os.path.exists(checkpoint_path(name)))
+        finally:
+            if os.path.exists(checkpoint_path(name)):
+                os.remove(checkpoint_path(name))
+        self.assertEqual(self.get_customers_count(), 4)
+
+    def test_swagger_docs(self):
+        """ The Swagger docs still describe the Customer responses """
+        resp = self.app.get('/swagger.json')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        spec = json.loads(resp.data)
+        self.assertIn('_id', spec['definitions']['Customer']['properties'])
+        item = spec['paths']['/customers/{customer_id}']
+        for method in ('get', 'put'):
+            self.assertEqual(item[method]['responses']['200']['schema'],
+                             {'$ref': '#/definitions/Customer'})
+
+    def test_documented_paths_are_served(self):
+        """ Each documented path is routed once, by the one Api """
+        rules = [rule.rule for rule in app.url_map.iter_rules()]
+        self.assertEqual(len(rules), len(set(rules)))
+        paths = json.loads(self.app.get('/swagger.json').data)['paths']
+        self.assertIn('/customers/{customer_id}/disable', paths)
+        for path in paths:
+            self.assertIn(path.replace('{customer_id}', '<customer_id>'), rules)
+        customer = self.get_customer('kerker')[0]
+        resp = self.app.get('/customers/{}'.format(customer['_id']))
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(self.app.get('/Customers/').status_code, HTTP_404_NOT_FOUND)
+
+    def test_boot(self):
+        """ Boot opens the database before any request is served """
+        boot('tests')
+        self.assertIsNotNone(Customer.backend)
+        self.assertEqual(self.app.get('/customers').status_code, HTTP_200_OK)
+
+    @patch.object(compressor, 'min_size', 0)
+    def test_compressed_list(self):
+        """ Get the list of Customers gzipped """
+        plain = self.app.get('/customers')
+        resp = self.app.get('/customers', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        body = zlib.decompress(resp.data, 16 + zlib.MAX_WBITS)
+        self.assertEqual(json.loads(body), json.loads(plain.data))
+
+    @patch('service.models.Customer.find')
+    def test_database_circuit_open(self, find_mock):
+        """ Fail fast with 503 while the circuit breaker is open """
+        find_mock.side_effect = CircuitOpenError(30)
+        resp = self.app.get('/customers/anything')
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp.headers['Retry-After'], '30')
+
     def test_call_create_with_an_id(self):
         """ Call create passing an id """
         new_customer = {"username": "kerker", "password": "bar",
@@ -0,0 +1,202 @@
+"""
+Test cases for the export and import of Customers
+
+Test cases can be run with:
+  nosetests
+  coverage report -m
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from mock import patch
+from service import app
+from service.models import Customer
+from service.transfer import (Importer, CheckpointError, export_ndjson, export_csv,
+                              read_ndjson, read_csv, checkpoint_path, fingerprint)
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+
+
+def customers(count):
+    """ Returns count new Customers """
+    return [Customer(u'First{}'.format(number), u'Last', u'{} Main St'.format(number),
+                     u'c{}@example.com'.format(number), u'user{}'.format(number),
+                     u'secret', u'555', number % 2 == 0, number)
+            for number in range(count)]
+
+
+class TestTransfer(unittest.TestCase):
+    """ Test Cases for exporting and importing Customers """
+
+    def setUp(self):
+        Customer.init_db('test')
+        Customer.remove_all()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        Customer.remove_all()
+        shutil.rmtree(self.directory)
+
+    def export(self, exporter):
+        """ Returns the export of the stored Customers as a list of lines """
+        return ''.join(exporter(Customer.all())).splitlines(True)
+
+    def test_export_ndjson(self):
+        """ Export the Customers as NDJSON with their _id and no _rev """
+        Customer.save_many(customers(3))
+        lines = self.export(export_ndjson)
+        self.assertEqual(len(lines), 3)
+        doc = json.loads(lines[0])
+        self.assertIn('_id', doc)
+        self.assertNotIn('_rev', doc)
+        self.assertEqual(set(doc['id'] for doc in map(json.loads, lines)), set([0, 1, 2]))
+
+    def test_export_csv(self):
+        """ Export the Customers as CSV with a header """
+        Customer.save_many(customers(2))
+        lines = self.export(export_csv)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('_id,first_name,last_name'))
+        self.assertEqual(self.export(export_csv)[:1], lines[:1])
+
+    def test_read_ndjson(self):
+        """ Parse NDJSON lines, reporting the bad ones """
+        records = list(read_ndjson(['{"a": 1}\n', '\n', 'nope\n', '[1]\n']))
+        self.assertEqual(records[0], (1, {'a': 1}, None))
+        self.assertEqual([(line, error is None) for line, _, error in records],
+                         [(1, True), (3, False), (4, False)])
+
+    def test_read_csv(self):
+        """ Parse CSV lines, converting the Integer and Boolean fields """
+        records = list(read_csv(['_id,first_name,active,id\r\n', ',Ann,True,7\r\n',
+                                 'x1,Bob,maybe,8\r\n', ',,,\r\n']))
+        self.assertEqual(records[0], (2, {'first_name': 'Ann', 'active': True, 'id': 7}, None))
+        self.assertEqual(records[1][0], 3)
+        self.assertIn('active must be true or false', records[1][2])
+        self.assertEqual(len(records), 2)
+        self.assertEqual(list(read_csv([])), [])
+
+    def test_round_trip(self):
+        """ Import an export into an empty database, keeping the ids """
+        Customer.save_many(customers(25))
+        before = dict((c._id, c.serialize()) for c in Customer.all())
+        for exporter, reader in ((export_ndjson, read_ndjson), (export_csv, read_csv)):
+            lines = self.export(exporter)
+            Customer.remove_all()
+            progress = Importer(batch_size=4, workers=3).run(reader(lines))
+            self.assertEqual(progress['created'], 25)
+            self.assertTrue(progress['done'])
+            after = dict((c._id, c.serialize()) for c in Customer.all())
+            self.assertEqual(sorted(after), sorted(before))
+            for doc_id, doc in after.items():
+                doc.pop('_rev')
+                before[doc_id].pop('_rev', None)
+                self.assertEqual(doc, before[doc_id])
+
+    def test_import_invalid_rows(self):
+        """ Import the valid rows and report the invalid ones """
+        lines = ['{"first_name": "Ann"}\n', 'nope\n'] + \
+            [json.dumps(customer.serialize()) + '\n' for customer in customers(3)]
+        progress = Importer(batch_size=2).run(read_ndjson(lines))
+        self.assertEqual(progress['created'], 3)
+        self.assertEqual(progress['invalid'], 2)
+        self.assertEqual([error['line'] for error in progress['errors']], [1, 2])
+        self.assertIn('missing', progress['errors'][0]['reason'])
+
+    def test_import_again(self):
+        """ Import the same export twice without duplicating Customers """
+        Customer.save_many(customers(5))
+        lines = self.export(export_ndjson)
+        progress = Importer().run(read_ndjson(lines))
+        self.assertEqual(progress['created'] + progress['conflicts'], 5)
+        self.assertEqual(len(list(Customer.all())), 5)
+
+    def test_resume(self):
+        """ Resume an interrupted import from its checkpoint """
+        lines = [json.dumps(customer.serialize()) + '\n' for customer in customers(10)]
+        checkpoint = os.path.join(self.directory, 'import.json')
+        source = fingerprint(lines)[0]
+        save_many = Customer.save_many
+        calls = []
+
+        def failing(batch, chunk_size=None, update=True):
+            calls.append(len(batch))
+            if len(calls) == 3:
+                raise IOError('connection lost')
+            return save_many(batch, chunk_size, update)
+
+        with patch('service.models.Customer.save_many', side_effect=failing):
+            self.assertRaises(IOError, Importer(checkpoint, batch_size=3, workers=1).run,
+                              read_ndjson(lines), source)
+        with open(checkpoint) as saved:
+            self.assertEqual(json.load(saved)['line'], 6)
+        progress = Importer(checkpoint, batch_size=3, workers=1).run(read_ndjson(lines), source)
+        self.assertEqual(progress['created'], 10)
+        self.assertEqual(len(list(Customer.all())), 10)
+        # the checkpoint of a finished import is removed, not resumed
+        self.assertFalse(os.path.exists(checkpoint))
+        progress = Importer(checkpoint).run(read_ndjson(lines), source)
+        self.assertEqual((progress['created'], progress['conflicts']), (0, 10))
+
+    def test_resume_rows_without_id(self):
+        """ Replay the rows without an _id of an interrupted import without duplicates """
+        docs = [customer.serialize() for customer in customers(10)]
+        lines = [json.dumps(dict((k, v) for k, v in doc.items() if k != '_id')) + '\n'
+                 for doc in docs]
+        checkpoint = os.path.join(self.directory, 'import.json')
+        save = Importer.save
+        saves = []
+
+        def failing(importer, progress):
+            saves.append(progress['line'])
+            if len(saves) == 2:
+                raise IOError('disk full')
+            return save(importer, progress)
+
+        source, todo = fingerprint(lines)
+        with patch.object(Importer, 'save', failing):
+            self.assertRaises(IOError, Importer(checkpoint, batch_size=3, workers=1).run,
+                              read_ndjson(todo), source)
+        # the second batch was written but not checkpointed
+        self.assertEqual(len(list(Customer.all())), 6)
+        source, todo = fingerprint(lines)
+        progress = Importer(checkpoint, batch_size=3, workers=1).run(read_ndjson(todo), source)
+        self.assertEqual((progress['created'], progress['conflicts']), (7, 3))
+        self.assertEqual(len(list(Customer.all())), 10)
+
+    def test_checkpoint_of_another_source(self):
+        """ Refuse to resume a checkpoint with the rows of another source """
+        lines = [json.dumps(customer.serialize()) + '\n' for customer in customers(4)]
+        checkpoint = os.path.join(self.directory, 'import.json')
+        Importer(checkpoint).save(dict(Importer().load('one'), line=2))
+        source, todo = fingerprint(lines, 100)
+        self.assertNotEqual(source, fingerprint(lines[1:], 100)[0])
+        self.assertNotEqual(source, fingerprint(lines, 101)[0])
+        self.assertEqual(list(todo), lines)
+        self.assertRaises(CheckpointError, Importer(checkpoint).run, read_ndjson(lines), source)
+        self.assertEqual(len(list(Customer.all())), 0)
+
+    def test_checkpoint_path(self):
+        """ Only accept plain checkpoint names """
+        self.assertTrue(checkpoint_path('daily-2018_01').endswith('daily-2018_01.json'))
+        self.assertRaises(ValueError, checkpoint_path, '../etc/passwd')
+        self.assertRaises(ValueError, checkpoint_path, '')
+
+    def test_commands(self):
+        """ Export and import with the flask commands """
+        runner = app.test_cli_runner()
+        path = os.path.join(self.directory, 'customers.csv')
+        Customer.save_many(customers(4))
+        result = runner.invoke(args=['export-customers', path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        Customer.remove_all()
+        result = runner.invoke(args=['import-customers', path, '--batch-size', '3'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(json.loads(result.output)['created'], 4)
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+        self.assertEqual(len(list(Customer.all())), 4)